@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Compares two result files written by `benchmarks/keywords.py`.
+
+    python benchmarks/compare.py before.json after.json --threshold 1.25
+
+Prints the change in best time and peak memory of every benchmark present
+in both files, and exits with status 1 when any of them got slower (or used
+more memory) by more than `--threshold` times.
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as results:
+        data = json.load(results)
+    return dict(((result['benchmark'], result['rows']), result) for result in data['results'])
+
+
+def ratio(new, old):
+    return new / old if old else float('inf') if new else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="ratio above which a change is a regression (default: %(default)s)")
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help="ignore time changes of benchmarks faster than this (default: %(default)s)")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    regressions = 0
+    print("{0:<34} {1:>10}  {2:>10}  {3:>10}  {4:>7}  {5:>7}".format(
+        'benchmark', 'rows', 'before', 'after', 'time', 'memory'))
+    for key in sorted(set(before) & set(after), key=lambda key: (key[1], key[0])):
+        old, new = before[key], after[key]
+        time_ratio = ratio(new['best_seconds'], old['best_seconds'])
+        memory_ratio = ratio(new['peak_bytes'], old['peak_bytes'])
+        slower = time_ratio > args.threshold and new['best_seconds'] >= args.min_seconds
+        bigger = memory_ratio > args.threshold
+        flag = '  <-- regression' if slower or bigger else ''
+        regressions += bool(flag)
+        print("{0:<34} {1:>10}  {2:>9.4f}s  {3:>9.4f}s  {4:>6.2f}x  {5:>6.2f}x{6}".format(
+            key[0], key[1], old['best_seconds'], new['best_seconds'], time_ratio, memory_ratio, flag))
+    if regressions:
+        print("{0} regression(s) above {1}x".format(regressions, args.threshold))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
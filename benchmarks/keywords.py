@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+Benchmarks the hot SQLAlchemyLibrary keywords against generated SQLite tables.
+
+For every table size, a fresh SQLite file database is filled with that many
+rows and each keyword is timed `--repeat` times. The best and mean wall time
+and the peak Python memory allocated during the call (from tracemalloc) are
+written as JSON, which `benchmarks/compare.py` compares between commits:
+
+    python benchmarks/keywords.py --sizes 1000,100000 --output before.json
+    git checkout my-branch
+    python benchmarks/keywords.py --sizes 1000,100000 --output after.json
+    python benchmarks/compare.py before.json after.json
+
+Sizes up to 10**7 work but take a while (and about 1 GB of disk) to generate.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import sqlalchemy
+
+from SQLAlchemyLibrary import SQLAlchemyLibrary
+
+FILL_CHUNK = 50000
+SCRIPT_STATEMENTS = 10000
+
+
+def fill_table(url, rows):
+    engine = sqlalchemy.create_engine(url)
+    with engine.begin() as connection:
+        connection.execute("CREATE TABLE bench (id INTEGER PRIMARY KEY, grp INTEGER, "
+                           "name VARCHAR(40), value REAL)")
+        connection.execute("CREATE TABLE scratch (id INTEGER PRIMARY KEY, name VARCHAR(40))")
+        insert = "INSERT INTO bench VALUES (?, ?, ?, ?)"
+        for start in range(0, rows, FILL_CHUNK):
+            chunk = [(i, i % 100, 'name {0}'.format(i), i * 0.5)
+                     for i in range(start, min(start + FILL_CHUNK, rows))]
+            connection.connection.executemany(insert, chunk)
+    engine.dispose()
+
+
+def write_script(path, rows):
+    with open(path, 'w') as script:
+        for i in range(min(rows, SCRIPT_STATEMENTS)):
+            script.write("INSERT INTO scratch VALUES ({0}, 'it''s; row {0}');\n".format(i))
+
+
+def refill_scratch(library, rows):
+    library.execute_sql_string("DELETE FROM scratch")
+    library.insert_rows('scratch', ([i, 'row {0}'.format(i)] for i in range(rows)),
+                        columns=['id', 'name'], chunk_size=FILL_CHUNK)
+
+
+def benchmarks(script_path, rows):
+    """
+    Returns (name, setup, call) triples; setup runs untimed before each call.
+    """
+    none = lambda library: None
+    clear_scratch = lambda library: library.execute_sql_string("DELETE FROM scratch")
+    return [
+        ('Query', none, lambda library: library.query("SELECT id, name FROM bench")),
+        ('Row Count', none, lambda library: library.row_count("SELECT id FROM bench")),
+        ('Check If Exists In Database', none,
+         lambda library: library.check_if_exists_in_database("SELECT id FROM bench WHERE grp = 1")),
+        ('Check If Not Exists In Database', none,
+         lambda library: library.check_if_not_exists_in_database("SELECT id FROM bench WHERE grp = -1")),
+        ('Row Count Is Greater Than X', none,
+         lambda library: library.row_count_is_greater_than_x("SELECT id FROM bench", '0')),
+        ('Query For Single Column', none,
+         lambda library: library.query_for_single_column("SELECT name FROM bench")),
+        ('Execute Sql Script', clear_scratch,
+         lambda library: library.execute_sql_script(script_path)),
+        ('Delete All Rows From Table', lambda library: refill_scratch(library, rows),
+         lambda library: library.delete_all_rows_from_table('scratch')),
+    ]
+
+
+def measure(library, setup, call, repeat):
+    durations = []
+    peak = 0
+    for _ in range(repeat):
+        setup(library)
+        tracemalloc.start()
+        started = time.perf_counter()
+        call(library)
+        durations.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(durations), sum(durations) / len(durations), peak
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLAlchemyLibrary keywords on SQLite.")
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help="comma-separated table sizes (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', help="run only the benchmarks whose name contains this text")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix='sqlalchemylibrary-bench-')
+    try:
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            url = 'sqlite:///' + os.path.join(workdir, 'bench_{0}.db'.format(rows))
+            script_path = os.path.join(workdir, 'script_{0}.sql'.format(rows))
+            fill_table(url, rows)
+            write_script(script_path, rows)
+            library = SQLAlchemyLibrary()
+            library.connect_to_database(url)
+            for name, setup, call in benchmarks(script_path, rows):
+                if args.only and args.only.lower() not in name.lower():
+                    continue
+                best, mean, peak = measure(library, setup, call, args.repeat)
+                results.append({'benchmark': name, 'rows': rows, 'best_seconds': round(best, 6),
+                                'mean_seconds': round(mean, 6), 'peak_bytes': peak})
+                print("{0:<34} {1:>10} rows  best {2:9.4f}s  mean {3:9.4f}s  peak {4:9.1f} KiB".format(
+                    name, rows, best, mean, peak / 1024.0))
+            library.disconnect_from_all_databases()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'meta': {
+                    'commit': git_commit(),
+                    'date': datetime.datetime.now().isoformat(),
+                    'python': platform.python_version(),
+                    'sqlalchemy': sqlalchemy.__version__,
+                    'repeat': args.repeat,
+                },
+                'results': results,
+            }, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Throughput benchmark for SQLAlchemyLibrary.sql_tokenizer.
+
+Feeds a generated dump-like script (INSERTs with quoted semicolons, comments
+and a dollar-quoted function body) through the tokenizer in file-sized chunks
+and reports MB/s and statements/s.
+
+    python benchmarks/sql_tokenizer.py --megabytes 50
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from SQLAlchemyLibrary.sql_tokenizer import CHUNK_SIZE, split_sql_statements
+
+STATEMENTS = [
+    "-- person {0}\n",
+    "INSERT INTO person VALUES({0}, 'First;{0}', 'It''s /* not */ a comment');\n",
+    "INSERT INTO person_note VALUES({0}, 'multi\nline; note', \"quoted\");\n",
+    "/* block comment ; {0} */ UPDATE person SET last_name = 'x' WHERE id = {0};\n",
+    "CREATE FUNCTION f{0}() RETURNS int AS $$ BEGIN RETURN {0}; END $$ LANGUAGE plpgsql;\n",
+]
+
+
+def generate_script(megabytes):
+    block = ''.join(STATEMENTS)
+    size = 0
+    i = 0
+    target = megabytes * 1024 * 1024
+    while size < target:
+        text = block.format(i)
+        size += len(text)
+        i += 1
+        yield text
+
+
+def chunked(texts, chunk_size):
+    buffered = []
+    size = 0
+    for text in texts:
+        buffered.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            joined = ''.join(buffered)
+            yield joined
+            buffered = []
+            size = 0
+    if buffered:
+        yield ''.join(buffered)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megabytes', type=int, default=20)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    chunks = list(chunked(generate_script(args.megabytes), args.chunk_size))
+    size = sum(len(chunk) for chunk in chunks)
+    started = time.time()
+    statements = sum(1 for _ in split_sql_statements(chunks))
+    elapsed = time.time() - started
+    print("{0:.1f} MB, {1} statements in {2:.2f}s: {3:.1f} MB/s, {4:.0f} statements/s".format(
+        size / 1048576.0, statements, elapsed, size / 1048576.0 / elapsed, statements / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -44,6 +44,11 @@ def main():
           package_data = {'SQLAlchemyLibrary': ['VERSION']},
           requires     = ['sqlalchemy'],
           install_requires = ['robotframework', 'sqlalchemy'],
+          extras_require = {
+              'numpy': ['numpy'],
+              'arrow': ['pyarrow'],
+              'dataframe': ['pandas'],
+          },
           )
 
 if __name__ == "__main__":
@@ -14,14 +14,20 @@
 
 import os
 
+from robot.utils import is_truthy
+
 from SQLAlchemyLibrary.connection_manager import ConnectionManager
 from SQLAlchemyLibrary.query import Query
 from SQLAlchemyLibrary.assertion import Assertion
+from SQLAlchemyLibrary.file_transfer import FileTransfer
+from SQLAlchemyLibrary.listener import LibraryListener
+from SQLAlchemyLibrary.rendering import ResultRenderer
+from SQLAlchemyLibrary.snapshot import Snapshot
 
 __version_file_path__ = os.path.join(os.path.dirname(__file__), 'VERSION')
 __version__ = open(__version_file_path__, 'r').read().strip()
 
-class SQLAlchemyLibrary(ConnectionManager, Query, Assertion):
+class SQLAlchemyLibrary(ConnectionManager, Query, Assertion, FileTransfer, Snapshot):
     """
     SQLAlchemy Library allows you to interact with your database in Robot Framework tests.
 
@@ -44,6 +50,12 @@ class SQLAlchemyLibrary(ConnectionManager, Query, Assertion):
 
     == Notes: ==
 
+    === Multiple connections: ===
+
+    `Connect To Database` accepts an `alias`, so several databases can be open
+    at the same time. Query and assertion keywords run on the current connection
+    (see `Switch Database`) unless they are given `alias=<name>`, which means
+    `alias` cannot be used as the name of a bind parameter.
 
 
     === Example Usage: ===
@@ -67,3 +79,41 @@ class SQLAlchemyLibrary(ConnectionManager, Query, Assertion):
     """
 
     ROBOT_LIBRARY_SCOPE = 'GLOBAL'
+
+    def __init__(self, statement_cache_size=500, slow_query_threshold=None, statement_timing_report=None,
+                 max_rendered_rows=20, max_rendered_columns=20, max_rendered_value_length=100,
+                 test_isolation=False):
+        """
+        `statement_cache_size` is the number of parsed SQL statements kept
+        for reuse (see `Clear Statement Cache`). Use 0 to disable the cache.
+
+        | Library | SQLAlchemyLibrary | statement_cache_size=2000 |
+
+        Giving `slow_query_threshold` or `statement_timing_report` starts
+        timing statements right away (see `Start Statement Timing`); the
+        report is written when the run ends.
+
+        | Library | SQLAlchemyLibrary | slow_query_threshold=1 s | statement_timing_report=${OUTPUT DIR}/sql-timing.json |
+
+        Query results shown in the log and in failure messages are cut to
+        `max_rendered_rows` rows, `max_rendered_columns` columns and
+        `max_rendered_value_length` characters per value, and say how much
+        was left out (for example "showing 20 of 512,311 rows"). Results
+        logged at DEBUG level are only rendered when that level is logged.
+
+        | Library | SQLAlchemyLibrary | max_rendered_rows=5 | max_rendered_value_length=40 |
+
+        With `test_isolation`, every test runs in a transaction that is
+        rolled back when it ends (see `Enable Test Isolation`).
+
+        | Library | SQLAlchemyLibrary | test_isolation=True |
+        """
+        ConnectionManager.__init__(self)
+        Query.__init__(self, statement_cache_size=statement_cache_size,
+                       renderer=ResultRenderer(max_rendered_rows, max_rendered_columns, max_rendered_value_length))
+        Snapshot.__init__(self)
+        self.ROBOT_LIBRARY_LISTENER = LibraryListener(self)
+        if slow_query_threshold or statement_timing_report:
+            self.start_statement_timing(slow_query_threshold, statement_timing_report)
+        if is_truthy(test_isolation):
+            self.enable_test_isolation()
@@ -12,15 +12,33 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-from robot.libraries.BuiltIn import BuiltIn
-import sqlalchemy
+import select
+import time
+
+from robot.api import logger
+from robot.utils import is_truthy, secs_to_timestr, timestr_to_secs
+
+from SQLAlchemyLibrary.dataset_compare import (DatasetDiff, aligned_rows, compare_hashed, compare_sorted,
+                                               normalize_value, read_csv, read_json)
+from SQLAlchemyLibrary.lazy_import import LazyModule
+from SQLAlchemyLibrary.query import _WRAPPABLE_STATEMENT
+from SQLAlchemyLibrary.query_plan import format_plan, plan_cost, plan_nodes
+from SQLAlchemyLibrary.schema_cache import find_name
+from SQLAlchemyLibrary.table_diff import TableSide, diff_tables
+
+robot_builtin = LazyModule('robot.libraries.BuiltIn')
+
+COMPARE_CHUNK_SIZE = 1000
+
+WAIT_CONDITIONS = ('exists', 'not exists', 'count', 'value')
+
 
 class Assertion(object):
     """
     Assertion handles all the assertions of Database Library.
     """
 
-    def check_if_exists_in_database(self,selectStatement, **named_args):
+    def check_if_exists_in_database(self, selectStatement, alias=None, **named_args):
         """
         Check if any row would be returned by given the input
         `selectStatement`. If there are no results, then this will
@@ -38,11 +56,11 @@ class Assertion(object):
         | Check If Exists In Database | SELECT id FROM person WHERE first_name = 'Franz Allan' | # PASS |
         | Check If Exists In Database | SELECT id FROM person WHERE first_name = 'John' | # FAIL |
         """
-        if not self.query(selectStatement, **named_args):
+        if not self._count_rows(selectStatement, limit=1, alias=alias, **named_args):
             raise AssertionError("Expected to have have at least one row from '{0}' "
                                  "but got 0 rows.".format(selectStatement))
 
-    def check_if_not_exists_in_database(self,selectStatement, **named_args):
+    def check_if_not_exists_in_database(self, selectStatement, alias=None, **named_args):
         """
         This is the negation of `check_if_exists_in_database`.
 
@@ -61,13 +79,22 @@ class Assertion(object):
         Then you will get the following:
         | Check If Not Exists In Database | SELECT id FROM person WHERE first_name = 'John' | # PASS |
         | Check If Not Exists In Database | SELECT id FROM person WHERE first_name = 'Franz Allan' | # FAIL |
+
+        The failure message shows at most `max_rendered_rows` of the rows
+        found (see `importing`) and how many there are in total.
         """
-        queryResults = self.query(selectStatement, **named_args)
-        if queryResults:
+        if self._count_rows(selectStatement, limit=1, alias=alias, **named_args):
+            renderer = self._renderer
+            queryResults = self._sample_rows(selectStatement, renderer.max_rows + 1, alias=alias, **named_args)
+            more = ""
+            if len(queryResults) > renderer.max_rows:
+                total = self._count_rows(selectStatement, alias=alias, **named_args)
+                more = renderer.showing(renderer.max_rows, total)
             raise AssertionError("Expected to have have no rows from '{0}' "
-                                 "but got some rows : {1}.".format(selectStatement, queryResults))
+                                 "but got some rows{2} : {1}.".format(
+                                     selectStatement, renderer.render(queryResults[:renderer.max_rows]), more))
 
-    def row_count_is_0(self,selectStatement, **named_args):
+    def row_count_is_0(self, selectStatement, alias=None, **named_args):
         """
         Check if any rows are returned from the submitted `selectStatement`.
         If there are, then this will throw an AssertionError.
@@ -84,12 +111,12 @@ class Assertion(object):
         | Row Count is 0 | SELECT id FROM person WHERE first_name = 'Franz Allan' | # FAIL |
         | Row Count is 0 | SELECT id FROM person WHERE first_name = 'John' | # PASS |
         """
-        num_rows = self.row_count(selectStatement, **named_args)
-        if (num_rows > 0):
+        if self._count_rows(selectStatement, limit=1, alias=alias, **named_args) > 0:
+            num_rows = self.row_count(selectStatement, alias=alias, **named_args)
             raise AssertionError("Expected zero rows to be returned from '{0}' "
                                  "but got rows back. Number of rows returned was {1}".format(selectStatement, num_rows))
 
-    def row_count_is_equal_to_x(self,selectStatement,numRows, **named_args):
+    def row_count_is_equal_to_x(self, selectStatement, numRows, alias=None, **named_args):
         """
         Check if the number of rows returned from `selectStatement` is equal to
         the value submitted. If not, then this will throw an AssertionError.
@@ -107,12 +134,13 @@ class Assertion(object):
         | Row Count Is Equal To X | SELECT id FROM person | 1 | # FAIL |
         | Row Count Is Equal To X | SELECT id FROM person WHERE first_name = 'John' | 0 | # PASS |
         """
-        num_rows = self.row_count(selectStatement, **named_args)
-        if (num_rows != int(numRows.encode('ascii'))):
+        expected_rows = int(numRows.encode('ascii'))
+        if self._count_rows(selectStatement, limit=expected_rows + 1, alias=alias, **named_args) != expected_rows:
+            num_rows = self.row_count(selectStatement, alias=alias, **named_args)
             raise AssertionError("Expected same number of rows to be returned from '{0}' "
                                  "than the returned rows of {1}".format(selectStatement, num_rows))
 
-    def row_count_is_greater_than_x(self,selectStatement,numRows, **named_args):
+    def row_count_is_greater_than_x(self, selectStatement, numRows, alias=None, **named_args):
         """
         Check if the number of rows returned from `selectStatement` is greater
         than the value submitted. If not, then this will throw an AssertionError.
@@ -130,12 +158,13 @@ class Assertion(object):
         | Row Count Is Greater Than X | SELECT id FROM person | 1 | # PASS |
         | Row Count Is Greater Than X | SELECT id FROM person WHERE first_name = 'John' | 0 | # FAIL |
         """
-        num_rows = self.row_count(selectStatement, **named_args)
-        if (num_rows <= int(numRows.encode('ascii'))):
+        expected_rows = int(numRows.encode('ascii'))
+        num_rows = self._count_rows(selectStatement, limit=expected_rows + 1, alias=alias, **named_args)
+        if (num_rows <= expected_rows):
             raise AssertionError("Expected more rows to be returned from '{0}' "
                                  "than the returned rows of {1}".format(selectStatement, num_rows))
 
-    def row_count_is_less_than_x(self,selectStatement,numRows):
+    def row_count_is_less_than_x(self, selectStatement, numRows, alias=None):
         """Check if the number of rows returned from `selectStatement` is less
         than the value submitted. If not, then this will throw an AssertionError.
 
@@ -152,17 +181,374 @@ class Assertion(object):
         | Row Count Is Less Than X | SELECT id FROM person | 3 | # PASS |
         | Row Count Is Less Than X | SELECT id FROM person WHERE first_name = 'John' | 1 | # FAIL |
         """
-        num_rows = self.row_count(selectStatement)
-        if (num_rows >= int(numRows.encode('ascii'))):
+        expected_rows = int(numRows.encode('ascii'))
+        if self._count_rows(selectStatement, limit=expected_rows, alias=alias) >= expected_rows:
+            num_rows = self.row_count(selectStatement, alias=alias)
             raise AssertionError("Expected less rows to be returned from '{0}' "
                                  "than the returned rows of {1}".format(selectStatement, num_rows))
 
-    def table_must_exist(self, table_name, schema_name=None):
+    def wait_until_query_returns(self, selectStatement, condition='exists', expected=None,
+                                 timeout='30 s', interval='0.5 s', max_interval='5 s',
+                                 channel=None, alias=None, **named_args):
+        """
+        Runs `selectStatement` repeatedly until its result meets `condition`,
+        and fails if that does not happen within `timeout`.
+
+        The `condition` can be:
+        | exists     | the query returns at least one row (the default) |
+        | not exists | the query returns no rows |
+        | count      | the query returns at least `expected` rows |
+        | value      | the first column of the first row equals `expected` |
+
+        Each attempt only fetches what the condition needs (a count over a
+        limited subquery, or a single row) in a short transaction of its own,
+        so new data committed by other sessions is seen. The wait between
+        attempts starts at `interval` and doubles up to `max_interval`.
+
+        On PostgreSQL, a `channel` can be given: the keyword then runs
+        `LISTEN channel` and re-runs the query as soon as a `NOTIFY` arrives
+        on it, instead of sleeping out the whole interval. It listens on a
+        connection of its own outside of any transaction, as notifications
+        are only delivered between transactions (and the connection of the
+        alias may be in one, such as the one of test isolation).
+
+        Returns the last count (`count`, `exists`, `not exists`)
+        or value (`value`) seen.
+
+        NOTE: `condition`, `expected`, `timeout`, `interval`, `max_interval`,
+        `channel` and `alias` are reserved and cannot be used as bind parameters.
+
+        Examples:
+        | Wait Until Query Returns | SELECT id FROM job WHERE id = :id AND state = 'done' | id=${job_id} | timeout=2 min |
+        | Wait Until Query Returns | SELECT id FROM outbox | not exists |
+        | Wait Until Query Returns | SELECT id FROM event WHERE batch = :batch | count | ${100} | batch=${batch} |
+        | ${state}= | Wait Until Query Returns | SELECT state FROM job WHERE id = :id | value | done | id=${job_id} | channel=job_events |
+        """
+        condition = condition.lower().replace('_', ' ')
+        if condition not in WAIT_CONDITIONS:
+            raise ValueError("Unknown condition '{0}', expected one of: {1}".format(
+                condition, ", ".join(WAIT_CONDITIONS)))
+        if condition in ('count', 'value') and expected is None:
+            raise ValueError("The '{0}' condition needs an expected value".format(condition))
+        timeout = timestr_to_secs(timeout)
+        interval = timestr_to_secs(interval)
+        max_interval = max(timestr_to_secs(max_interval), interval)
+        listener = self._listen(channel, alias) if channel else None
+        try:
+            deadline = time.time() + timeout
+            attempts = 0
+            while True:
+                attempts += 1
+                done, observed = self._check_wait_condition(
+                        selectStatement, condition, expected, alias, named_args)
+                if done:
+                    logger.info("Condition '{0}' met after {1} attempt(s)".format(condition, attempts))
+                    return observed
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise AssertionError("Query '{0}' did not meet the condition '{1}'{2} within {3} "
+                                         "({4} attempts); last result was {5}".format(
+                                             selectStatement, condition,
+                                             "" if expected is None else " {0!r}".format(expected),
+                                             secs_to_timestr(timeout), attempts,
+                                             self._renderer.render_value(observed)))
+                self._wait_for_change(listener, min(interval, remaining))
+                interval = min(interval * 2, max_interval)
+        finally:
+            if listener is not None:
+                self._unlisten(listener, channel)
+
+    def _check_wait_condition(self, selectStatement, condition, expected, alias, named_args):
+        if condition == 'value':
+            rows = self._sample_rows(selectStatement, 1, alias=alias, **named_args)
+            if not rows:
+                return False, None
+            value = rows[0][0]
+            return value == expected or u'{0}'.format(value) == u'{0}'.format(expected), value
+        if condition == 'count':
+            expected = int(expected)
+            count = self._count_rows(selectStatement, limit=expected, alias=alias, **named_args)
+            return count >= expected, count
+        count = self._count_rows(selectStatement, limit=1, alias=alias, **named_args)
+        return (count > 0) == (condition == 'exists'), count
+
+    def _listen(self, channel, alias):
+        connection = self._get_connection(alias)
+        dbapi_connection = connection.connection.connection
+        if connection.dialect.name != 'postgresql' or not hasattr(dbapi_connection, 'notifies'):
+            logger.warn("LISTEN/NOTIFY is not supported by {0}, polling instead".format(
+                connection.dialect.name))
+            return None
+        listener = connection.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        try:
+            listener.execute('LISTEN "{0}"'.format(channel))
+        except:
+            listener.close()
+            raise
+        return listener
+
+    def _wait_for_change(self, listener, seconds):
+        if listener is None:
+            time.sleep(seconds)
+            return
+        dbapi_connection = listener.connection.connection
+        if select.select([dbapi_connection], [], [], seconds)[0]:
+            dbapi_connection.poll()
+            del dbapi_connection.notifies[:]
+
+    def _unlisten(self, listener, channel):
+        try:
+            listener.execute('UNLISTEN "{0}"'.format(channel))
+        finally:
+            listener.close()
+
+    def query_result_should_match(self, selectStatement, expected, key=None, presorted=False,
+                                  expected_alias=None, alias=None, **named_args):
+        """
+        Check that the rows returned by `selectStatement` are the rows of
+        `expected`, which is either a second SELECT statement or the path
+        of a CSV file (with a header row), a JSON Lines file or a JSON
+        file holding an array. File rows can be arrays, matched to the
+        query's columns by position, or objects (and CSV rows under a
+        header) matched by column name.
+
+        Both sides are streamed, never loaded as a whole:
+        - With `presorted=True`, both sides must already be sorted on `key`
+          (for example with an ORDER BY) and are compared in a single pass.
+          Numbers are expected in numeric order and text in code point order.
+        - Otherwise the expected rows are indexed in memory when there are
+          up to 100,000 of them, and hash-partitioned into temporary files
+          on disk when there are more, so that any number of rows can be
+          compared in bounded memory.
+
+        `key` names the columns (comma-separated) that identify a row.
+        With a key, rows with the same key but other values are reported
+        as changed; without one, whole rows are compared and differences
+        are reported as missing or extra rows. Duplicates count.
+
+        Values are compared as text, so `1` from the database matches `1`
+        in a CSV file; NULL matches an empty value.
+
+        The expected query runs on the database of `expected_alias` (by
+        default the same database as the query) with the same bind
+        parameters. The failure message
+        shows how many rows are missing, extra and changed, with at most
+        `max_rendered_rows` examples of each (see `importing`).
+
+        NOTE: `expected`, `key`, `presorted`, `expected_alias` and `alias`
+        are reserved and cannot be used as bind parameters.
+
+        Examples:
+        | Query Result Should Match | SELECT id, name FROM person | ${CURDIR}/expected_people.csv | key=id |
+        | Query Result Should Match | SELECT * FROM orders ORDER BY id | SELECT * FROM orders ORDER BY id | key=id | presorted=True | expected_alias=source |
+        """
+        key_names = [name.strip() for name in key.split(',')] if key else []
+        presorted = is_truthy(presorted)
+        actual_columns = []
+        actual = self._iterate_rows(self._get_connection(alias), selectStatement,
+                                    COMPARE_CHUNK_SIZE, named_args, actual_columns)
+        actual = _peeked(actual)
+        expected_connection = None
+        if _WRAPPABLE_STATEMENT.match(expected):
+            source = "the query '{0}'".format(expected)
+            expected_columns = []
+            expected_connection = self._get_connection(expected_alias or alias)
+            # The two results are read side by side: use a connection of its own, or, when the data is
+            # visible only in the transaction of test isolation, no transaction of its own.
+            own_connection = not expected_connection.in_transaction()
+            if own_connection:
+                expected_connection = expected_connection.engine.connect()
+            expected_query = self._iterate_rows(expected_connection, expected, COMPARE_CHUNK_SIZE, named_args,
+                                                expected_columns, own_transaction=own_connection)
+            expected_rows = _peeked(expected_query)
+        elif expected.lower().endswith('.csv'):
+            source = expected
+            expected_columns, expected_rows = read_csv(expected)
+        elif expected.lower().endswith(('.json', '.jsonl', '.ndjson')):
+            source = expected
+            expected_columns, expected_rows = read_json(expected)
+        else:
+            raise ValueError("Expected a SELECT statement or a .csv, .json or .jsonl file, got '{0}'".format(
+                expected))
+        key_positions = []
+        for name in key_names:
+            column = find_name(name, actual_columns)
+            if column is None:
+                raise ValueError("Key column '{0}' is not one of the query's columns: {1}".format(
+                    name, ", ".join(actual_columns)))
+            key_positions.append(actual_columns.index(column))
+        if key_positions:
+            key_of = lambda row: tuple(row[position] for position in key_positions)
+        else:
+            key_of = lambda row: row
+        actual = (tuple(normalize_value(value) for value in row) for row in actual)
+        expected_rows = aligned_rows(expected_columns, expected_rows, actual_columns, source)
+        diff = DatasetDiff(self._renderer.max_rows)
+        try:
+            if presorted:
+                compare_sorted(actual, expected_rows, key_of, diff)
+            else:
+                compare_hashed(actual, expected_rows, key_of, diff)
+        finally:
+            if expected_connection is not None:
+                expected_query.close()
+                if own_connection:
+                    expected_connection.close()
+        if diff:
+            raise AssertionError("Query result of '{0}' does not match {1}: {2}".format(
+                selectStatement, source, diff.render(self._renderer)))
+        logger.info("All {0:,} rows match {1}".format(diff.actual_rows, source))
+
+    def tables_should_be_identical(self, table_name, other_alias, other_table_name=None, key=None,
+                                   schema_name=None, other_schema_name=None, segments=16, leaf_rows=1000,
+                                   alias=None):
+        """
+        Check that a table holds the same rows as a table in another
+        database (`other_alias`, see `Connect To Database`), for example
+        after a migration or replication.
+
+        The tables are compared range by range on an integer `key` column
+        (by default the table's single-column primary key), without fetching
+        rows that are equal. The key range is cut into `segments` ranges,
+        and each database computes an aggregate checksum of each range. Only
+        ranges whose checksums differ are halved again and again, down to
+        ranges of at most `leaf_rows` rows, whose rows are then fetched from
+        both sides and compared value by value. Nearly identical tables of
+        millions of rows are so compared with a few dozen queries.
+
+        The checksums are made of row counts, the number of NULLs and
+        position-weighted sums of the numbers and text lengths in each
+        column, which any two databases compute alike. When both databases
+        are of the same kind (PostgreSQL, MySQL or SQLite), a sum of CRC32
+        hashes of the rows is added, which catches any change; across
+        different kinds of databases, a change of text that keeps its
+        length, or of a date, can go unnoticed. Use `Query Result Should Match`
+        to compare every value exactly.
+
+        Both tables must have the same columns (by name, in any order and
+        case). The failure message shows how many rows are missing from or
+        extra in the table on `alias`, compared to the other one, and how
+        many differ, with at most `max_rendered_rows` examples of each.
+
+        Examples:
+        | Tables Should Be Identical | person | replica |
+        | Tables Should Be Identical | orders | source | other_table_name=legacy_orders | key=order_no | alias=target |
+        """
+        connection = self._get_connection(alias)
+        other_connection = self._get_connection(other_alias)
+        other_table_name = other_table_name or table_name
+        table = self._existing_table(connection.engine, table_name, schema_name)
+        other_table = self._existing_table(other_connection.engine, other_table_name, other_schema_name)
+        columns = self._schema_cache.columns(connection.engine, table, schema_name)
+        other_columns = self._schema_cache.columns(other_connection.engine, other_table, other_schema_name)
+        names = [column['name'] for column in columns]
+        other_names = [column['name'] for column in other_columns]
+        missing = [name for name in other_names if find_name(name, names) is None]
+        extra = [name for name in names if find_name(name, other_names) is None]
+        if missing or extra:
+            raise AssertionError("Table '{0}' and table '{1}' have different columns: {2} only in '{0}', "
+                                 "{3} only in '{1}'".format(table, other_table, ", ".join(extra) or "none",
+                                                            ", ".join(missing) or "none"))
+        if key is None:
+            primary_key = self._schema_cache.primary_key(connection.engine, table, schema_name)
+            if len(primary_key) != 1:
+                raise ValueError("Table '{0}' has no single-column primary key, give the key column "
+                                 "to compare on".format(table))
+            key = primary_key[0]
+        if find_name(key, names) is None:
+            raise ValueError("Table '{0}' has no column '{1}'".format(table, key))
+        key = find_name(key, names)
+        compared_names = [name for name in names if name != key]
+        first = TableSide(connection, table, schema_name, columns, key, compared_names)
+        second = TableSide(other_connection, other_table, other_schema_name, other_columns,
+                           find_name(key, other_names), [find_name(name, other_names) for name in compared_names])
+        diff = DatasetDiff(self._renderer.max_rows)
+        ranges = diff_tables(first, second, diff, int(segments), int(leaf_rows))
+        logger.info("Compared {0:,} key ranges with {1:,} queries, fetching {2:,} of {3:,} rows".format(
+            ranges, first.queries + second.queries, first.fetched_rows + second.fetched_rows,
+            diff.actual_rows + diff.expected_rows))
+        if diff:
+            raise AssertionError("Table '{0}' differs from table '{1}' on '{2}' (rows as {3}): {4}".format(
+                self._qualified_name(table, schema_name), self._qualified_name(other_table, other_schema_name),
+                other_alias, ", ".join([key] + compared_names), diff.render(self._renderer)))
+
+    def query_should_use_index(self, selectStatement, index_name=None, alias=None, **named_args):
+        """
+        Fails unless the plan of `selectStatement` (see `Explain Query`)
+        reads an index: `index_name` (case-insensitively), or any index
+        when no name is given. Rowid and primary key lookups count as
+        indexes: `INTEGER PRIMARY KEY` on SQLite and `PRIMARY` on MySQL.
+
+        Plans depend on the statistics of the database, and planners may
+        prefer reading small tables whole, so check plans on realistic data.
+
+        Example:
+        | Query Should Use Index | SELECT id FROM person WHERE last_name = :name | index_name=person_last_name | name=See |
+        """
+        plan = self.explain_query(selectStatement, alias=alias, **named_args)
+        indexes = [node['index'] for node in plan_nodes(plan) if node['index']]
+        if index_name is None:
+            if indexes:
+                return
+            expected = "an index"
+        else:
+            if index_name.lower() in [index.lower() for index in indexes]:
+                return
+            expected = "index '{0}'".format(index_name)
+        raise AssertionError("Expected the plan of '{0}' to use {1}, but it uses {2}:\n{3}".format(
+            selectStatement, expected, ", ".join("'{0}'".format(index) for index in indexes) or "no index",
+            format_plan(plan)))
+
+    def query_should_not_full_scan(self, selectStatement, table_name=None, alias=None, **named_args):
+        """
+        Fails when the plan of `selectStatement` (see `Explain Query`) reads
+        every row of a table (or of `table_name` only, which may be the
+        table or its alias in the query, case-insensitively), through the
+        table itself or a whole index.
+
+        Example:
+        | Query Should Not Full Scan | SELECT * FROM orders o JOIN customer c ON c.id = o.customer_id WHERE o.id = :id | id=7 |
+        | Query Should Not Full Scan | SELECT * FROM orders o JOIN country ON country.code = o.country WHERE o.id = :id | table_name=o | id=7 |
+        """
+        plan = self.explain_query(selectStatement, alias=alias, **named_args)
+        scanned = [node['alias'] or node['table'] or node['operation'] for node in plan_nodes(plan)
+                   if node['full_scan'] and (table_name is None or table_name.lower() in [
+                       (node['table'] or '').lower(), (node['alias'] or '').lower()])]
+        if scanned:
+            raise AssertionError("Expected the plan of '{0}' not to scan whole tables, but it scans {1}:\n{2}".format(
+                selectStatement, ", ".join("'{0}'".format(table) for table in scanned), format_plan(plan)))
+
+    def query_cost_should_be_below(self, selectStatement, max_cost, alias=None, **named_args):
+        """
+        Fails unless the cost the database estimates for the plan of
+        `selectStatement` (see `Explain Query`) is below `max_cost`. The
+        cost is in the units of the database (such as PostgreSQL's page
+        fetches), so compare it with costs measured on the same database.
+
+        SQLite estimates no costs.
+
+        Example:
+        | Query Cost Should Be Below | SELECT * FROM orders WHERE customer_id = :id | 100 | id=7 |
+        """
+        plan = self.explain_query(selectStatement, alias=alias, **named_args)
+        cost = plan_cost(plan)
+        if cost is None:
+            raise ValueError("The database estimates no cost for the plan of '{0}'".format(selectStatement))
+        if not cost < float(max_cost):
+            raise AssertionError("Expected the plan of '{0}' to cost less than {1}, but it costs {2:g}:\n{3}".format(
+                selectStatement, max_cost, cost, format_plan(plan)))
+
+    def table_must_exist(self, table_name, schema_name=None, alias=None):
         """*DEPRECATED* Use keyword `Table Should Exist` instead."""
-        self.table_should_exist(table_name, schema_name)
+        self.table_should_exist(table_name, schema_name, alias=alias)
 
-    def table_should_exist(self, table_name, schema_name=None, message=None):
-        """Check if the table given exists in the database.
+    def table_should_exist(self, table_name, schema_name=None, message=None, alias=None):
+        """Check if the table (or view) given exists in the database.
+
+        The list of tables is read once per database and schema and then
+        cached (see `Reflect Database Schema`); it is refreshed after DDL run
+        through `Execute Sql String` or `Execute Sql Script`, or by
+        `Clear Schema Cache`.
 
         For example, given we have a table `person` in a database
 
@@ -173,16 +559,95 @@ class Assertion(object):
         | Table Should Exist | person | # PASS |
         | Table Should Exist | first_name | # FAIL |
         """
-        md = sqlalchemy.schema.MetaData(bind=self._engine)
-        table = sqlalchemy.schema.Table(table_name, md, schema=schema_name)
-        if not table.exists():
-            if schema_name is not None:
-                table_name = "{0}.{1}".format(table_name, schema_name)
+        if self._schema_cache.find_table(self._get_engine(alias), table_name, schema_name) is None:
             if message:
                 message = ": {0}".format(message)
             else:
                 message = ""
-            raise AssertionError("Table '{0}' should exist but does not {1}".format(table_name, message))
+            raise AssertionError("Table '{0}' should exist but does not {1}".format(
+                self._qualified_name(table_name, schema_name), message))
+
+    def column_should_exist(self, table_name, column_name, schema_name=None, alias=None):
+        """Check if the table given has a column named `column_name`.
+
+        For example, given we have a table `person` with the columns
+        `id`, `first_name` and `last_name`:
+        | Column Should Exist | person | first_name | # PASS |
+        | Column Should Exist | person | middle_name | # FAIL |
+        """
+        self.table_should_have_columns(table_name, column_name, schema_name=schema_name, alias=alias)
+
+    def table_should_have_columns(self, table_name, *column_names, **options):
+        """Check if the table given has all of the columns listed.
+
+        The table may have other columns as well. The optional `schema_name`
+        and `alias` arguments must be given as named arguments.
+
+        For example, given we have a table `person` with the columns
+        `id`, `first_name` and `last_name`:
+        | Table Should Have Columns | person | id | first_name | # PASS |
+        | Table Should Have Columns | person | id | age | schema_name=public | # FAIL |
+        """
+        schema_name = options.pop('schema_name', None)
+        engine = self._get_engine(options.pop('alias', None))
+        table = self._existing_table(engine, table_name, schema_name)
+        columns = [column['name'] for column in self._schema_cache.columns(engine, table, schema_name)]
+        missing = [name for name in column_names if find_name(name, columns) is None]
+        if missing:
+            raise AssertionError("Table '{0}' should have the columns {1} but has only {2}".format(
+                self._qualified_name(table_name, schema_name), ", ".join(missing), ", ".join(columns)))
+
+    def index_should_exist(self, table_name, index_name, schema_name=None, alias=None):
+        """Check if the table given has an index named `index_name`.
+
+        For example, given we have a table `person` with an index `person_name_idx`:
+        | Index Should Exist | person | person_name_idx | # PASS |
+        | Index Should Exist | person | person_age_idx | # FAIL |
+        """
+        engine = self._get_engine(alias)
+        table = self._existing_table(engine, table_name, schema_name)
+        indexes = [index['name'] for index in self._schema_cache.indexes(engine, table, schema_name)]
+        if find_name(index_name, indexes) is None:
+            raise AssertionError("Table '{0}' should have the index '{1}' but has only {2}".format(
+                self._qualified_name(table_name, schema_name), index_name, ", ".join(indexes)))
+
+    def reflect_database_schema(self, schema_name=None, alias=None):
+        """Reads the tables, columns and indexes of a whole schema into the schema cache
+        and returns the number of tables found.
+
+        Calling this once, for example in a suite setup, turns later
+        `Table Should Exist`, `Column Should Exist`, `Table Should Have Columns`
+        and `Index Should Exist` checks into lookups in memory.
+
+        For example:
+        | Reflect Database Schema |
+        | Reflect Database Schema | schema_name=reporting | alias=reports |
+        """
+        return self._schema_cache.reflect(self._get_engine(alias), schema_name)
+
+    def clear_schema_cache(self, alias=None):
+        """Forgets what is known about the schema of the database.
+
+        Use this after the schema was changed by something else than
+        `Execute Sql String` or `Execute Sql Script`, which clear the cache
+        themselves when they run DDL.
+
+        For example:
+        | Clear Schema Cache |
+        """
+        self._schema_cache.invalidate(self._get_engine(alias))
+
+    def _existing_table(self, engine, table_name, schema_name):
+        table = self._schema_cache.find_table(engine, table_name, schema_name)
+        if table is None:
+            raise AssertionError("Table '{0}' should exist but does not".format(
+                self._qualified_name(table_name, schema_name)))
+        return table
+
+    def _qualified_name(self, table_name, schema_name):
+        if schema_name is None:
+            return table_name
+        return "{0}.{1}".format(schema_name, table_name)
 
     def query_for_single_column(self, selectStatement, *expected_values, **params):
         """
@@ -225,10 +690,11 @@ class Assertion(object):
         Result: FAIL because we got [1, 4, 7] but were only expecting [1, 4].
 
         """
-        raw_rows = self.query(selectStatement, **named_args)
+        alias = params.pop('alias', None)
+        raw_rows = self.query(selectStatement, alias=alias, **params)
         rows = [row[0] for row in raw_rows]
         if len(expected_values) > 0:
-            builtin = BuiltIn()
+            builtin = robot_builtin.BuiltIn()
             for expected_value in expected_values:
                 builtin.should_contain(rows, expected_value)
             builtin.log_many("Expecting values:", *expected_values)
@@ -238,7 +704,7 @@ class Assertion(object):
 
 
 
-    def query_for_single_value(self, selectStatement, expected_value=None, message=None, **named_args):
+    def query_for_single_value(self, selectStatement, expected_value=None, message=None, alias=None, **named_args):
         """Return the result of this query IF it returns only 1 row with 1 column.
 
         Fails via `Length Should Be` if the query returns
@@ -265,22 +731,39 @@ class Assertion(object):
         | Should Be Equal | ${value} | ${None} | Should be null! |
 
         """
-        values = self.query(selectStatement, **named_args)
-        BuiltIn().length_should_be(values, 1,
+        values = self.query(selectStatement, alias=alias, **named_args)
+        robot_builtin.BuiltIn().length_should_be(values, 1,
                 "There should be exactly one row returned by the query {0}".format(selectStatement))
         row = values[0]
-        BuiltIn().length_should_be(row, 1,
+        robot_builtin.BuiltIn().length_should_be(row, 1,
                 "There should be exactly one column in the results of {0}".format(selectStatement))
         answer = row[0]
         if expected_value is not None:
-            BuiltIn().should_be_equal(answer, expected_value, message)
+            robot_builtin.BuiltIn().should_be_equal(answer, expected_value, message)
         return answer
 
-    def query_for_single_number(self, selectStatement, expected_value=None, message=None, **named_args):
-        answer = self.query_for_single_value(selectStatement, **named_args)
+    def query_for_single_number(self, selectStatement, expected_value=None, message=None, alias=None, **named_args):
+        answer = self.query_for_single_value(selectStatement, alias=alias, **named_args)
         if expected_value is not None:
-            BuiltIn().should_be_equal_as_numbers(answer, expected_value, message)
+            robot_builtin.BuiltIn().should_be_equal_as_numbers(answer, expected_value, message)
 
-    def query_for_count(self, selectStatement, expected_value=None, message=None, **named_args):
+    def query_for_count(self, selectStatement, expected_value=None, message=None, alias=None, **named_args):
         """Alias for `Query for Single Number`."""
-        return self.query_for_single_number(selectStatement, expected_value=expected_value, message=message, **named_args)
+        return self.query_for_single_number(selectStatement, expected_value=expected_value, message=message, alias=alias, **named_args)
+
+
+def _peeked(rows):
+    """
+    Starts the generator `rows` (so that a query runs and reports its
+    columns) and returns an iterator over all of its rows.
+    """
+    first = next(rows, _peeked)
+    if first is _peeked:
+        return iter(())
+    return _prepend(first, rows)
+
+
+def _prepend(first, rows):
+    yield first
+    for row in rows:
+        yield row
@@ -0,0 +1,216 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from collections import OrderedDict
+import numbers
+
+COLUMN_FORMATS = ('columns', 'numpy', 'arrow', 'dataframe')
+
+
+def import_optional(module, extra):
+    try:
+        return __import__(module)
+    except ImportError:
+        raise RuntimeError("This needs {0}, install it with 'pip install {0}' "
+                           "or 'pip install robotframework-SQLAlchemyLibrary[{1}]'".format(module, extra))
+
+
+class ColumnBuilder(object):
+    """
+    Builds column-oriented data from chunks of raw rows (sequences of values).
+
+    Each chunk is transposed into one sequence per column as it arrives
+    (a list, a NumPy array or an Arrow array, depending on `format`), so no
+    row objects are kept. `result()` joins the chunks of every column.
+
+    >>> builder = ColumnBuilder(['id', 'name'])
+    >>> builder.add([(1, 'a'), (2, 'b')])
+    >>> builder.add([(3, None)])
+    >>> list(builder.result().items())
+    [('id', [1, 2, 3]), ('name', ['a', 'b', None])]
+    """
+
+    def __init__(self, names, format='columns'):
+        if format not in COLUMN_FORMATS:
+            raise ValueError("Unknown format '{0}', expected one of: {1}".format(format, ", ".join(COLUMN_FORMATS)))
+        duplicates = sorted(set(name for name in names if list(names).count(name) > 1))
+        if duplicates:
+            raise ValueError("Column names must be unique, use AS to rename: {0}".format(", ".join(duplicates)))
+        self.names = list(names)
+        self.format = format
+        self.rows = 0
+        self._chunks = [[] for _ in self.names]
+        if format == 'numpy':
+            self._convert = import_optional('numpy', 'numpy').array
+        elif format == 'arrow' or (format == 'dataframe' and _importable('pyarrow')):
+            self._convert = import_optional('pyarrow', 'arrow').array
+        else:
+            self._convert = list
+
+    def add(self, rows):
+        if not rows:
+            return
+        self.rows += len(rows)
+        for chunks, values in zip(self._chunks, zip(*rows)):
+            chunks.append(self._convert(values))
+
+    def result(self):
+        if self.format == 'numpy':
+            numpy = import_optional('numpy', 'numpy')
+            return OrderedDict((name, numpy.concatenate(chunks) if chunks else numpy.array([]))
+                               for name, chunks in zip(self.names, self._chunks))
+        if self._convert is list:
+            columns = OrderedDict((name, [value for chunk in chunks for value in chunk])
+                                  for name, chunks in zip(self.names, self._chunks))
+            if self.format == 'dataframe':
+                return import_optional('pandas', 'dataframe').DataFrame(columns, columns=self.names)
+            return columns
+        table = _arrow_table(self.names, self._chunks)
+        if self.format == 'dataframe':
+            import_optional('pandas', 'dataframe')
+            return table.to_pandas()
+        return table
+
+
+def _importable(module):
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def _arrow_table(names, column_chunks):
+    pyarrow = import_optional('pyarrow', 'arrow')
+    columns = []
+    for chunks in column_chunks:
+        column_type = pyarrow.null()
+        for chunk in chunks:
+            column_type = unified_type(pyarrow, column_type, chunk.type)
+        columns.append(pyarrow.chunked_array([chunk.cast(column_type) for chunk in chunks], type=column_type))
+    return pyarrow.Table.from_arrays(columns, names=names)
+
+
+def unified_type(pyarrow, first, second):
+    """
+    Returns the Arrow type that can hold the values of the types `first`
+    and `second`. Chunks are typed one by one: a chunk of only NULLs has
+    the null type, a column of numbers can have chunks of integers and of
+    floats, and decimals of different precisions. Other mixes become text.
+    """
+    types = pyarrow.types
+    if first == second or types.is_null(second):
+        return first
+    if types.is_null(first):
+        return second
+    if all(types.is_integer(t) or types.is_floating(t) for t in (first, second)):
+        if types.is_integer(first) and types.is_integer(second):
+            return pyarrow.int64()
+        return pyarrow.float64()
+    if types.is_decimal(first) and types.is_decimal(second):
+        scale = max(first.scale, second.scale)
+        digits = max(first.precision - first.scale, second.precision - second.scale)
+        if digits + scale <= 38:
+            return pyarrow.decimal128(digits + scale, scale)
+    return pyarrow.string()
+
+
+def column_values(data, column):
+    """
+    Returns the values of `column` in data returned by `Query As Columns`,
+    in whichever format it is.
+    """
+    if hasattr(data, 'column_names') and hasattr(data, 'column'):
+        return data.column(column)
+    return data[column]
+
+
+def column_statistics(values):
+    """
+    Returns the count, number of NULLs, number of distinct values, minimum,
+    maximum and (for numbers) sum of a column, computed vectorized when the
+    column is a NumPy array, an Arrow array or a pandas Series.
+
+    >>> stats = column_statistics([3, None, 1, 3])
+    >>> [(key, stats[key]) for key in ('count', 'nulls', 'distinct', 'min', 'max', 'sum')]
+    [('count', 4), ('nulls', 1), ('distinct', 2), ('min', 1), ('max', 3), ('sum', 7)]
+    """
+    module = type(values).__module__.split('.')[0]
+    if module == 'pyarrow':
+        return _arrow_statistics(values)
+    if module == 'pandas':
+        return _pandas_statistics(values)
+    if module == 'numpy' and values.dtype.kind in 'biuf':
+        return _numpy_statistics(values)
+    return _python_statistics(list(values))
+
+
+def _python_statistics(values):
+    present = [value for value in values if value is not None]
+    numeric = bool(present) and all(isinstance(value, numbers.Number) for value in present)
+    return OrderedDict([
+        ('count', len(values)),
+        ('nulls', len(values) - len(present)),
+        ('distinct', len(set(present))),
+        ('min', min(present) if present else None),
+        ('max', max(present) if present else None),
+        ('sum', sum(present) if numeric else None),
+    ])
+
+
+def _numpy_statistics(values):
+    numpy = import_optional('numpy', 'numpy')
+    nulls = int(numpy.isnan(values).sum()) if values.dtype.kind == 'f' else 0
+    present = values[~numpy.isnan(values)] if nulls else values
+    empty = present.size == 0
+    return OrderedDict([
+        ('count', int(values.size)),
+        ('nulls', nulls),
+        ('distinct', int(numpy.unique(present).size)),
+        ('min', None if empty else present.min().item()),
+        ('max', None if empty else present.max().item()),
+        ('sum', present.sum().item()),
+    ])
+
+
+def _pandas_statistics(values):
+    numeric = values.dtype.kind in 'biuf'
+    return OrderedDict([
+        ('count', int(values.size)),
+        ('nulls', int(values.isna().sum())),
+        ('distinct', int(values.nunique())),
+        ('min', _python_value(values.min()) if values.count() else None),
+        ('max', _python_value(values.max()) if values.count() else None),
+        ('sum', _python_value(values.sum()) if numeric else None),
+    ])
+
+
+def _arrow_statistics(values):
+    pyarrow = import_optional('pyarrow', 'arrow')
+    import pyarrow.compute as compute
+    min_max = compute.min_max(values).as_py()
+    numeric = pyarrow.types.is_integer(values.type) or pyarrow.types.is_floating(values.type) or \
+        pyarrow.types.is_decimal(values.type)
+    return OrderedDict([
+        ('count', len(values)),
+        ('nulls', values.null_count),
+        ('distinct', compute.count_distinct(values).as_py()),
+        ('min', min_max['min']),
+        ('max', min_max['max']),
+        ('sum', compute.sum(values).as_py() if numeric else None),
+    ])
+
+
+def _python_value(value):
+    return value.item() if hasattr(value, 'item') else value
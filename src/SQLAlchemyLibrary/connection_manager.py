@@ -12,31 +12,172 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-try:
-    import ConfigParser
-except:
-    import configparser as ConfigParser
+import threading
+import time
 
 from robot.api import logger
-import sqlalchemy
+from robot.utils import is_truthy, timestr_to_secs
+
+from SQLAlchemyLibrary.instrumentation import StatementTimer
+from SQLAlchemyLibrary.lazy_import import LazyModule
+from SQLAlchemyLibrary.schema_cache import SchemaCache
+from SQLAlchemyLibrary.worker_database import POOL_ID, WORKER_MODES, pabot_worker, worker_database
+
+futures = LazyModule('concurrent.futures')
+sqlalchemy = LazyModule('sqlalchemy')
+
+
+def transaction(connection):
+    """
+    Begins a transaction on `connection`, or a SAVEPOINT when a transaction
+    is already in progress (such as the one of test isolation), so that
+    rolling it back only undoes what was done since it began.
+    """
+    if connection.in_transaction():
+        return connection.begin_nested()
+    return connection.begin()
+
+
+def is_memory_database(engine):
+    return engine.dialect.name == 'sqlite' and engine.url.database in (None, '', ':memory:')
+
+
+def warm_up(engine, connections):
+    """
+    Opens `connections` connections of `engine` at the same time and
+    returns them to its pool. Each is closed in the thread that opened it,
+    once all of them are open (or failed to).
+
+    >>> engine = sqlalchemy.create_engine('sqlite://', poolclass=sqlalchemy.pool.QueuePool,
+    ...                                   connect_args={'check_same_thread': False})
+    >>> warm_up(engine, 3)
+    >>> engine.pool.checkedin()
+    3
+    """
+    attempted = [0]
+    all_attempted = threading.Condition()
+
+    def open_connection(_):
+        connection = None
+        try:
+            connection = engine.connect()
+        finally:
+            with all_attempted:
+                attempted[0] += 1
+                all_attempted.notify_all()
+                while attempted[0] < connections:
+                    all_attempted.wait()
+            if connection is not None:
+                connection.close()
+
+    pool = futures.ThreadPoolExecutor(connections)
+    try:
+        list(pool.map(open_connection, range(connections)))
+    finally:
+        pool.shutdown()
+
+
+def _sqlite_connect(dbapi_connection, connection_record):
+    # pysqlite begins and commits transactions on its own, which breaks
+    # SAVEPOINTs; leave that to SQLAlchemy (see _sqlite_begin).
+    dbapi_connection.isolation_level = None
+
+
+def _sqlite_begin(connection):
+    connection.execute('BEGIN')
+
+
+def _search_path_setter(search_path):
+    def set_search_path(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('SET search_path TO {0}'.format(search_path))
+        cursor.close()
+        # Rolling back, as the pool does, would undo the SET.
+        dbapi_connection.commit()
+    return set_search_path
 
 
 class ConnectionManager(object):
     """
     Connection Manager handles the connection & disconnection to the database.
+
+    Several connections can be open at the same time, each under its own
+    alias. Keywords use the current connection (the one most recently
+    connected or switched to) unless they are given an `alias` argument.
     """
 
     def __init__(self):
         """
-        Initializes _dbconnection to None.
+        Initializes the (empty) engine and connection registries.
         """
-        self._engine = None
-        self._dbconnection = None
+        self._engines = {}
+        self._engines_lock = threading.Lock()
+        self._connections = {}
+        self._lazy_connections = {}
+        self._current_alias = None
+        self._schema_cache = SchemaCache()
+        self._statement_timer = None
+        self._statement_timing_report = None
+        self._test_isolation = False
+        self._isolation_transactions = {}
+        self._worker_databases = {}
 
-    def connect_to_database(self, url, echo=False, **kwargs):
+    def connect_to_database(self, url, echo=False, alias='default', lazy=False, warm_up=0,
+                            per_worker=None, worker_template=None, **kwargs):
         """
         Connect to the given database URL with SQLAlchemy.
 
+        The connection is registered under `alias` and becomes the current
+        connection. Connecting again with an alias that is already in use
+        closes the previous connection with that alias first.
+
+        Engines (and their connection pools) are kept for the rest of the
+        run: connecting again to the same URL with the same options reuses
+        the existing engine instead of creating a new one. In-memory SQLite
+        databases (`sqlite://`) are the exception: every connection to one
+        opens a new, empty database, which is discarded when disconnecting.
+
+        With `lazy`, only the URL is recorded: the engine is created and the
+        connection opened by the first keyword that uses it, so suites (or
+        dry runs) that end up not using the database never connect.
+
+        With `warm_up`, that many connections are opened in the background
+        (at the same time) and returned to the pool, so that later
+        connections, such as those of `Run Queries Concurrently`, are ready
+        when needed. The pool keeps at most `pool_size` (5 by default) of
+        them. Errors while warming up are left for the first keyword using
+        the connection to report. SQLite databases, and engines without a
+        pool (`poolclass=NullPool`), are not warmed up.
+
+        With `per_worker` (`schema` or `database`), each pabot process gets
+        a copy of the database of its own, so that tests running in
+        parallel neither see nor lock each other's data. The copy is named
+        after `worker_template` (by default the database of the URL, or the
+        `public` schema) and the `PABOTEXECUTIONPOOLID` of the process, and
+        is created again (from `worker_template`) when first connected to
+        in a run:
+        - PostgreSQL, `schema`: the tables of the template schema are
+          copied into the schema `<template>_worker_<id>`, which is put
+          first on the `search_path` so unqualified names refer to it.
+          Foreign keys are not copied, and serial columns keep using the
+          sequences of the template.
+        - PostgreSQL, `database`: the database `<template>_worker_<id>` is
+          created with `CREATE DATABASE ... TEMPLATE`, which needs the
+          `CREATEDB` privilege and that no session is connected to the
+          template.
+        - MySQL (either mode, as schemas are databases there): the tables
+          of the template are copied into the database
+          `<template>_worker_<id>`, without foreign keys.
+        - SQLite (either mode): the database file is copied to
+          `<name>_worker_<id>.db` next to it. In-memory databases are
+          already private to each process and are left as they are.
+        The copies are dropped by `Disconnect From All Databases` and when
+        the run ends. Without pabot, the URL is connected to as is.
+
+        NOTE: `alias`, `lazy`, `warm_up`, `per_worker`, `worker_template`
+        and `search_path` are reserved and are not passed on to
+        `create_engine`.
+
         See also:
 
         - http://docs.sqlalchemy.org/en/latest/core/engines.html#database-urls
@@ -45,10 +186,215 @@ class ConnectionManager(object):
         Example usage:
         | # Connect to an in-memory SQLite database |
         | Create Engine | sqlite:///:memory: |
+        | # Connect to two databases and query each of them |
+        | Connect To Database | postgresql://user@source-host/app | alias=source |
+        | Connect To Database | sqlite:///${CURDIR}/reports.db | alias=reports |
+        | Row Count Is 0 | SELECT id FROM orders | alias=source |
+        | Switch Database | reports |
+        | # Connect on first use, with four connections ready by then |
+        | Connect To Database | postgresql://user@host/app | lazy=True | warm_up=4 |
+        | # Give each pabot process a copy of the tables of the public schema |
+        | Connect To Database | postgresql://user@host/app | per_worker=schema |
+
+        """
+        if alias in self._connections or alias in self._lazy_connections:
+            self._close_connection(alias)
+        if per_worker:
+            url, kwargs = self._worker_connection(url, per_worker, worker_template, kwargs)
+        self._current_alias = alias
+        warm_up = int(warm_up)
+        if is_truthy(lazy):
+            self._lazy_connections[alias] = (url, echo, kwargs)
+        else:
+            self._open_connection(alias, url, echo, kwargs)
+        if warm_up > 0:
+            self._warm_up(url, echo, kwargs, warm_up)
+
+    def _worker_connection(self, url, mode, template, kwargs):
+        """
+        Returns the URL and engine options to connect to the database of
+        the pabot worker instead of `url`, creating it the first time.
+        """
+        mode = mode.lower()
+        if mode not in WORKER_MODES:
+            raise ValueError("per_worker must be one of {0}, got '{1}'".format(", ".join(WORKER_MODES), mode))
+        worker = pabot_worker()
+        if worker is None:
+            logger.info("{0} is not set (not run by pabot), connecting to the database itself".format(POOL_ID))
+            return url, kwargs
+        key = (str(url), mode, template)
+        database = self._worker_databases.get(key)
+        if database is None:
+            database = worker_database(url, mode, template, worker)
+            if database is None:
+                return url, kwargs
+            started = time.time()
+            database.create()
+            self._worker_databases[key] = database
+            logger.info("Created the {0} {1} of pabot worker {2} in {3:.3f} seconds".format(
+                mode, database.name, worker, time.time() - started))
+        if database.search_path:
+            kwargs = dict(kwargs, search_path=database.search_path)
+        return database.url, kwargs
 
+    def _open_connection(self, alias, url, echo, kwargs):
+        engine = self._create_engine(url, echo=echo, **kwargs)
+        connection = self._connections[alias] = engine.connect()
+        if self._test_isolation and getattr(getattr(self, 'ROBOT_LIBRARY_LISTENER', None), 'test', None):
+            self._isolation_transactions[alias] = connection.begin()
+        return connection
+
+    def _warm_up(self, url, echo, kwargs, connections):
+        engine = self._create_engine(url, echo=echo, **kwargs)
+        # SQLite connections can only be used in the thread that opened them
+        # (and are not pooled by default), so there is nothing to warm up.
+        if engine.dialect.name == 'sqlite' or isinstance(engine.pool, sqlalchemy.pool.NullPool):
+            logger.info("Not warming up {0}, its connections are not pooled across threads".format(engine.url))
+            return
+
+        def open_connections():
+            try:
+                warm_up(engine, connections)
+            except Exception as error:
+                logger.debug("Warming up {0} failed: {1}".format(engine.url, error))
+        thread = threading.Thread(target=open_connections, name='SQLAlchemyLibrary warm-up')
+        thread.daemon = True
+        thread.start()
+
+    def _create_engine(self, url, echo=False, search_path=None, **kwargs):
+        key = (str(url), bool(echo), search_path, repr(sorted(kwargs.items())))
+        # Engines can also be created by the warm-up thread.
+        with self._engines_lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                engine = sqlalchemy.create_engine(url, echo=echo, **kwargs)
+                if engine.dialect.name == 'sqlite':
+                    sqlalchemy.event.listen(engine, 'connect', _sqlite_connect)
+                    sqlalchemy.event.listen(engine, 'begin', _sqlite_begin)
+                if search_path:
+                    sqlalchemy.event.listen(engine, 'connect', _search_path_setter(
+                        ", ".join(engine.dialect.identifier_preparer.quote(name) for name in search_path)))
+                # An in-memory database lives in the connections of its
+                # engine, so each connection to one gets an engine of its own.
+                if not is_memory_database(engine):
+                    self._engines[key] = engine
+                if self._statement_timer is not None:
+                    self._statement_timer.attach(engine)
+                return engine
+        logger.debug("Reusing the engine for {0}".format(engine.url))
+        return engine
+
+    def start_statement_timing(self, slow_query_threshold=None, report_file=None):
         """
-        self._engine = sqlalchemy.create_engine(url, echo=echo, **kwargs)
-        self._dbconnection = self._engine.connect()
+        Starts timing every SQL statement run through this library.
+
+        For each statement, the time to execute it, the time to fetch its
+        rows, the number of rows and the keywords and tests that ran it are
+        recorded. Statements taking at least `slow_query_threshold` (a Robot
+        Framework time string such as `500 ms`) are logged as warnings.
+
+        When `report_file` is given, the report (see
+        `Write Statement Timing Report`) is written there at the end of the
+        run. Timing can also be started when importing the library:
+        | Library | SQLAlchemyLibrary | slow_query_threshold=1 s | statement_timing_report=${OUTPUT DIR}/sql-timing.json |
+
+        For example:
+        | Start Statement Timing | slow_query_threshold=200 ms |
+        """
+        if slow_query_threshold not in (None, ''):
+            slow_query_threshold = timestr_to_secs(slow_query_threshold)
+        else:
+            slow_query_threshold = None
+        if self._statement_timer is None:
+            self._statement_timer = StatementTimer(slow_query_threshold,
+                                                   getattr(self, 'ROBOT_LIBRARY_LISTENER', None))
+        else:
+            self._statement_timer.slow_query_threshold = slow_query_threshold
+        for engine in self._all_engines():
+            self._statement_timer.attach(engine)
+        if report_file:
+            self._statement_timing_report = report_file
+
+    def stop_statement_timing(self):
+        """
+        Stops timing SQL statements. What was recorded so far is kept
+        for `Write Statement Timing Report`.
+        """
+        if self._statement_timer is not None:
+            self._statement_timer.detach_all()
+
+    def write_statement_timing_report(self, path, order='total'):
+        """
+        Writes the statement timings recorded since `Start Statement Timing`
+        to `path`, as CSV if it ends with `.csv` and as JSON otherwise.
+
+        Statements are listed slowest first, by total time or, with
+        `order=p95`, by 95th percentile time, with their number of calls,
+        total, mean, 95th percentile and maximum time, time spent executing
+        (as opposed to fetching), rows fetched, and the keywords and tests
+        that ran them.
+
+        For example:
+        | Write Statement Timing Report | ${OUTPUT DIR}${/}sql-timing.csv |
+        | Write Statement Timing Report | ${OUTPUT DIR}${/}sql-timing-p95.json | order=p95 |
+        """
+        if self._statement_timer is None:
+            raise RuntimeError("Statement timing was not started. Use 'Start Statement Timing' first.")
+        count = self._statement_timer.write_report(path, order)
+        logger.info("Wrote the timings of {0} statements to <a href=\"{1}\">{1}</a>".format(count, path),
+                    html=True)
+        return path
+
+    def _write_statement_timing_report_on_close(self):
+        if self._statement_timer is not None and self._statement_timing_report:
+            self._statement_timer.write_report(self._statement_timing_report)
+
+    def switch_database(self, alias):
+        """
+        Makes the connection registered under `alias` the current one
+        and returns the alias of the previously current connection.
+
+        Example usage:
+        | Connect To Database | sqlite:///source.db | alias=source |
+        | Connect To Database | sqlite:///replica.db | alias=replica |
+        | ${previous}= | Switch Database | source |
+        | Query | SELECT * FROM person |
+        | Switch Database | ${previous} |
+        """
+        self._check_alias(alias)
+        previous, self._current_alias = self._current_alias, alias
+        return previous
+
+    def _get_connection(self, alias=None):
+        if alias is None:
+            alias = self._current_alias
+        try:
+            return self._connections[alias]
+        except KeyError:
+            if alias in self._lazy_connections:
+                url, echo, kwargs = self._lazy_connections.pop(alias)
+                return self._open_connection(alias, url, echo, kwargs)
+            raise self._not_connected(alias)
+
+    def _check_alias(self, alias):
+        if alias not in self._connections and alias not in self._lazy_connections:
+            raise self._not_connected(alias)
+
+    def _not_connected(self, alias):
+        if alias is None:
+            return RuntimeError("Not connected to any database. Use 'Connect To Database' first.")
+        return RuntimeError("No database connection with alias '{0}'.".format(alias))
+
+    def _get_engine(self, alias=None):
+        return self._get_connection(alias).engine
+
+    @property
+    def _dbconnection(self):
+        return self._get_connection()
+
+    @property
+    def _engine(self):
+        return self._get_engine()
 
     @property
     def db_api_module_name(self):
@@ -57,11 +403,127 @@ class ConnectionManager(object):
         except:
             return None
 
-    def disconnect_from_database(self):
+    def disconnect_from_database(self, alias=None):
         """
         Disconnects from the database.
 
+        Without an `alias`, the current connection is closed. The engine
+        is kept so a later `Connect To Database` to the same URL can reuse
+        its connection pool, except for in-memory SQLite databases, which
+        are discarded.
+
         For example:
         | Disconnect From Database | # disconnects from current connection to the database |
+        | Disconnect From Database | reports | # disconnects the connection with the alias 'reports' |
+        """
+        if alias is None:
+            alias = self._current_alias
+        self._check_alias(alias)
+        self._close_connection(alias)
+        if alias == self._current_alias:
+            self._current_alias = None
+
+    def _close_connection(self, alias):
+        self._isolation_transactions.pop(alias, None)
+        self._lazy_connections.pop(alias, None)
+        connection = self._connections.pop(alias, None)
+        if connection is not None:
+            connection.close()
+            if is_memory_database(connection.engine):
+                connection.engine.dispose()
+
+    def _all_engines(self):
+        with self._engines_lock:
+            engines = set(self._engines.values())
+        return engines | set(connection.engine for connection in self._connections.values())
+
+    def disconnect_from_all_databases(self):
+        """
+        Closes every open connection and disposes of all engines
+        and their connection pools. The databases created for pabot workers
+        (see `Connect To Database`) are dropped.
+
+        For example:
+        | Disconnect From All Databases |
+        """
+        self._isolation_transactions.clear()
+        self._lazy_connections.clear()
+        engines = self._all_engines()
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+        for engine in engines:
+            engine.dispose()
+        with self._engines_lock:
+            self._engines.clear()
+        self._schema_cache.invalidate()
+        self._current_alias = None
+        self._drop_worker_databases()
+
+    def _drop_worker_databases(self):
+        for database in self._worker_databases.values():
+            try:
+                database.drop()
+            except Exception as error:
+                logger.warn("Could not drop {0} of the pabot worker: {1}".format(database.name, error))
+            else:
+                logger.info("Dropped {0} of the pabot worker".format(database.name))
+        self._worker_databases.clear()
+
+    def _close_worker_databases(self):
+        # Their databases can only be dropped once nothing is connected.
+        if self._worker_databases:
+            self.disconnect_from_all_databases()
+
+    def enable_test_isolation(self):
+        """
+        Runs every following test in a transaction that is rolled back
+        when the test ends, so that tests leave no data behind without
+        any cleanup SQL. Can also be enabled when importing the library:
+        | Library | SQLAlchemyLibrary | test_isolation=True |
+
+        The transaction is begun on every open connection when a test
+        starts (and on connections opened during the test). Keywords run
+        their statements in SAVEPOINTs inside it, so a failing keyword only
+        undoes its own changes. Data created in suite setups is kept.
+
+        The rollback cannot undo statements that commit on their own, such
+        as an explicit COMMIT, or DDL on MySQL and Oracle. Other sessions,
+        including the application under test, do not see the data of the
+        test, as it is never committed; neither do the schema keywords
+        such as `Table Should Exist`, which read the schema on a connection
+        of their own. The query result and schema caches are cleared at the
+        end of each test.
+
+        For example:
+        | Enable Test Isolation |
         """
-        self._dbconnection.close()
+        self._test_isolation = True
+
+    def disable_test_isolation(self):
+        """
+        Stops running tests in transactions rolled back when they end
+        (see `Enable Test Isolation`). The transaction of a running test
+        is still rolled back when it ends.
+        """
+        self._test_isolation = False
+
+    def _begin_test_isolation(self):
+        if not self._test_isolation:
+            return
+        for alias, connection in self._connections.items():
+            if alias not in self._isolation_transactions:
+                self._isolation_transactions[alias] = connection.begin()
+
+    def _end_test_isolation(self):
+        if not self._isolation_transactions:
+            return
+        for alias, isolation in list(self._isolation_transactions.items()):
+            if isolation.is_active:
+                isolation.rollback()
+        logger.debug("Rolled back the test transaction of {0}".format(
+            ", ".join(sorted(str(alias) for alias in self._isolation_transactions))))
+        self._isolation_transactions.clear()
+        if getattr(self, '_result_cache', None) is not None:
+            self._result_cache.clear()
+        self._schema_cache.invalidate()
@@ -0,0 +1,418 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from collections import OrderedDict
+import csv
+from decimal import Decimal
+import gzip
+from itertools import groupby
+import io
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+
+from SQLAlchemyLibrary.schema_cache import find_name
+
+MAX_BUCKET_ROWS = 100000
+BUCKETS = 64
+_MAX_DEPTH = 4
+_NUMBER = re.compile(r'^-?\d+(\.\d+)?([eE][-+]?\d+)?$')
+_JSON_CHUNK_SIZE = 64 * 1024
+
+
+def normalize_value(value):
+    """
+    Returns `value` as text, so that values read from files compare equal
+    to the same values read from a database. NULL and the empty string
+    (which CSV cannot tell apart) both become None.
+
+    >>> normalize_value(12), normalize_value(1.5), normalize_value(''), normalize_value(None)
+    ('12', '1.5', None, None)
+    """
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    text = u'{0}'.format(value)
+    return text if text != u'' else None
+
+
+def sortable(key):
+    """
+    Returns a sort key for a normalized `key` that orders NULLs first,
+    numbers numerically and other text by code point.
+
+    >>> sorted([('10',), ('9',), (None,), ('b',)], key=sortable)
+    [(None,), ('9',), ('10',), ('b',)]
+    """
+    return tuple((0, 0, u'') if value is None else
+                 (1, int(value) if value.isdigit() else Decimal(value), u'') if _NUMBER.match(value) else
+                 (2, 0, value) for value in key)
+
+
+def _open_input(path):
+    if path.lower().endswith('.gz'):
+        return io.TextIOWrapper(gzip.GzipFile(path, 'rb'), encoding='utf-8', newline='')
+    return io.open(path, 'r', newline='', encoding='utf-8')
+
+
+def read_csv(path):
+    """
+    Returns the header and an iterator over the rows of a CSV file
+    (gzipped when `path` ends with `.gz`).
+    """
+    csv_file = _open_input(path)
+    reader = csv.reader(csv_file)
+    try:
+        header = next(reader)
+    except StopIteration:
+        csv_file.close()
+        return [], iter(())
+    return header, _closing(reader, csv_file)
+
+
+def read_json(path, lines=None):
+    """
+    Returns None (the columns are named in each row) and an iterator over
+    the rows of a JSON Lines file (when `lines`, or by default when `path`
+    ends with `.jsonl` or `.ndjson`), or of a file holding one JSON array.
+    Rows are objects or arrays. Neither kind of file is read into memory
+    at once. Files ending with `.gz` are gunzipped.
+    """
+    json_file = _open_input(path)
+    if lines is None:
+        lines = path.lower().endswith(('.jsonl', '.ndjson', '.jsonl.gz', '.ndjson.gz'))
+    if lines:
+        rows = (json.loads(line) for line in json_file if line.strip())
+    else:
+        rows = _json_array_items(json_file)
+    return None, _closing(rows, json_file)
+
+
+def _json_array_items(json_file):
+    decoder = json.JSONDecoder()
+    buffer = json_file.read(_JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("Expected a JSON array in {0}".format(json_file.name))
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            chunk = json_file.read(_JSON_CHUNK_SIZE)
+            if not chunk:
+                raise ValueError("Unterminated JSON array in {0}".format(json_file.name))
+            buffer += chunk
+            continue
+        if end == len(buffer):
+            # A number at the end of the buffer may continue in the next chunk.
+            chunk = json_file.read(_JSON_CHUNK_SIZE)
+            if chunk:
+                buffer += chunk
+                continue
+        yield item
+        buffer = buffer[end:]
+
+
+def _closing(rows, resource):
+    try:
+        for row in rows:
+            yield row
+    finally:
+        resource.close()
+
+
+def aligned_rows(columns, rows, target_columns, source, convert=normalize_value):
+    """
+    Yields the `rows` (from `source`, with the given `columns`) as tuples
+    of values in the order of `target_columns`, each value passed through
+    `convert`.
+
+    Columns are matched by name when both sides name them, and by position
+    otherwise. JSON objects are looked up by the target column names.
+
+    >>> list(aligned_rows(['name', 'ID'], [['Ann', 1]], ['id', 'name'], 'x.csv'))
+    [('1', 'Ann')]
+    """
+    positions = None
+    if columns:
+        positions = [find_name(name, columns) for name in target_columns]
+        if None in positions:
+            if len(columns) != len(target_columns):
+                raise AssertionError("The columns of {0} ({1}) do not match the columns of the query ({2})".format(
+                    source, ", ".join(columns), ", ".join(target_columns)))
+            positions = list(range(len(columns)))
+        else:
+            positions = [columns.index(name) for name in positions]
+    for row in rows:
+        if isinstance(row, dict):
+            names = [find_name(name, list(row)) for name in target_columns]
+            yield tuple(convert(row.get(name)) if name is not None else None for name in names)
+        elif positions is not None:
+            yield tuple(convert(row[position]) for position in positions)
+        else:
+            yield tuple(convert(value) for value in row)
+
+
+class DatasetDiff(object):
+    """
+    Counts the differences between two datasets and keeps the first
+    `max_examples` of each kind.
+    """
+
+    def __init__(self, max_examples):
+        self.max_examples = max_examples
+        self.counts = {'missing': 0, 'extra': 0, 'changed': 0}
+        self.examples = {'missing': [], 'extra': [], 'changed': []}
+        self.actual_rows = 0
+        self.expected_rows = 0
+
+    def add(self, kind, example):
+        self.counts[kind] += 1
+        if len(self.examples[kind]) < self.max_examples:
+            self.examples[kind].append(example)
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def render(self, renderer):
+        lines = ["{0:,} missing, {1:,} extra and {2:,} changed rows ({3:,} actual and {4:,} expected rows)".format(
+            self.counts['missing'], self.counts['extra'], self.counts['changed'],
+            self.actual_rows, self.expected_rows)]
+        for kind in ('missing', 'extra'):
+            if self.counts[kind]:
+                lines.append("{0} rows: {1}".format(
+                    kind.capitalize(), renderer.render(self.examples[kind], total=self.counts[kind])))
+        if self.counts['changed']:
+            changes = ', '.join("{0} -> {1}".format(renderer.render_row(expected), renderer.render_row(actual))
+                                for expected, actual in self.examples['changed'])
+            if self.counts['changed'] > len(self.examples['changed']):
+                changes += renderer.showing(len(self.examples['changed']), self.counts['changed'])
+            lines.append("Changed rows (expected -> actual): {0}".format(changes))
+        return "\n".join(lines)
+
+
+class _ExpectedRows(object):
+    """
+    The expected rows with one key, counted by value (in the order they
+    were first seen), so that matching an actual row takes constant time
+    however many rows share the key.
+
+    >>> rows = _ExpectedRows([('1', 'a'), ('1', 'b'), ('1', 'a')])
+    >>> rows.remove(('1', 'a')), rows.remove(('1', 'c')), len(rows)
+    (True, False, 2)
+    >>> rows.pop_first(), list(rows)
+    (('1', 'a'), [('1', 'b')])
+    """
+
+    def __init__(self, rows=()):
+        self._counts = OrderedDict()
+        self._size = 0
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for row, count in self._counts.items():
+            for _ in range(count):
+                yield row
+
+    def append(self, row):
+        self._counts[row] = self._counts.get(row, 0) + 1
+        self._size += 1
+
+    def remove(self, row):
+        count = self._counts.get(row)
+        if not count:
+            return False
+        if count == 1:
+            del self._counts[row]
+        else:
+            self._counts[row] = count - 1
+        self._size -= 1
+        return True
+
+    def pop_first(self):
+        row = next(iter(self._counts))
+        self.remove(row)
+        return row
+
+
+def _index_row(index, key, row):
+    expected = index.get(key)
+    if expected is None:
+        expected = index[key] = _ExpectedRows()
+    expected.append(row)
+
+
+def _match(index, key, row, diff):
+    """
+    Matches the actual `row` against the expected rows with the same `key` in `index`.
+    """
+    expected = index.get(key)
+    if not expected:
+        diff.add('extra', row)
+        return
+    if not expected.remove(row):
+        diff.add('changed', (expected.pop_first(), row))
+    if not expected:
+        del index[key]
+
+
+def _add_missing(index, diff):
+    for rows in index.values():
+        for row in rows:
+            diff.add('missing', row)
+
+
+def _counted(rows, diff, side):
+    for row in rows:
+        setattr(diff, side, getattr(diff, side) + 1)
+        yield row
+
+
+def compare_sorted(actual, expected, key_of, diff):
+    """
+    Compares two iterables of rows that are both sorted on `key_of(row)`
+    in one pass, holding only the rows of one key at a time.
+    """
+    actual_groups = _sorted_groups(_counted(actual, diff, 'actual_rows'), key_of, 'actual')
+    expected_groups = _sorted_groups(_counted(expected, diff, 'expected_rows'), key_of, 'expected')
+    pending = next(expected_groups, None)
+    for key, order, rows in actual_groups:
+        while pending is not None and pending[1] < order:
+            for row in pending[2]:
+                diff.add('missing', row)
+            pending = next(expected_groups, None)
+        index = {}
+        if pending is not None and pending[0] == key:
+            index[key] = _ExpectedRows(pending[2])
+            pending = next(expected_groups, None)
+        for row in rows:
+            _match(index, key, row, diff)
+        _add_missing(index, diff)
+    while pending is not None:
+        for row in pending[2]:
+            diff.add('missing', row)
+        pending = next(expected_groups, None)
+
+
+def _sorted_groups(rows, key_of, side):
+    """
+    Yields the key, sort key and rows of each run of rows with the same key,
+    checking that the keys are in ascending order.
+    """
+    previous = None
+    for key, group in groupby(rows, key_of):
+        order = sortable(key)
+        if previous is not None and order < previous[1]:
+            raise ValueError("The {0} rows are not sorted on the key: {1} comes after {2}".format(
+                side, key, previous[0]))
+        previous = (key, order)
+        yield key, order, list(group)
+
+
+def compare_hashed(actual, expected, key_of, diff, max_bucket_rows=MAX_BUCKET_ROWS):
+    """
+    Compares two iterables of rows in any order.
+
+    When the expected rows fit in `max_bucket_rows`, they are indexed in
+    memory and the actual rows are streamed past them. Otherwise both sides
+    are hash-partitioned on their key into bucket files on disk, which are
+    then compared pair by pair (partitioning a pair again if it is still
+    too big), so memory use stays bounded whatever the size of the inputs.
+    """
+    expected = _counted(expected, diff, 'expected_rows')
+    actual = _counted(actual, diff, 'actual_rows')
+    index, buffered = {}, 0
+    for row in expected:
+        _index_row(index, key_of(row), row)
+        buffered += 1
+        if buffered >= max_bucket_rows:
+            break
+    else:
+        for row in actual:
+            _match(index, key_of(row), row, diff)
+        _add_missing(index, diff)
+        return
+    workdir = tempfile.mkdtemp(prefix='robot-compare-')
+    try:
+        buffered_rows = (row for rows in index.values() for row in rows)
+        expected_buckets = _partition(_chain(buffered_rows, expected), key_of, workdir, 'expected', 0)
+        del index, buffered_rows
+        actual_buckets = _partition(actual, key_of, workdir, 'actual', 0)
+        _compare_buckets(actual_buckets, expected_buckets, key_of, diff, workdir, max_bucket_rows, 0)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _chain(*iterables):
+    for iterable in iterables:
+        for item in iterable:
+            yield item
+
+
+def _partition(rows, key_of, workdir, side, depth):
+    """
+    Writes `rows` to BUCKETS files by the hash of their key,
+    and returns the (path, row count) of each bucket.
+    """
+    paths = [os.path.join(workdir, '{0}-{1}-{2}'.format(side, depth, bucket)) for bucket in range(BUCKETS)]
+    counts = [0] * BUCKETS
+    files = [open(path, 'wb') for path in paths]
+    try:
+        for row in rows:
+            bucket = hash((depth, key_of(row))) % BUCKETS
+            pickle.dump(row, files[bucket], 2)
+            counts[bucket] += 1
+    finally:
+        for bucket_file in files:
+            bucket_file.close()
+    return list(zip(paths, counts))
+
+
+def _read_bucket(path):
+    with open(path, 'rb') as bucket_file:
+        while True:
+            try:
+                yield pickle.load(bucket_file)
+            except EOFError:
+                return
+
+
+def _compare_buckets(actual_buckets, expected_buckets, key_of, diff, workdir, max_bucket_rows, depth):
+    for (actual_path, actual_count), (expected_path, expected_count) in zip(actual_buckets, expected_buckets):
+        if expected_count > max_bucket_rows and depth < _MAX_DEPTH:
+            subdir = tempfile.mkdtemp(dir=workdir)
+            _compare_buckets(_partition(_read_bucket(actual_path), key_of, subdir, 'actual', depth + 1),
+                             _partition(_read_bucket(expected_path), key_of, subdir, 'expected', depth + 1),
+                             key_of, diff, subdir, max_bucket_rows, depth + 1)
+            shutil.rmtree(subdir, ignore_errors=True)
+        else:
+            index = {}
+            for row in _read_bucket(expected_path):
+                _index_row(index, key_of(row), row)
+            for row in _read_bucket(actual_path):
+                _match(index, key_of(row), row, diff)
+            _add_missing(index, diff)
+        os.remove(actual_path)
+        os.remove(expected_path)
@@ -0,0 +1,545 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import base64
+import csv
+import datetime
+from decimal import Decimal
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from robot.api import logger
+from robot.utils import is_truthy
+
+from SQLAlchemyLibrary.columnar import import_optional, unified_type
+from SQLAlchemyLibrary.connection_manager import transaction
+from SQLAlchemyLibrary.dataset_compare import aligned_rows, read_csv, read_json
+from SQLAlchemyLibrary.lazy_import import LazyModule
+
+sqlalchemy = LazyModule('sqlalchemy')
+
+FILE_FORMATS = ('csv', 'json', 'jsonl', 'parquet')
+_EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'json', '.parquet': 'parquet'}
+
+
+def file_format(path, format=None):
+    """
+    Returns the file format named by `format`, or else by the extension
+    of `path` (ignoring a trailing `.gz`), and whether the file is gzipped.
+
+    >>> file_format('out/people.csv.gz'), file_format('people.txt', 'JSONL')
+    (('csv', True), ('jsonl', False))
+    """
+    lowered = path.lower()
+    gzipped = lowered.endswith('.gz')
+    if gzipped:
+        lowered = lowered[:-3]
+    if format:
+        format = format.lower()
+        if format not in FILE_FORMATS:
+            raise ValueError("Unknown file format '{0}', expected one of: {1}".format(format, ", ".join(FILE_FORMATS)))
+        return format, gzipped
+    for extension, name in _EXTENSIONS.items():
+        if lowered.endswith(extension):
+            return name, gzipped
+    raise ValueError("Cannot tell the format of '{0}' from its extension, give the format "
+                     "({1})".format(path, ", ".join(FILE_FORMATS)))
+
+
+def _open_text(path, gzipped, mode='w'):
+    if gzipped:
+        return io.TextIOWrapper(gzip.GzipFile(path, mode + 'b'), encoding='utf-8', newline='')
+    return io.open(path, mode, encoding='utf-8', newline='')
+
+
+def json_value(value):
+    """
+    Converts the values JSON has no type for.
+
+    >>> json_value(datetime.date(2020, 1, 31)), json_value(Decimal('1.50')), json_value(b'hi')
+    ('2020-01-31', '1.50', 'aGk=')
+    """
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    return str(value)
+
+
+class CsvFileWriter(object):
+    """
+    Writes rows to a CSV file with a header row. NULL is written as an empty value.
+    """
+
+    def __init__(self, path, columns, gzipped=False):
+        self._file = _open_text(path, gzipped)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class JsonFileWriter(object):
+    """
+    Writes rows to a JSON file holding one array, with one object per row
+    on a line of its own.
+    """
+
+    def __init__(self, path, columns, gzipped=False):
+        self._file = _open_text(path, gzipped)
+        self._columns = list(columns)
+        self._separator = u'[\n'
+
+    def write(self, rows):
+        columns = self._columns
+        for row in rows:
+            self._file.write(self._separator)
+            self._file.write(json.dumps(dict(zip(columns, row)), default=json_value, ensure_ascii=False))
+            self._separator = u',\n'
+
+    def close(self):
+        self._file.write(u'[]\n' if self._separator == u'[\n' else u'\n]\n')
+        self._file.close()
+
+
+class JsonLinesFileWriter(object):
+    """
+    Writes rows to a JSON Lines file, one object per row.
+    """
+
+    def __init__(self, path, columns, gzipped=False):
+        self._file = _open_text(path, gzipped)
+        self._columns = list(columns)
+
+    def write(self, rows):
+        columns = self._columns
+        self._file.write(u''.join(
+            json.dumps(dict(zip(columns, row)), default=json_value, ensure_ascii=False) + u'\n' for row in rows))
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetFileWriter(object):
+    """
+    Writes rows to a Parquet file, one row group per chunk, with pyarrow.
+
+    The type of each column is inferred from every chunk so far and
+    unified as in `unified_type` (values of mixed types within a chunk, as
+    SQLite allows, are written as text). When a chunk needs a wider type
+    than the file has, such as numbers after a chunk of only NULLs, the row
+    groups already written are copied into a new file of the wider schema.
+    Columns that are NULL throughout keep the null type.
+    """
+
+    def __init__(self, path, columns, gzipped=False):
+        self._pyarrow = import_optional('pyarrow', 'arrow')
+        self._parquet = import_optional('pyarrow.parquet', 'arrow').parquet
+        self._path = path
+        self._columns = list(columns)
+        self._compression = 'gzip' if gzipped else 'snappy'
+        self._writer = None
+        self._schema = None
+
+    def write(self, rows):
+        pyarrow = self._pyarrow
+        values = list(zip(*rows)) or [[] for _ in self._columns]
+        arrays = [self._array(column) for column in values]
+        if self._schema is None:
+            schema = pyarrow.schema([pyarrow.field(name, array.type) for name, array in zip(self._columns, arrays)])
+            self._writer = self._parquet.ParquetWriter(self._path, schema, compression=self._compression)
+        else:
+            schema = pyarrow.schema([pyarrow.field(field.name, unified_type(pyarrow, field.type, array.type))
+                                     for field, array in zip(self._schema, arrays)])
+            if not schema.equals(self._schema):
+                self._widen(schema)
+        self._schema = schema
+        arrays = [array.cast(field.type) for array, field in zip(arrays, schema)]
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+
+    def _array(self, values):
+        pyarrow = self._pyarrow
+        try:
+            return pyarrow.array(values)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            return pyarrow.array([None if value is None else _text(value) for value in values], type=pyarrow.string())
+
+    def _widen(self, schema):
+        self._writer.close()
+        written = self._path + '.narrow'
+        shutil.move(self._path, written)
+        try:
+            self._writer = self._parquet.ParquetWriter(self._path, schema, compression=self._compression)
+            with open(written, 'rb') as narrow:
+                for batch in self._parquet.ParquetFile(narrow).iter_batches():
+                    self._writer.write_table(self._pyarrow.Table.from_batches([batch]).cast(schema))
+        finally:
+            os.remove(written)
+
+    def close(self):
+        if self._writer is None:
+            self.write([])
+        self._writer.close()
+
+
+_WRITERS = {'csv': CsvFileWriter, 'json': JsonFileWriter, 'jsonl': JsonLinesFileWriter, 'parquet': ParquetFileWriter}
+
+
+def read_parquet(path, chunk_size=10000):
+    """
+    Returns the column names and an iterator over the rows of a Parquet
+    file, read one batch of `chunk_size` rows at a time with pyarrow.
+    """
+    parquet_file = import_optional('pyarrow.parquet', 'arrow').parquet.ParquetFile(path)
+    return parquet_file.schema_arrow.names, _parquet_rows(parquet_file, chunk_size)
+
+
+def _parquet_rows(parquet_file, chunk_size):
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        for row in zip(*[column.to_pylist() for column in batch.columns]):
+            yield row
+
+
+def load_value(value):
+    """
+    Converts a value read from a file to the value inserted: the empty
+    string (NULL in CSV) to None, booleans to numbers and JSON objects and
+    arrays to JSON text. Other values are inserted as they are and
+    converted by the database to the type of the column.
+
+    >>> load_value(''), load_value(True), load_value({'a': [1]}), load_value('2.5'), load_value(2.5)
+    (None, 1, '{"a": [1]}', '2.5', 2.5)
+    """
+    if value == '':
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _text(value):
+    if isinstance(value, (datetime.date, datetime.time, bytes)):
+        return json_value(value)
+    return u'{0}'.format(value)
+
+
+def copy_csv_line(row):
+    """
+    Formats a row for PostgreSQL `COPY ... (FORMAT csv)`, where an
+    unquoted empty value is NULL and a quoted one the empty string.
+
+    >>> print(copy_csv_line((1, None, u'a "b" c', u'')).strip())
+    "1",,"a ""b"" c",""
+    """
+    return u','.join(u'' if value is None else u'"' + _text(value).replace(u'"', u'""') + u'"'
+                     for value in row) + u'\n'
+
+
+# Errors of MySQL servers and clients not allowing LOAD DATA LOCAL INFILE.
+_LOCAL_INFILE_DISABLED = (1148, 2068, 3948)
+_MYSQL_ESCAPES = [(u'\\', u'\\\\'), (u'"', u'\\"'), (u'\n', u'\\n'), (u'\r', u'\\r'), (u'\0', u'\\0')]
+
+
+def load_data_line(row):
+    r"""
+    Formats a row for MySQL `LOAD DATA` with fields enclosed by double
+    quotes and escaped by backslashes, where an unquoted `\N` is NULL.
+
+    >>> load_data_line((1, None, u'a "b"\nc')) == u'"1",\\N,"a \\"b\\"\\nc"\n'
+    True
+    """
+    fields = []
+    for value in row:
+        if value is None:
+            fields.append(u'\\N')
+            continue
+        text = _text(value)
+        for character, escaped in _MYSQL_ESCAPES:
+            text = text.replace(character, escaped)
+        fields.append(u'"' + text + u'"')
+    return u','.join(fields) + u'\n'
+
+
+class _LineStream(object):
+    """
+    A file-like object reading the lines produced by `format_line` for
+    `rows` without building them all up front, for the driver to stream.
+    """
+
+    def __init__(self, rows, format_line):
+        self._lines = (format_line(row) for row in rows)
+        self._buffer = u''
+
+    def read(self, size=-1):
+        parts, length = [self._buffer], len(self._buffer)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            parts.append(line)
+            length += len(line)
+        text = u''.join(parts)
+        if size < 0:
+            size = len(text)
+        self._buffer = text[size:]
+        return text[:size]
+
+
+def _counting(rows, counter):
+    for row in rows:
+        counter[0] += 1
+        yield row
+
+
+def _copy_from_stdin(connection, table, columns, rows, chunk_size):
+    cursor = connection.connection.cursor()
+    try:
+        if not hasattr(cursor, 'copy_expert'):
+            return None
+        counter = [0]
+        with transaction(connection):
+            cursor.copy_expert(
+                "COPY {0} ({1}) FROM STDIN WITH (FORMAT csv)".format(table, ", ".join(columns)),
+                _LineStream(_counting(rows, counter), copy_csv_line), size=64 * 1024)
+        return counter[0]
+    finally:
+        cursor.close()
+
+
+def _load_data(connection, table, columns, path):
+    with transaction(connection):
+        connection.execute(sqlalchemy.text(
+            "LOAD DATA LOCAL INFILE :path INTO TABLE {0} CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' "
+            "OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({1})".format(
+                table, ", ".join(columns))), path=path)
+
+
+def _load_data_local_infile(connection, table, columns, rows, chunk_size):
+    handle, path = tempfile.mkstemp(prefix='robot-load-', suffix='.txt')
+    try:
+        os.close(handle)
+        # Loading the still empty file tells whether the server and the
+        # driver allow local files before any row is read.
+        try:
+            _load_data(connection, table, columns, path)
+        except sqlalchemy.exc.DBAPIError as error:
+            code = error.orig.args[0] if error.orig.args else None
+            if code not in _LOCAL_INFILE_DISABLED:
+                raise
+            logger.info("LOAD DATA LOCAL INFILE is not allowed ({0}), inserting the rows instead".format(error.orig))
+            return None
+        loaded = 0
+        with io.open(path, 'w', encoding='utf-8', newline='') as data_file:
+            for row in rows:
+                data_file.write(load_data_line(row))
+                loaded += 1
+        _load_data(connection, table, columns, path)
+        return loaded
+    finally:
+        os.remove(path)
+
+
+def _sqlite_executemany(connection, table, columns, rows, chunk_size):
+    statement = "INSERT INTO {0} ({1}) VALUES ({2})".format(table, ", ".join(columns), ", ".join("?" * len(columns)))
+    # The database file is not synced after every page that is written,
+    # which is safe for fixtures: an interrupted load is simply run again.
+    # SQLite only allows this outside of a transaction.
+    synchronous = None
+    if not connection.in_transaction():
+        synchronous = connection.execute("PRAGMA synchronous").scalar()
+        connection.execute("PRAGMA synchronous = OFF")
+    try:
+        loaded = 0
+        with transaction(connection):
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    connection.execute(statement, chunk)
+                    loaded += len(chunk)
+                    chunk = []
+            if chunk:
+                connection.execute(statement, chunk)
+                loaded += len(chunk)
+        return loaded
+    finally:
+        if synchronous is not None:
+            connection.execute("PRAGMA synchronous = {0}".format(int(synchronous)))
+
+
+_LOADERS = {'postgresql': _copy_from_stdin, 'mysql': _load_data_local_infile, 'sqlite': _sqlite_executemany}
+
+
+class FileTransfer(object):
+    """
+    FileTransfer moves query results to and from files.
+    """
+
+    def export_query_to_file(self, selectStatement, path, format=None, gzip=False, limit=None,
+                             chunk_size=10000, alias=None, **named_args):
+        """
+        Writes the result of `selectStatement` to the file `path` and
+        returns the number of rows written.
+
+        The `format` is `csv` (with a header row), `json` (one array of
+        objects), `jsonl` (JSON Lines, one object per row) or `parquet`
+        (needs `pyarrow`); by default it is taken from the extension of
+        `path` (`.csv`, `.json`, `.jsonl`, `.ndjson` or `.parquet`). The file is gzipped when `gzip` is true or
+        `path` ends with `.gz`; Parquet files are then compressed with gzip
+        inside the file instead.
+
+        Rows are streamed from a server-side cursor (where the driver
+        supports one) and written `chunk_size` rows at a time, so only one
+        chunk is held in memory whatever the size of the result. At most
+        `limit` rows are written when it is given.
+
+        NOTE: `path`, `format`, `gzip`, `limit` and `chunk_size` are reserved
+        and cannot be used as bind parameters.
+
+        Examples:
+        | Export Query To File | SELECT * FROM person | ${OUTPUT DIR}${/}person.csv |
+        | ${rows} = | Export Query To File | SELECT * FROM event WHERE day = :day | ${OUTPUT DIR}${/}events.jsonl.gz | day=${day} |
+        | Export Query To File | SELECT * FROM orders | ${OUTPUT DIR}${/}orders.parquet | limit=100000 |
+        """
+        format, gzipped = file_format(path, format)
+        gzipped = gzipped or is_truthy(gzip)
+        limit = int(limit) if limit not in (None, '') else None
+        chunk_size = int(chunk_size)
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive number, got {0}".format(chunk_size))
+        if limit is not None:
+            chunk_size = max(min(chunk_size, limit), 1)
+        started = time.time()
+        columns = []
+        chunks = self._iterate_chunks(self._get_connection(alias), selectStatement, chunk_size,
+                                      named_args, columns, raw=True)
+        written = 0
+        writer = None
+        try:
+            for rows in chunks:
+                if writer is None:
+                    writer = _WRITERS[format](path, columns, gzipped)
+                if limit is not None and written + len(rows) > limit:
+                    rows = rows[:limit - written]
+                writer.write(rows)
+                written += len(rows)
+                if limit is not None and written >= limit:
+                    break
+            if writer is None:
+                writer = _WRITERS[format](path, columns, gzipped)
+        finally:
+            chunks.close()
+            if writer is not None:
+                writer.close()
+        logger.info("Wrote {0:,} rows to <a href=\"{1}\">{1}</a> in {2:.3f} seconds".format(
+            written, path, time.time() - started), html=True)
+        return written
+
+    def load_table_from_file(self, tableName, path, format=None, columns=None, chunk_size=10000,
+                             schema_name=None, alias=None):
+        """
+        Loads the rows of the file `path` into the table `tableName` and
+        returns the number of loaded rows.
+
+        The `format` is `csv`, `json`, `jsonl` or `parquet` (needs
+        `pyarrow`); by default it is taken from the extension of `path`, as
+        for `Export Query To File`. Files ending with `.gz` are gunzipped.
+        A `json` file holds one array of rows, a `jsonl` file one row per
+        line; rows are objects or arrays.
+
+        The columns are those named by `columns`, or else by the header of a
+        CSV file, the column names of a Parquet file or the keys of the
+        first JSON object; JSON arrays are loaded into all the columns of
+        the table, in order. An empty CSV value is loaded as NULL.
+
+        The file is streamed, never read into memory, and loaded with the
+        fastest way the database offers, in a single transaction:
+        - PostgreSQL (psycopg2): `COPY ... FROM STDIN`,
+        - MySQL: `LOAD DATA LOCAL INFILE`, from a temporary file; the
+          driver must allow it, for example with `local_infile=1` in the
+          connection URL for PyMySQL, or the rows are inserted with
+          `Insert Rows` instead,
+        - SQLite: `executemany` of `chunk_size` rows at a time, with
+          `PRAGMA synchronous = OFF` while loading (unless a transaction,
+          such as the one of `Enable Test Isolation`, is in progress),
+        - other databases: `Insert Rows`, `chunk_size` rows at a time.
+        The number of rows loaded per second is logged.
+
+        Examples:
+        | Load Table From File | person | ${CURDIR}${/}person.csv |
+        | ${rows} = | Load Table From File | event | ${CURDIR}${/}events.jsonl.gz | schema_name=audit |
+        | Load Table From File | person | ${CURDIR}${/}person.json | columns=${columns} | alias=reporting |
+        """
+        format, _ = file_format(path, format)
+        chunk_size = int(chunk_size)
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive number, got {0}".format(chunk_size))
+        started = time.time()
+        if format == 'csv':
+            file_columns, source = read_csv(path)
+        elif format == 'parquet':
+            file_columns, source = read_parquet(path, chunk_size)
+        else:
+            file_columns, source = read_json(path, lines=format == 'jsonl')
+        try:
+            first_row = next(source, None)
+            if columns is None:
+                if file_columns:
+                    columns = file_columns
+                elif isinstance(first_row, dict):
+                    columns = list(first_row)
+                else:
+                    connection = self._get_connection(alias)
+                    columns = [column['name'] for column in
+                               self._schema_cache.columns(connection.engine, tableName, schema_name)]
+            columns = list(columns)
+            rows = aligned_rows(file_columns, _prepended(first_row, source), columns, path, load_value)
+            loaded = self._load_rows(tableName, columns, rows, chunk_size, schema_name, alias)
+        finally:
+            source.close()
+        elapsed = time.time() - started
+        logger.info("Loaded {0:,} rows into {1} in {2:.3f} seconds ({3:,.0f} rows/s)".format(
+            loaded, tableName, elapsed, loaded / elapsed if elapsed > 0 else 0))
+        return loaded
+
+    def _load_rows(self, tableName, columns, rows, chunk_size, schema_name, alias):
+        connection = self._get_connection(alias)
+        loader = _LOADERS.get(connection.dialect.name)
+        if loader is not None:
+            preparer = connection.dialect.identifier_preparer
+            table = preparer.format_table(sqlalchemy.Table(tableName, sqlalchemy.MetaData(), schema=schema_name))
+            loaded = loader(connection, table, [preparer.quote(column) for column in columns], rows, chunk_size)
+            if loaded is not None:
+                if self._result_cache is not None:
+                    self._result_cache.invalidate_table(tableName)
+                return loaded
+        return self.insert_rows(tableName, rows, columns, chunk_size, schema_name, alias)
+
+
+def _prepended(first_row, rows):
+    if first_row is not None:
+        yield first_row
+    for row in rows:
+        yield row
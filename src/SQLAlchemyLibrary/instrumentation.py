@@ -0,0 +1,169 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import csv
+import io
+import json
+import math
+import threading
+import time
+
+from robot.api import logger
+
+from SQLAlchemyLibrary.lazy_import import LazyModule
+
+sqlalchemy = LazyModule('sqlalchemy')
+
+REPORT_COLUMNS = ['statement', 'calls', 'total_seconds', 'mean_seconds', 'p95_seconds',
+                  'max_seconds', 'execute_seconds', 'rows', 'keywords', 'tests']
+REPORT_ORDERS = {'total': 'total_seconds', 'p95': 'p95_seconds'}
+_CONTEXT_KEY = 'robot_statement_timing'
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of `values`.
+
+    >>> percentile([5, 1, 4, 2, 3], 0.95), percentile([1, 2, 3, 4], 0.5)
+    (5, 2)
+    """
+    ordered = sorted(values)
+    return ordered[max(int(math.ceil(fraction * len(ordered))) - 1, 0)]
+
+
+class StatementStats(object):
+    """
+    Aggregated timings of one SQL statement.
+    """
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.durations = []
+        self.execute_seconds = 0.0
+        self.rows = 0
+        self.keywords = set()
+        self.tests = set()
+
+    def as_dict(self):
+        total = sum(self.durations)
+        return {
+            'statement': self.statement,
+            'calls': len(self.durations),
+            'total_seconds': round(total, 6),
+            'mean_seconds': round(total / len(self.durations), 6),
+            'p95_seconds': round(percentile(self.durations, 0.95), 6),
+            'max_seconds': round(max(self.durations), 6),
+            'execute_seconds': round(self.execute_seconds, 6),
+            'rows': self.rows,
+            'keywords': sorted(self.keywords),
+            'tests': sorted(self.tests),
+        }
+
+
+class StatementTimer(object):
+    """
+    Times every statement run on the engines it is attached to,
+    using SQLAlchemy's before/after_cursor_execute events.
+
+    For each execution it records the time the cursor took to execute
+    (roughly the time to the first row) and, when the library reports it
+    through `add_fetch()`, the time spent fetching and the number of rows.
+    The keyword and test running the statement are read from the `keyword`
+    and `test` attributes of `context` (the library listener). Statements
+    may be run by several threads at once (see `Run Queries Concurrently`),
+    so the timings are updated under a lock.
+    """
+
+    def __init__(self, slow_query_threshold=None, context=None):
+        self.slow_query_threshold = slow_query_threshold
+        self.context = context
+        self._stats = {}
+        self._engines = set()
+        self._lock = threading.Lock()
+
+    def attach(self, engine):
+        if engine in self._engines:
+            return
+        sqlalchemy.event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        sqlalchemy.event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._engines.add(engine)
+
+    def detach_all(self):
+        for engine in self._engines:
+            sqlalchemy.event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+            sqlalchemy.event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._engines.clear()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info[_CONTEXT_KEY] = time.time()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop(_CONTEXT_KEY, None)
+        if started is None:
+            return
+        elapsed = time.time() - started
+        keyword = getattr(self.context, 'keyword', None)
+        test = getattr(self.context, 'test', None)
+        with self._lock:
+            stats = self._stats.get(statement)
+            if stats is None:
+                stats = self._stats[statement] = StatementStats(statement)
+            stats.durations.append(elapsed)
+            stats.execute_seconds += elapsed
+            if keyword:
+                stats.keywords.add(keyword)
+            if test:
+                stats.tests.add(test)
+        conn.info[_CONTEXT_KEY + '_last'] = stats
+        if self.slow_query_threshold is not None and elapsed >= self.slow_query_threshold:
+            logger.warn("Slow query ({0:.3f} s{1}): {2}".format(
+                elapsed, " in '{0}'".format(test) if test else "", statement))
+
+    def add_fetch(self, connection, rows, seconds):
+        """
+        Adds the fetch time and row count of the last statement run on `connection`.
+        """
+        stats = connection.info.pop(_CONTEXT_KEY + '_last', None)
+        if stats is not None:
+            with self._lock:
+                stats.durations[-1] += seconds
+                stats.rows += rows
+
+    def report(self, order='total'):
+        """
+        Returns the aggregated timings, slowest first by `order`: `total`
+        time or `p95` (95th percentile) time.
+        """
+        try:
+            key = REPORT_ORDERS[order.lower()]
+        except KeyError:
+            raise ValueError("order must be one of {0}, got '{1}'".format(
+                ", ".join(sorted(REPORT_ORDERS)), order))
+        with self._lock:
+            rows = [stats.as_dict() for stats in self._stats.values()]
+        return sorted(rows, key=lambda row: row[key], reverse=True)
+
+    def write_report(self, path, order='total'):
+        report = self.report(order)
+        if path.lower().endswith('.csv'):
+            with io.open(path, 'w', newline='', encoding='utf-8') as output:
+                writer = csv.DictWriter(output, REPORT_COLUMNS)
+                writer.writeheader()
+                for row in report:
+                    row = dict(row, keywords=' | '.join(row['keywords']), tests=' | '.join(row['tests']))
+                    writer.writerow(row)
+        else:
+            with io.open(path, 'w', encoding='utf-8') as output:
+                output.write(json.dumps({'statements': report}, indent=2, ensure_ascii=False))
+        return len(report)
@@ -0,0 +1,48 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import importlib
+
+
+class LazyModule(object):
+    """
+    Stands for the module `name`, which is only imported when one of its
+    attributes is first used. Importing the library then stays cheap for
+    runs that never reach the database, such as libdoc or dry runs.
+
+    >>> colorsys = LazyModule('colorsys')
+    >>> 'colorsys' in repr(colorsys), colorsys.rgb_to_hsv(0.0, 0.0, 0.0)
+    (True, (0.0, 0.0, 0.0))
+    """
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+
+    def __getattr__(self, attribute):
+        if attribute.startswith('__'):
+            # Introspection (by doctest, copy or pickle) imports nothing.
+            raise AttributeError(attribute)
+        module = importlib.import_module(self._lazy_name)
+        # Later lookups find the attributes directly; submodules imported
+        # afterwards still come through here.
+        self.__dict__.update(module.__dict__)
+        if not hasattr(module, attribute):
+            try:
+                importlib.import_module('{0}.{1}'.format(self._lazy_name, attribute))
+            except ImportError:
+                pass
+        return getattr(module, attribute)
+
+    def __repr__(self):
+        return "<lazily imported module '{0}'>".format(self._lazy_name)
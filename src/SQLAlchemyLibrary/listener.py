@@ -0,0 +1,54 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+class LibraryListener(object):
+    """
+    Robot Framework listener registered by the library itself.
+
+    It keeps track of the running test and keyword (for the statement
+    timer), begins and rolls back the transaction of each test when test
+    isolation is enabled, and writes the statement timing report and drops
+    the databases of pabot workers when the run ends.
+    """
+
+    ROBOT_LISTENER_API_VERSION = 2
+
+    def __init__(self, library):
+        self._library = library
+        self._keywords = []
+        self.test = None
+
+    @property
+    def keyword(self):
+        return self._keywords[-1] if self._keywords else None
+
+    def start_test(self, name, attrs):
+        self.test = attrs['longname']
+        self._library._begin_test_isolation()
+
+    def end_test(self, name, attrs):
+        self._library._end_test_isolation()
+        self.test = None
+
+    def start_keyword(self, name, attrs):
+        self._keywords.append(name)
+
+    def end_keyword(self, name, attrs):
+        if self._keywords:
+            self._keywords.pop()
+
+    def close(self):
+        self._library._write_statement_timing_report_on_close()
+        self._library._close_worker_databases()
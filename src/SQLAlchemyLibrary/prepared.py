@@ -0,0 +1,87 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import re
+
+# The bind parameters of SQLAlchemy's text(): ':name', but not '::' casts or '\:' escapes.
+_BIND_PARAMETER = re.compile(r'(?<![:\w\\]):(\w+)(?!:)', re.UNICODE)
+_ORDER_BY = re.compile(r'\border\s+by\b', re.IGNORECASE)
+BATCH_INDEX = 'robot_batch_index'
+
+
+def bind_names(sql):
+    """
+    Returns the names of the bind parameters of `sql`, in the order they
+    first appear.
+
+    >>> bind_names("SELECT * FROM t WHERE a = :a AND b::text = :b OR a = :a AND c = '\\\\:c'")
+    ['a', 'b']
+    """
+    names = []
+    for name in _BIND_PARAMETER.findall(sql):
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def positional_statement(sql):
+    """
+    Returns `sql` with its bind parameters numbered `$1`, `$2`... as in
+    PostgreSQL's PREPARE, and the names of the parameters in that order.
+
+    >>> positional_statement("SELECT * FROM t WHERE a = :a AND b = :b OR a = :a")
+    ('SELECT * FROM t WHERE a = $1 AND b = $2 OR a = $1', ['a', 'b'])
+    """
+    names = bind_names(sql)
+    return _BIND_PARAMETER.sub(lambda match: '${0}'.format(names.index(match.group(1)) + 1), sql), names
+
+
+def batch_statement(sql, count):
+    """
+    Returns one statement that runs the query `sql` for `count` sets of
+    bind parameters, as a UNION ALL of its copies. Each copy has its bind
+    parameters renamed with the `batch_parameter` of its index and numbers
+    its rows in the first column.
+
+    >>> print(batch_statement('SELECT name FROM person WHERE id = :id', 2))
+    SELECT 0 AS robot_batch_index, robot_batch.* FROM (SELECT name FROM person WHERE id = :id__robot0) robot_batch UNION ALL SELECT 1 AS robot_batch_index, robot_batch.* FROM (SELECT name FROM person WHERE id = :id__robot1) robot_batch
+    """
+    return ' UNION ALL '.join(
+        'SELECT {0} AS {1}, robot_batch.* FROM ({2}) robot_batch'.format(
+            index, BATCH_INDEX, _BIND_PARAMETER.sub(lambda match: ':' + batch_parameter(match.group(1), index), sql))
+        for index in range(count))
+
+
+def batch_parameter(name, index):
+    return '{0}__robot{1}'.format(name, index)
+
+
+class PreparedQuery(object):
+    """
+    A statement prepared by `Prepare Query`, to be run by `Execute
+    Prepared` and `Execute Prepared Many` on the connection of `alias`.
+
+    Queries (statements that `returns_rows`) without ORDER BY can be
+    batched: their rows have no order that a UNION ALL could lose.
+    """
+
+    def __init__(self, sql, alias, returns_rows):
+        self.sql = sql
+        self.alias = alias
+        self.bind_names = bind_names(sql)
+        self.returns_rows = returns_rows
+        self.batchable = returns_rows and not _ORDER_BY.search(sql)
+
+    def __repr__(self):
+        return 'PreparedQuery({0!r})'.format(self.sql)
@@ -12,8 +12,30 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-from robot.libraries.BuiltIn import BuiltIn
+import re
+import time
+
 from robot.api import logger
+from robot.utils import timestr_to_secs
+
+from SQLAlchemyLibrary.columnar import ColumnBuilder, column_statistics, column_values
+from SQLAlchemyLibrary.connection_manager import is_memory_database, transaction
+from SQLAlchemyLibrary.lazy_import import LazyModule
+from SQLAlchemyLibrary.prepared import (PreparedQuery, batch_parameter, batch_statement,
+                                        positional_statement)
+from SQLAlchemyLibrary.query_plan import explain_plan, explain_statement, format_plan
+from SQLAlchemyLibrary.rendering import ResultRenderer, log_lazily
+from SQLAlchemyLibrary.result_cache import ResultCache, is_cacheable
+from SQLAlchemyLibrary.schema_cache import deletion_order, is_ddl
+from SQLAlchemyLibrary.sql_tokenizer import read_chunks, split_sql_statements
+from SQLAlchemyLibrary.statement_cache import CachedStatement, StatementCache
+
+futures = LazyModule('concurrent.futures')
+robot_builtin = LazyModule('robot.libraries.BuiltIn')
+sqlalchemy = LazyModule('sqlalchemy')
+
+_WRAPPABLE_STATEMENT = re.compile(r'^\s*(select|with)\b', re.IGNORECASE)
+_SERVER_PREPARED = 'robot_prepared_statements'
 
 
 class Query(object):
@@ -21,7 +43,17 @@ class Query(object):
     Query handles all the querying done by the Database Library.
     """
 
-    def query(self, selectStatement, **named_args):
+    def __init__(self, statement_cache_size=500, renderer=None):
+        """
+        Initializes the cache of parsed SQL statements and the renderer
+        of results in logs and failure messages.
+        The query result cache is off until `Enable Query Cache`.
+        """
+        self._statement_cache = StatementCache(statement_cache_size)
+        self._result_cache = None
+        self._renderer = renderer or ResultRenderer()
+
+    def query(self, selectStatement, alias=None, **named_args):
         """
         Uses the input `selectStatement` to query for the values that
         will be returned as a list of tuples.
@@ -50,18 +82,248 @@ class Query(object):
 
         And get the following
         See, Franz Allan
+
+        Like every query and assertion keyword, `Query` runs on the current
+        connection unless it is given the `alias` of another one:
+        | ${queryResults} | Query | SELECT first_name FROM person | alias=reports |
         """
         logger.debug("Running query: {query}".format(query=selectStatement))
         logger.debug("Query parameters: {named_args}".format(named_args=named_args))
-        with self._dbconnection.begin():
+        connection = self._get_connection(alias)
+        cache_key = None
+        if self._result_cache is not None and is_cacheable(selectStatement):
+            cache_key = self._result_cache.key(connection.engine, selectStatement, named_args)
+            rows = self._result_cache.get(cache_key)
+            if rows is not None:
+                logger.info("{0}\nUsing a cached result. Query cache: {1}".format(
+                    selectStatement, self._result_cache.statistics()))
+                return list(rows)
+        with transaction(connection):
             logger.info(selectStatement)
-            return self._dbconnection.execute(selectStatement, **named_args).fetchall()
+            result = self._execute(connection, selectStatement, named_args)
+            fetch_started = time.time()
+            rows = result.fetchall()
+            if self._statement_timer is not None:
+                self._statement_timer.add_fetch(connection, len(rows), time.time() - fetch_started)
+        if cache_key is not None:
+            # A copy, so that tests changing the returned list do not change the cache.
+            self._result_cache.put(cache_key, tuple(rows))
+            logger.debug("Cached the result. Query cache: {0}".format(self._result_cache.statistics()))
+        log_lazily('DEBUG', lambda: "Query returned {0:,} rows: {1}".format(len(rows), self._renderer.render(rows)))
+        return rows
+
+    def iterate_query(self, selectStatement, chunk_size=1000, alias=None, **named_args):
+        """
+        Uses the input `selectStatement` to query for rows, like `Query`,
+        but returns a lazy iterator instead of a list.
+
+        Rows are streamed from a server-side cursor (where the driver
+        supports one) and fetched `chunk_size` rows at a time, so only one
+        chunk is held in memory no matter how big the result is.
+        The statement is run (and fails) when the keyword is called, and
+        the cursor is closed once the iterator is exhausted, or when it is
+        closed or garbage-collected early (for example because the test
+        failed half-way through the loop).
+
+        The rows are read on a connection of their own, in a transaction
+        that is only used for reading them, so statements run on the
+        connection meanwhile are not affected by the iterator. On SQLite,
+        and when the connection is in a transaction (such as the one of
+        test isolation), whose uncommitted rows the query has to see, they
+        are read on the connection itself, outside of any transaction of
+        their own.
+
+        NOTE: `chunk_size` is reserved and cannot be used as a bind parameter.
+
+        For example, given we have a table `person` with the following data:
+        | id | first_name  | last_name |
+        |  1 | Franz Allan | See       |
+        |  2 | Jerry       | Schneider |
+
+        When you do the following:
+        | ${rows} | Iterate Query | SELECT first_name FROM person | chunk_size=500 |
+        | FOR | ${row} | IN | @{rows} |
+        | | Log | ${row[0]} |
+        | END |
+
+        You will get the following:
+        Franz Allan
+        Jerry
+
+        Python keywords that accept an iterable can consume `${rows}`
+        chunk by chunk without ever building the whole list.
+        """
+        chunk_size = int(chunk_size)
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive number, got {0}".format(chunk_size))
+        logger.debug("Streaming query: {query}".format(query=selectStatement))
+        logger.debug("Query parameters: {named_args}".format(named_args=named_args))
+        connection = self._get_connection(alias)
+        # An SQLite reader would lock out the writers of other connections.
+        if connection.in_transaction() or connection.dialect.name == 'sqlite':
+            streaming, close = connection, lambda: None
+        else:
+            streaming = connection.engine.connect()
+            streaming.begin()
+            close = streaming.close
+        try:
+            result = self._execute(streaming.execution_options(stream_results=True), selectStatement, named_args)
+        except:
+            close()
+            raise
+        rows = self._streamed_rows(result, chunk_size, close)
+        # Enter the try block, so that closing the iterator before it is
+        # first used also closes the cursor.
+        next(rows)
+        return rows
+
+    def _streamed_rows(self, result, chunk_size, close):
+        try:
+            yield
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            try:
+                result.close()
+            finally:
+                close()
+
+    def _iterate_rows(self, connection, selectStatement, chunk_size, named_args, columns=None,
+                      own_transaction=True):
+        """
+        Yields the rows of `selectStatement` a chunk at a time. When a
+        `columns` list is given, the column names are added to it as soon
+        as the statement has run, before the first row is yielded.
+        """
+        chunks = self._iterate_chunks(connection, selectStatement, chunk_size, named_args, columns,
+                                      own_transaction=own_transaction)
+        try:
+            for rows in chunks:
+                for row in rows:
+                    yield row
+        finally:
+            chunks.close()
+
+    def _iterate_chunks(self, connection, selectStatement, chunk_size, named_args, columns=None, raw=False,
+                        own_transaction=True):
+        """
+        Yields the rows of `selectStatement` in lists of up to `chunk_size`
+        rows, streamed from a server-side cursor in a transaction (or
+        SAVEPOINT) of their own, unless `own_transaction` is false. With
+        `raw`, the rows are the driver's own tuples, read straight from the
+        DBAPI cursor without building SQLAlchemy row objects.
+        """
+        streamed = transaction(connection) if own_transaction else None
+        try:
+            # Branch the connection after begin() so the branch shares the transaction.
+            streaming = connection.execution_options(stream_results=True)
+            result = self._execute(streaming, selectStatement, named_args)
+            if columns is not None:
+                columns.extend(result.keys())
+            fetchmany = result.cursor.fetchmany if raw else result.fetchmany
+            try:
+                while True:
+                    rows = fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                result.close()
+        except:
+            if streamed is not None:
+                streamed.rollback()
+            raise
+        else:
+            if streamed is not None:
+                streamed.commit()
+
+    def query_as_columns(self, selectStatement, format='columns', chunk_size=10000, alias=None, **named_args):
+        """
+        Uses the input `selectStatement` to query for values, like `Query`,
+        but returns them by column instead of by row.
+
+        The `format` of the result can be:
+        | columns   | a dictionary of column name to list of values (the default) |
+        | numpy     | a dictionary of column name to NumPy array (needs `numpy`) |
+        | arrow     | a pyarrow Table (needs `pyarrow`) |
+        | dataframe | a pandas DataFrame (needs `pandas`, and uses `pyarrow` when installed) |
+
+        The rows are read from the cursor `chunk_size` at a time, as the
+        database driver returns them, and each chunk is turned into
+        columns right away, so no row objects are ever built. Values are
+        those of the driver, without conversions of SQLAlchemy types.
+
+        `Get Column Statistics` computes the usual aggregates of one of the
+        columns, vectorized for NumPy, Arrow and pandas columns.
+
+        NOTE: `format` and `chunk_size` are reserved and cannot be used as
+        bind parameters.
+
+        For example, given we have a table `person` with the following data:
+        | id | first_name  | last_name |
+        |  1 | Franz Allan | See       |
+        |  2 | Jerry       | Schneider |
 
-    def row_count(self, selectStatement, **named_args):
+        When you do the following:
+        | ${columns} | Query As Columns | SELECT id, first_name FROM person |
+        | Log | ${columns['first_name']} |
+
+        You will get the following:
+        ['Franz Allan', 'Jerry']
+
+        And with pyarrow installed:
+        | ${table} | Query As Columns | SELECT id, amount FROM payment | format=arrow |
+        """
+        chunk_size = int(chunk_size)
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive number, got {0}".format(chunk_size))
+        logger.debug("Running query: {query}".format(query=selectStatement))
+        logger.debug("Query parameters: {named_args}".format(named_args=named_args))
+        columns = []
+        chunks = self._iterate_chunks(self._get_connection(alias), selectStatement, chunk_size,
+                                      named_args, columns, raw=True)
+        builder = None
+        try:
+            for rows in chunks:
+                if builder is None:
+                    builder = ColumnBuilder(columns, format)
+                builder.add(rows)
+        finally:
+            chunks.close()
+        if builder is None:
+            builder = ColumnBuilder(columns, format)
+        logger.info("Read {0:,} rows into {1} columns".format(builder.rows, len(columns)))
+        return builder.result()
+
+    def get_column_statistics(self, columns, column_name):
+        """
+        Returns a dictionary with the `count` of values, the number of
+        `nulls`, the number of `distinct` values, the `min`, the `max` and,
+        for numbers, the `sum` of one column of `columns`, as returned by
+        `Query As Columns` in any format.
+
+        NumPy, Arrow and pandas columns are computed vectorized.
+
+        For example:
+        | ${columns} | Query As Columns | SELECT amount FROM payment | format=numpy |
+        | ${stats} | Get Column Statistics | ${columns} | amount |
+        | Should Be Equal As Numbers | ${stats['sum']} | 1250.5 |
+        | Should Be Equal As Integers | ${stats['nulls']} | 0 |
+        """
+        return dict(column_statistics(column_values(columns, column_name)))
+
+    def row_count(self, selectStatement, alias=None, **named_args):
         """
         Uses the input `selectStatement` to query the database and returns
         the number of rows from the query.
 
+        SELECT statements are wrapped in `SELECT COUNT(*) FROM (...)`, so only
+        the count is transferred from the database, not the rows themselves.
+
         For example, given we have a table `person` with the following data:
         | id | first_name  | last_name |
         |  1 | Franz Allan | See       |
@@ -81,9 +343,74 @@ class Query(object):
         And get the following
         1
         """
-        return len(self.query(selectStatement, **named_args))
+        return self._count_rows(selectStatement, alias=alias, **named_args)
 
-    def description(self, selectStatement, **named_args):
+    def _as_subquery(self, selectStatement):
+        """
+        Wraps `selectStatement` so it can be used in a FROM clause,
+        or returns None if it does not look like a plain SELECT.
+
+        >>> subquery = Query()._as_subquery('SELECT id FROM person;')
+        >>> print(sqlalchemy.select([sqlalchemy.func.count()]).select_from(subquery))
+        SELECT count(*) AS count_1 
+        FROM (SELECT id FROM person) AS robot_subquery
+        >>> Query()._as_subquery('PRAGMA table_info(person)') is None
+        True
+        """
+        statement = selectStatement.strip().rstrip(';').strip()
+        if not _WRAPPABLE_STATEMENT.match(statement):
+            return None
+        return sqlalchemy.text(statement).columns().alias('robot_subquery')
+
+    def _count_rows(self, selectStatement, limit=None, alias=None, **named_args):
+        """
+        Counts the rows `selectStatement` would return, stopping at `limit`
+        when it is given, without fetching the rows themselves.
+
+        Falls back to fetching the full result when the statement cannot
+        be wrapped in `SELECT COUNT(*) FROM (...)`.
+        """
+        if _WRAPPABLE_STATEMENT.match(selectStatement):
+            connection = self._get_connection(alias)
+            statement = self._statement_cache.get(
+                    ('count', selectStatement, limit, connection.dialect.name),
+                    lambda: self._count_statement(selectStatement, limit))
+            try:
+                with transaction(connection):
+                    logger.info(selectStatement)
+                    return self._execute(connection, statement, named_args).scalar()
+            except sqlalchemy.exc.DBAPIError as e:
+                logger.debug("Could not count rows in the database, fetching them instead: {0}".format(e))
+        num_rows = len(self.query(selectStatement, alias=alias, **named_args))
+        if limit is not None:
+            num_rows = min(num_rows, limit)
+        return num_rows
+
+    def _count_statement(self, selectStatement, limit=None):
+        subquery = self._as_subquery(selectStatement)
+        if limit is not None:
+            subquery = sqlalchemy.select([sqlalchemy.literal_column('1')]) \
+                .select_from(subquery).limit(limit).alias('robot_limited')
+        return sqlalchemy.select([sqlalchemy.func.count()]).select_from(subquery)
+
+    def _sample_rows(self, selectStatement, limit, alias=None, **named_args):
+        """
+        Returns at most `limit` rows of the result of `selectStatement`.
+        """
+        if _WRAPPABLE_STATEMENT.match(selectStatement):
+            connection = self._get_connection(alias)
+            statement = self._statement_cache.get(
+                    ('sample', selectStatement, limit, connection.dialect.name),
+                    lambda: sqlalchemy.select([sqlalchemy.literal_column('*')])
+                        .select_from(self._as_subquery(selectStatement)).limit(limit))
+            try:
+                with transaction(connection):
+                    return self._execute(connection, statement, named_args).fetchall()
+            except sqlalchemy.exc.DBAPIError as e:
+                logger.debug("Could not limit rows in the database, fetching them instead: {0}".format(e))
+        return self.query(selectStatement, alias=alias, **named_args)[:limit]
+
+    def description(self, selectStatement, alias=None, **named_args):
         """
         Uses the input `selectStatement` to query a table in the db which
         will be used to determine the description.
@@ -101,10 +428,48 @@ class Query(object):
         [Column(name='first_name', type_code=1043, display_size=None, internal_size=255, precision=None, scale=None, null_ok=None)]
         [Column(name='last_name', type_code=1043, display_size=None, internal_size=255, precision=None, scale=None, null_ok=None)]
         """
-        with self._dbconnection.begin():
-            return self._dbconnection.execute(selectStatement, **named_args)._cursor_description()
+        connection = self._get_connection(alias)
+        with transaction(connection):
+            return self._execute(connection, selectStatement, named_args)._cursor_description()
+
+    def explain_query(self, selectStatement, alias=None, **named_args):
+        """
+        Returns the plan the database would run `selectStatement` with,
+        given the same named bind arguments as `Query`, without running it.
+
+        The plan is asked for with `EXPLAIN (FORMAT JSON)` on PostgreSQL,
+        `EXPLAIN FORMAT=JSON` on MySQL and `EXPLAIN QUERY PLAN` on SQLite,
+        and returned as a tree of dictionaries, the same on every database,
+        with the keys:
+        - `operation`: the step, such as `Seq Scan` (PostgreSQL), `ref`
+          (the access type on MySQL) or `SEARCH` (SQLite)
+        - `table`, `alias` and `index`: the table the step reads, if any,
+          the name the query gives it (the table name itself when it has no
+          alias) and the index it reads
+        - `full_scan`: whether the step reads every row of the table,
+          through the table itself or a whole index
+        - `cost` and `rows`: the estimates of the database, None on SQLite
+        - `detail`: the condition of the step, if any
+        - `children`: the steps it gets its rows from
+        The plan is also logged as indented text.
+
+        Example:
+        | ${plan} | Explain Query | SELECT id FROM person WHERE last_name = :name | name=See |
+        | Should Be Equal | ${plan['children'][0]['operation']} | SEARCH |
+
+        See also `Query Should Use Index`, `Query Should Not Full Scan` and
+        `Query Cost Should Be Below`.
+        """
+        connection = self._get_connection(alias)
+        dialect = connection.dialect.name
+        statement = explain_statement(dialect, selectStatement)
+        with transaction(connection):
+            rows = self._execute(connection, statement, named_args).fetchall()
+        plan = explain_plan(dialect, rows, selectStatement)
+        logger.info("Plan of {0}\n{1}".format(selectStatement, format_plan(plan)))
+        return plan
 
-    def delete_all_rows_from_table(self, tableName):
+    def delete_all_rows_from_table(self, tableName, alias=None):
         """
         Delete all the rows within a given table.
 
@@ -120,21 +485,115 @@ class Query(object):
         | Delete All Rows From Table | first_name | # FAIL |
         """
         selectStatement = ("DELETE FROM {0}".format(tableName))
-        self.execute_sql_string(selectStatement)
+        self.execute_sql_string(selectStatement, alias=alias)
+
+    def reset_tables(self, *tables, **options):
+        """
+        Deletes all the rows of the given `tables`, or of all the tables of
+        the schema `schema_name` (the default schema unless given) when no
+        table is given, with the cheapest way the database offers:
+        - PostgreSQL: one `TRUNCATE ... RESTART IDENTITY CASCADE` of all
+          the tables, which also empties the tables referencing them and
+          restarts their sequences.
+        - MySQL: `TRUNCATE` of each table with foreign key checks off,
+          which also restarts the auto-increment counters. TRUNCATE cannot
+          be rolled back, so inside a transaction (such as the one of
+          `Enable Test Isolation`) rows are deleted instead.
+        - SQLite: `DELETE` from each table, with foreign key checks deferred
+          to the end of the transaction, and the restart of their
+          `AUTOINCREMENT` counters in `sqlite_sequence`.
+        - Other databases: `DELETE` from each table.
+
+        Rows are deleted from tables referencing others (by their reflected
+        foreign keys) first, and everything runs in a single transaction
+        (except TRUNCATE on MySQL). The time taken by each table is logged.
+
+        NOTE: `schema_name` and `alias` are reserved and cannot be table names.
+
+        Examples:
+        | Reset Tables | order_line | orders | customer |
+        | Reset Tables | schema_name=staging | alias=warehouse |
+        """
+        schema_name = options.pop('schema_name', None)
+        alias = options.pop('alias', None)
+        if options:
+            raise ValueError("Unknown options: {0}".format(", ".join(sorted(options))))
+        connection = self._get_connection(alias)
+        engine = connection.engine
+        found = self._schema_cache.find_tables(engine, tables, schema_name)
+        missing = [table for table, name in zip(tables, found) if name is None]
+        if missing:
+            raise ValueError("No such tables: {0}".format(", ".join(missing)))
+        tables = found
+        references = dict((table, [key['referred_table'] for key in
+                                   self._schema_cache.foreign_keys(engine, table, schema_name)])
+                          for table in tables)
+        tables = deletion_order(tables, references)
+        preparer = connection.dialect.identifier_preparer
+        quoted = [preparer.format_table(sqlalchemy.Table(table, sqlalchemy.MetaData(), schema=schema_name))
+                  for table in tables]
+        started = time.time()
+        timings = []
+        dialect = connection.dialect.name
+        if not tables:
+            pass
+        elif dialect == 'mysql' and not connection.in_transaction():
+            connection.execute("SET FOREIGN_KEY_CHECKS = 0")
+            try:
+                for table, name in zip(tables, quoted):
+                    timings.append((table, self._timed(connection, "TRUNCATE TABLE {0}".format(name))))
+            finally:
+                connection.execute("SET FOREIGN_KEY_CHECKS = 1")
+        elif dialect == 'postgresql':
+            with transaction(connection):
+                timings.append((", ".join(tables), self._timed(
+                    connection, "TRUNCATE TABLE {0} RESTART IDENTITY CASCADE".format(", ".join(quoted)))))
+        else:
+            with transaction(connection):
+                if dialect == 'sqlite':
+                    connection.execute("PRAGMA defer_foreign_keys = ON")
+                elif dialect == 'mysql':
+                    connection.execute("SET FOREIGN_KEY_CHECKS = 0")
+                try:
+                    for table, name in zip(tables, quoted):
+                        timings.append((table, self._timed(connection, "DELETE FROM {0}".format(name))))
+                finally:
+                    if dialect == 'mysql':
+                        connection.execute("SET FOREIGN_KEY_CHECKS = 1")
+                if dialect == 'sqlite':
+                    self._reset_sqlite_sequence(connection, tables, schema_name)
+        if self._result_cache is not None:
+            for table in tables:
+                self._result_cache.invalidate_table(table)
+        logger.info("Reset {0} tables in {1:.3f} seconds:\n{2}".format(
+            len(tables), time.time() - started,
+            "\n".join("{0}: {1:.3f} s".format(table, seconds) for table, seconds in timings)))
+
+    def _timed(self, connection, statement):
+        started = time.time()
+        connection.execute(statement)
+        return time.time() - started
+
+    def _reset_sqlite_sequence(self, connection, tables, schema_name):
+        """
+        Restarts the AUTOINCREMENT counters of `tables`, kept in the
+        `sqlite_sequence` table once a table uses AUTOINCREMENT.
+        """
+        prefix = connection.dialect.identifier_preparer.quote(schema_name) + '.' if schema_name else ''
+        if connection.execute("SELECT count(*) FROM {0}sqlite_master WHERE name = 'sqlite_sequence'".format(
+                prefix)).scalar():
+            connection.execute(sqlalchemy.text(
+                "DELETE FROM {0}sqlite_sequence WHERE name IN :tables".format(prefix)).bindparams(
+                sqlalchemy.bindparam('tables', expanding=True)), tables=tables)
 
     def is_comment(self, sql_line):
         sql_line = sql_line.strip()
         return sql_line.startswith('--') or sql_line.startswith('#')
 
-    def _remove_comments(self, sql):
-        lines = [line for line in sql.split('\n') if not self.is_comment(line)]
-        lines = [line.strip() for line in lines if not len(line.strip()) == 0]
-        return '\n'.join(lines)
-
     def _split_sql_script(self, sql):
         """
         Splits an SQL script into semicolon (';')-separated queries,
-        ignoring any line that starts wih '--' or '#'.
+        ignoring comments and any line that starts wih '#'.
 
         >>> Query()._split_sql_script('select name;')
         ['select name']
@@ -146,13 +605,12 @@ class Query(object):
         ... # This is also a comment
         ... select lname;''')
         ['select name', 'select lname']
+        >>> Query()._split_sql_script("insert into t values ('a;b');")
+        ["insert into t values ('a;b')"]
         """
-        lines = list()
-        queries = sql.split(';')
-        queries = [self._remove_comments(q) for q in queries if len(q.strip()) > 0]
-        return queries
+        return list(split_sql_statements([sql]))
 
-    def execute_sql_script(self, sqlScriptFileName, **named_args):
+    def execute_sql_script(self, sqlScriptFileName, delimiter=';', alias=None, **named_args):
         """
         Executes the content of the `sqlScriptFileName` as SQL commands.
         Useful for setting the database to a known state before running
@@ -203,12 +661,30 @@ class Query(object):
           FROM person_table;
         DELETE
           FROM employee_table
+
+        Semi-colons inside quoted strings, comments, dollar-quoted ($$) bodies
+        and the BEGIN ... END bodies of CREATE TRIGGER/PROCEDURE/FUNCTION
+        statements do not end a command. Another delimiter can be used with
+        the `delimiter` argument, or from within the script with a
+        `DELIMITER` line as in the mysql client:
+        DELIMITER //
+        CREATE PROCEDURE reset_people() BEGIN DELETE FROM person; END//
+        DELIMITER ;
+
+        On MySQL, whose strings may escape quotes with backslashes
+        (`'it\\'s'`), backslashes escape in single-quoted strings; on other
+        databases a backslash is an ordinary character.
+
+        The file is read and executed one command at a time, so even very
+        large scripts run in constant memory.
+
+        NOTE: `delimiter` is reserved and cannot be used as a bind parameter.
         """
         with open(sqlScriptFileName) as sqlScriptFile:
-            queries = self._split_sql_script(sqlScriptFile.read())
-            self._run_query_list(queries, **named_args)
+            queries = split_sql_statements(read_chunks(sqlScriptFile), delimiter, self._backslash_escapes(alias))
+            self._run_query_list(queries, alias=alias, **named_args)
 
-    def execute_sql_string(self, sqlString, **named_args):
+    def execute_sql_string(self, sqlString, delimiter=';', alias=None, **named_args):
         """
         Executes the sqlString as SQL commands.
         Useful to pass arguments to your sql.
@@ -224,31 +700,460 @@ class Query(object):
         You can also use :bind variables in your query:
         | Execute Sql String | SELECT * FROM person WHERE first_name = :fname | fname=${FIRSTNAME} |
 
-        NOTE: This keyword makes no effort to distinguish between semi-colons
-        inside String literals and those separating queries.
+        When named arguments are given and the commands use :bind variables,
+        a colon followed by a name is read as a bind variable, even inside a
+        string literal; write it as `\\:name` to keep it literal. Commands
+        without :bind variables get the arguments in the parameter style of
+        the database driver (such as `%(fname)s` for PostgreSQL), and
+        without named arguments the commands are run as they are.
+
+        Semi-colons inside string literals and comments do not separate
+        commands (see `Execute Sql Script` for the full rules), so this works:
+        | Execute Sql String | UPDATE person SET full_name_semicolon = 'john;doe' WHERE id = 1 |
+        """
+        queries = split_sql_statements([sqlString], delimiter, self._backslash_escapes(alias))
+        self._run_query_list(queries, alias=alias, **named_args)
+
+    def _backslash_escapes(self, alias):
+        return self._get_connection(alias).dialect.name == 'mysql'
+
+    def run_queries_concurrently(self, *statements, **named_args):
+        """
+        Runs the SQL `statements` at the same time, each on a connection of
+        its own taken from the pool and in a transaction of its own, and
+        returns their results in the order of the statements: the rows
+        (as `Query` would return them) of statements returning rows, and
+        None for the others.
+
+        At most `max_workers` (default 8) statements run at once, on as many
+        threads. The time each statement took is logged. When a statement
+        fails, the others are still run to the end and the error of the
+        first failing one is raised.
+
+        Independent queries then only wait on the database, or on a link with
+        high latency, as long as the slowest one instead of all of them
+        together. Statements that change data should not depend on each
+        other, as their order is not known; SQLite lets only one of them
+        write at a time.
+
+        The statements run one after another on the current connection
+        instead when other connections would not see its data: in a
+        transaction (such as the one of `Enable Test Isolation`) and on
+        in-memory SQLite databases.
+
+        NOTE: `max_workers` and `alias` are reserved and cannot be used as
+        bind parameters, which are given to every statement that uses them.
+
+        Example:
+        | @{results} = | Run Queries Concurrently | SELECT count(*) FROM person | SELECT count(*) FROM address | SELECT max(id) FROM orders WHERE status = :status | status=open |
+        | Should Be Equal As Integers | ${results[0][0][0]} | 2 |
+        """
+        max_workers = int(named_args.pop('max_workers', 8))
+        if max_workers < 1:
+            raise ValueError("max_workers must be a positive number, got {0}".format(max_workers))
+        connection = self._get_connection(named_args.pop('alias', None))
+        engine = connection.engine
+        # Parsing goes through the caches, which are only used from this thread.
+        for statement in statements:
+            if self._result_cache is not None:
+                self._result_cache.invalidate_for(statement)
+            if is_ddl(statement):
+                self._schema_cache.invalidate(engine)
+        prepared = [self._statement_cache.text(statement, engine.dialect.name) for statement in statements]
+        started = time.time()
+        if connection.in_transaction() or is_memory_database(engine):
+            logger.info("Running the statements one after another on the current connection, "
+                        "as other connections would not see its data")
+            outcomes = [self._run_timed(connection, statement, named_args) for statement in prepared]
+        else:
+            def run(statement):
+                with engine.connect() as own_connection:
+                    return self._run_timed(own_connection, statement, named_args)
+            pool = futures.ThreadPoolExecutor(max(min(max_workers, len(prepared)), 1))
+            try:
+                outcomes = [future.result() for future in [pool.submit(run, statement) for statement in prepared]]
+            finally:
+                pool.shutdown()
+        lines = []
+        for number, (statement, (rows, error, seconds)) in enumerate(zip(statements, outcomes), 1):
+            outcome = "failed" if error is not None else \
+                "{0:,} rows".format(len(rows)) if rows is not None else "done"
+            lines.append("{0}. {1:.3f} s, {2}: {3}".format(number, seconds, outcome, statement))
+        logger.info("Ran {0} statements in {1:.3f} seconds:\n{2}".format(
+            len(statements), time.time() - started, "\n".join(lines)))
+        for rows, error, seconds in outcomes:
+            if error is not None:
+                raise error
+        return [rows for rows, error, seconds in outcomes]
+
+    def _run_timed(self, connection, statement, named_args):
+        """
+        Runs one statement of `Run Queries Concurrently` and returns its
+        rows (or None), the exception it raised (or None) and its duration.
+        """
+        started = time.time()
+        try:
+            with transaction(connection):
+                result = self._execute(connection, statement, named_args)
+                rows = result.fetchall() if result.returns_rows else None
+            return rows, None, time.time() - started
+        except Exception as error:
+            return None, error, time.time() - started
+
+    def insert_rows(self, tableName, rows, columns=None, chunk_size=1000, schema_name=None, alias=None):
+        """
+        Inserts `rows` into the table `tableName` and returns the number
+        of inserted rows.
+
+        `rows` is a list (or any iterable) of either:
+        - dictionaries mapping column names to values, or
+        - lists of values, in the order given by `columns`. When `columns`
+          is not given, the order of the columns in the table is used.
+
+        The rows are sent to the database `chunk_size` rows at a time
+        with `executemany`, all in a single transaction. Drivers with a
+        faster bulk path can be told to use it when connecting, for example
+        `executemany_mode=values` for psycopg2.
+
+        For example:
+        | ${person1}= | Create Dictionary | id=${1} | first_name=Franz Allan | last_name=See |
+        | ${person2}= | Create Dictionary | id=${2} | first_name=Jerry | last_name=Schneider |
+        | ${rows}= | Create List | ${person1} | ${person2} |
+        | ${count}= | Insert Rows | person | ${rows} |
+
+        Or, with lists of values:
+        | ${row1}= | Create List | ${1} | Franz Allan | See |
+        | ${row2}= | Create List | ${2} | Jerry | Schneider |
+        | ${rows}= | Create List | ${row1} | ${row2} |
+        | Insert Rows | person | ${rows} | columns=${columns} | chunk_size=5000 |
+        """
+        chunk_size = int(chunk_size)
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive number, got {0}".format(chunk_size))
+        rows = iter(rows)
+        try:
+            first_row = next(rows)
+        except StopIteration:
+            logger.info("No rows to insert into {0}".format(tableName))
+            return 0
+        if isinstance(first_row, dict):
+            columns = list(first_row.keys())
+            to_params = lambda row: self._row_as_params(row, columns)
+        else:
+            if columns is None:
+                columns = [c.name for c in self._reflect_table(tableName, schema_name, alias).columns]
+            columns = list(columns)
+            to_params = lambda row: dict(zip(columns, row))
+        table = sqlalchemy.Table(tableName, sqlalchemy.MetaData(),
+                *[sqlalchemy.Column(column) for column in columns], schema=schema_name)
+        statement = table.insert()
+        logger.info("Inserting rows into {0} ({1})".format(tableName, ", ".join(columns)))
+        inserted = 0
+        started = time.time()
+        connection = self._get_connection(alias)
+        with transaction(connection):
+            chunk = [to_params(first_row)]
+            for row in rows:
+                if len(chunk) >= chunk_size:
+                    connection.execute(statement, chunk)
+                    inserted += len(chunk)
+                    chunk = []
+                chunk.append(to_params(row))
+            connection.execute(statement, chunk)
+            inserted += len(chunk)
+        if self._result_cache is not None:
+            self._result_cache.invalidate_table(tableName)
+        elapsed = time.time() - started
+        logger.info("Inserted {0} rows into {1} in {2:.3f} seconds".format(inserted, tableName, elapsed))
+        return inserted
+
+    def _row_as_params(self, row, columns):
+        if len(row) != len(columns) or any(column not in row for column in columns):
+            raise ValueError("Every row must have the same columns as the first one ({0}), "
+                             "got {1}".format(", ".join(columns), ", ".join(row.keys())))
+        return row
+
+    def _reflect_table(self, tableName, schema_name=None, alias=None):
+        return sqlalchemy.Table(tableName, sqlalchemy.MetaData(), schema=schema_name,
+                autoload=True, autoload_with=self._get_engine(alias))
+
+    def prepare_query(self, sqlString, alias=None):
+        """
+        Prepares `sqlString` to be run many times with different bind
+        parameters by `Execute Prepared` and `Execute Prepared Many`, and
+        returns its handle.
+
+        Running a prepared statement skips what `Query` does on every call
+        besides running it: logging, looking up the statement and result
+        caches and filtering the bind parameters. On PostgreSQL the statement
+        is also prepared on the server (with `PREPARE`, once per connection),
+        which then skips parsing and planning it again; statements whose
+        parameter types PostgreSQL cannot infer are run unprepared.
+
+        The handle runs on the connection that is current when it is
+        prepared, or on the connection of `alias`.
+
+        Example:
+        | ${by_id} = | Prepare Query | SELECT name FROM person WHERE id = :id |
+        | ${rows} = | Execute Prepared | ${by_id} | id=${1} |
+        | Should Be Equal | ${rows[0][0]} | Franz Allan |
+        """
+        if alias is None:
+            alias = self._current_alias
+        self._check_alias(alias)
+        if self._result_cache is not None:
+            self._result_cache.invalidate_for(sqlString)
+        return PreparedQuery(sqlString, alias, bool(_WRAPPABLE_STATEMENT.match(sqlString)))
+
+    def execute_prepared(self, handle, **named_args):
+        """
+        Runs the statement of `handle` (see `Prepare Query`) with the bind
+        parameters `named_args`, and returns its rows as `Query` does, or
+        None for a statement returning no rows.
+
+        Example:
+        | ${rows} = | Execute Prepared | ${by_id} | id=${2} |
+        """
+        connection = self._get_connection(handle.alias)
+        with transaction(connection):
+            result = self._execute_prepared_sql(connection, handle.sql, named_args)
+            rows = result.fetchall() if result.returns_rows else None
+        if not handle.returns_rows and self._result_cache is not None:
+            self._result_cache.invalidate_for(handle.sql)
+        log_lazily('DEBUG', lambda: "{0} with {1} returned {2}".format(
+            handle.sql, named_args, self._renderer.render(rows) if rows is not None else None))
+        return rows
+
+    def execute_prepared_many(self, handle, bind_sets, batch_size=100):
+        """
+        Runs the statement of `handle` (see `Prepare Query`) once for each
+        dictionary of bind parameters in `bind_sets`, in one transaction, and
+        returns a list with the rows of each run (or None for statements
+        returning no rows).
+
+        Queries without ORDER BY are run `batch_size` bind sets at a time as
+        one UNION ALL query, which takes one round trip to the database
+        instead of `batch_size`. Other statements returning rows are run one
+        by one, and statements returning no rows (such as INSERT or UPDATE)
+        are sent at once with `executemany`.
+
+        Each bind set adds its parameters to the batched query, so lower
+        `batch_size` for statements with many parameters on databases that
+        limit their number (999 for SQLite before 3.32).
 
-        This will break (use the 'Query' keyword instead):
-        | Execute Sql String | SELECT * FROM person WHERE full_name_semicolon = 'john;doe' |
+        Example:
+        | ${first} = | Create Dictionary | id=${1} |
+        | ${second} = | Create Dictionary | id=${2} |
+        | ${results} = | Execute Prepared Many | ${by_id} | ${{[$first, $second]}} |
+        | Should Be Equal | ${results[1][0][0]} | Jerry |
         """
-        self._run_query_list(sqlString.split(';'), **named_args)
+        batch_size = int(batch_size)
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive number, got {0}".format(batch_size))
+        bind_sets = list(bind_sets)
+        connection = self._get_connection(handle.alias)
+        started = time.time()
+        results = []
+        with transaction(connection):
+            if not handle.returns_rows:
+                statement = self._statement_cache.text(handle.sql, connection.dialect.name)
+                if bind_sets:
+                    connection.execute(statement.statement, [
+                        dict((name, value) for name, value in named_args.items() if name in statement.bind_names)
+                        for named_args in bind_sets])
+                results = [None] * len(bind_sets)
+            elif not handle.batchable:
+                for named_args in bind_sets:
+                    results.append(self._execute_prepared_sql(connection, handle.sql, named_args).fetchall())
+            else:
+                for start in range(0, len(bind_sets), batch_size):
+                    results.extend(self._execute_batch(connection, handle, bind_sets[start:start + batch_size]))
+        if not handle.returns_rows and self._result_cache is not None:
+            self._result_cache.invalidate_for(handle.sql)
+        logger.info("Ran {0} with {1:,} bind sets in {2:.3f} seconds".format(
+            handle.sql, len(bind_sets), time.time() - started))
+        return results
+
+    def _execute_batch(self, connection, handle, bind_sets):
+        params = {}
+        for index, named_args in enumerate(bind_sets):
+            for name in handle.bind_names:
+                if name in named_args:
+                    params[batch_parameter(name, index)] = named_args[name]
+        results = [[] for _ in bind_sets]
+        for row in self._execute_prepared_sql(connection, batch_statement(handle.sql, len(bind_sets)), params):
+            results[row[0]].append(tuple(row)[1:])
+        return results
+
+    def _execute_prepared_sql(self, connection, sql, named_args):
+        """
+        Runs `sql` with `named_args`, as a statement prepared on the server
+        on PostgreSQL and through the statement cache otherwise.
+        """
+        statement = None
+        if connection.dialect.name == 'postgresql':
+            statement = self._server_prepared(connection, sql)
+        if statement is None:
+            statement = self._statement_cache.text(sql, connection.dialect.name)
+        return self._execute(connection, statement, named_args)
+
+    def _server_prepared(self, connection, sql):
+        """
+        Returns the cached `EXECUTE` statement of `sql` on the database
+        session of `connection` (whose `info` lasts as long as the session),
+        running `PREPARE` first if needed, or None if `sql` cannot be
+        prepared.
+        """
+        statements = connection.info.setdefault(_SERVER_PREPARED, {})
+        if sql not in statements:
+            name = 'robot_prepared_{0}'.format(len(statements) + 1)
+            positional, names = positional_statement(sql)
+            try:
+                with transaction(connection):
+                    connection.execute(sqlalchemy.text('PREPARE {0} AS {1}'.format(name, positional)))
+            except sqlalchemy.exc.DBAPIError as error:
+                logger.debug("Running {0} unprepared: {1}".format(sql, error))
+                statements[sql] = None
+            else:
+                execute = 'EXECUTE {0}({1})'.format(name, ', '.join(':' + bind for bind in names)) if names \
+                    else 'EXECUTE {0}'.format(name)
+                statements[sql] = self._statement_cache.text(execute, connection.dialect.name)
+        return statements[sql]
 
     def query_for_single_column(self, selectStatement, *expected_values, **named_args):
-        answer = self.query(selectStatement, **named_args)
+        alias = named_args.pop('alias', None)
+        answer = self.query(selectStatement, alias=alias, **named_args)
         if len(answer) == 0:
             return answer
-        BuiltIn().length_should_be(answer[0], 1,
+        robot_builtin.BuiltIn().length_should_be(answer[0], 1,
                 "Expected one column in the rest of {0}".format(selectStatement))
         answer = [row[0] for row in answer]
         if len(expected_values) > 0:
             try:
                 from collections import Counter
-                BuiltIn().should_be_equal(Counter(answer), Counter(expected_values), "Expected a different set of ")
+                robot_builtin.BuiltIn().should_be_equal(Counter(answer), Counter(expected_values), "Expected a different set of ")
             except ImportError:
                 # Python < 2.7
-                BuiltIn().should_be_equal(answer, expected_values, "Expected a different list of ")
+                robot_builtin.BuiltIn().should_be_equal(answer, expected_values, "Expected a different list of ")
 
-    def _run_query_list(self, queries, **named_args):
-        with self._dbconnection.begin():
-            for query in filter(lambda x: x.strip(), queries):
-                self._dbconnection.execute(query, **named_args)
+    def clear_statement_cache(self):
+        """
+        Empties the cache of parsed and compiled SQL statements
+        and resets its hit and miss counters.
+
+        Statements are cached (up to the `statement_cache_size` given when
+        importing the library) so that running the same SQL again, for
+        example in a FOR loop, skips parsing and compiling it.
+
+        For example:
+        | Clear Statement Cache |
+        """
+        logger.info("Statement cache before clearing: {0}".format(self._statement_cache.statistics()))
+        self._statement_cache.clear()
+
+    def get_statement_cache_statistics(self):
+        """
+        Returns a dictionary with the `hits`, `misses`, current `size`
+        and `max_size` of the statement cache.
+
+        For example:
+        | ${stats}= | Get Statement Cache Statistics |
+        | Should Be True | ${stats['hits']} > 0 |
+        """
+        return self._statement_cache.statistics()
+
+    def enable_query_cache(self, max_size=256, ttl=None):
+        """
+        Turns on caching of query results.
+
+        While enabled, `Query` (and the keywords built on it, such as
+        `Query For Single Value`) return the cached rows when the same SELECT
+        is run again with the same bind parameters on the same database.
+        At most `max_size` results are kept, each for at most `ttl`
+        (a Robot Framework time string such as `5 min`; no limit by default).
 
+        Results are dropped when `Execute Sql String`, `Execute Sql Script`,
+        `Delete All Rows From Table`, `Insert Rows` or a writing `Query`
+        touch a table the cached statement mentions; DDL and statements the
+        library cannot classify drop the whole cache. Changes made outside
+        this library (by the application under test, by triggers, or to the
+        tables behind a view) are NOT noticed: use `Clear Query Cache` or a
+        `ttl` in those cases.
+
+        For example:
+        | Enable Query Cache | max_size=100 | ttl=10 min |
+        | ${country}= | Query For Single Value | SELECT name FROM country WHERE code = :code | code=FI |
+        """
+        ttl = timestr_to_secs(ttl) if ttl not in (None, '') else None
+        self._result_cache = ResultCache(max_size, ttl)
+
+    def disable_query_cache(self):
+        """
+        Turns off caching of query results and drops everything cached.
+        """
+        if self._result_cache is not None:
+            logger.info("Query cache: {0}".format(self._result_cache.statistics()))
+        self._result_cache = None
+
+    def clear_query_cache(self):
+        """
+        Drops every cached query result, keeping the cache enabled.
+
+        For example:
+        | Clear Query Cache |
+        """
+        if self._result_cache is not None:
+            logger.info("Query cache before clearing: {0}".format(self._result_cache.statistics()))
+            self._result_cache.clear()
+
+    def get_query_cache_statistics(self):
+        """
+        Returns a dictionary with the `hits`, `misses`, current `size` and
+        `max_size` of the query result cache, or None when it is disabled.
+        """
+        if self._result_cache is None:
+            return None
+        statistics = self._result_cache.statistics()
+        logger.info("Query cache: {0}".format(statistics))
+        return statistics
+
+    def _execute(self, connection, statement, named_args):
+        """
+        Executes SQL text (or a CachedStatement) on `connection`,
+        passing only the bind parameters the statement uses.
+        """
+        if not isinstance(statement, CachedStatement):
+            if self._result_cache is not None:
+                self._result_cache.invalidate_for(statement)
+            statement = self._statement_cache.text(statement, connection.dialect.name)
+        params = dict((name, value) for name, value in named_args.items()
+                      if name in statement.bind_names)
+        if self._statement_cache.size > 0:
+            connection = connection.execution_options(
+                    compiled_cache=self._statement_cache.compiled_cache)
+        return connection.execute(statement.statement, params)
+
+    def _execute_once(self, connection, statement, named_args):
+        """
+        Executes SQL text that is not expected to be run again, such as a
+        command of a script, without the statement cache: it is passed to
+        the driver as it is, with `named_args` bound to its :bind variables
+        when it has any and passed to the driver otherwise.
+        """
+        if self._result_cache is not None:
+            self._result_cache.invalidate_for(statement)
+        if not named_args:
+            return connection.execute(statement)
+        clause = sqlalchemy.text(statement)
+        if not clause._bindparams:
+            return connection.execute(statement, named_args)
+        return connection.execute(clause, dict((name, value) for name, value in named_args.items()
+                                               if name in clause._bindparams))
+
+    def _run_query_list(self, queries, alias=None, **named_args):
+        connection = self._get_connection(alias)
+        with transaction(connection):
+            for query in filter(lambda x: x.strip(), queries):
+                self._execute_once(connection, query, named_args)
+                if is_ddl(query):
+                    self._schema_cache.invalidate(connection.engine)
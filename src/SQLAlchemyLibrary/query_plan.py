@@ -0,0 +1,271 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import re
+
+_EXPLAIN = {
+    'postgresql': 'EXPLAIN (FORMAT JSON) ',
+    'mysql': 'EXPLAIN FORMAT=JSON ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+_SQLITE_ACCESS = re.compile(
+    r'^(SCAN|SEARCH)(?: TABLE)? (\S+)(?: AS (\S+))?'
+    r'(?: USING (?:(?:AUTOMATIC )?(?:COVERING )?INDEX (\S+)|(INTEGER PRIMARY KEY|PRIMARY KEY)))?(?: (.+))?$')
+# Subqueries and CTEs that SQLite computes, and then scans, by name.
+_SQLITE_DERIVED_TABLE = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\S+)')
+_SQLITE_NO_TABLE = ('CONSTANT', 'SUBQUERY')
+_TABLE_ALIAS = re.compile(
+    r'\b(?:FROM|JOIN)\s+([\w$."`\[\]]+)\s+(?:AS\s+)?'
+    r'(?!(?:ON|USING|WHERE|JOIN|INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|GROUP|ORDER|LIMIT|UNION|HAVING|WINDOW)\b)'
+    r'([\w$]+)', re.IGNORECASE)
+_POSTGRESQL_INDEX_SCANS = ('Index Scan', 'Index Only Scan')
+_MYSQL_FULL_SCANS = ('ALL', 'index')
+
+
+def explain_statement(dialect, sql):
+    """
+    Returns the statement explaining how the database of `dialect` would
+    run `sql`.
+
+    >>> explain_statement('sqlite', 'SELECT 1')
+    'EXPLAIN QUERY PLAN SELECT 1'
+    """
+    try:
+        return _EXPLAIN[dialect] + sql
+    except KeyError:
+        raise ValueError("Query plans are not supported on {0}, only on: {1}".format(
+            dialect, ", ".join(sorted(_EXPLAIN))))
+
+
+def plan_node(operation, table=None, alias=None, index=None, full_scan=False, cost=None, rows=None, detail=None,
+              children=None):
+    """
+    Returns a node of a normalized plan tree: the `operation` of the
+    database, the `table` it reads (if any) and the `alias` the query names
+    it by (the table name itself when it has no alias), the `index` it
+    reads, whether it reads the whole table (`full_scan`), the estimated
+    `cost` and `rows` (when the database estimates them), a `detail` such
+    as its condition and the nodes it gets its rows from (`children`).
+    """
+    return {'operation': operation, 'table': table, 'alias': alias, 'index': index, 'full_scan': full_scan,
+            'cost': _number(cost), 'rows': _number(rows), 'detail': detail, 'children': children or []}
+
+
+def _number(value):
+    return None if value is None else float(value)
+
+
+def table_aliases(sql):
+    """
+    Returns the tables that `sql` gives aliases to in its FROM and JOIN
+    clauses, by alias (in lower case).
+
+    >>> sorted(table_aliases('SELECT * FROM person p JOIN "order" AS o ON o.p = p.id JOIN country WHERE 1').items())
+    [('o', 'order'), ('p', 'person')]
+    """
+    return dict((alias.lower(), table.split('.')[-1].strip('"`[]'))
+                for table, alias in _TABLE_ALIAS.findall(sql))
+
+
+def explain_plan(dialect, rows, sql=''):
+    """
+    Returns the normalized plan tree of the result `rows` of the
+    `explain_statement` of `dialect` for `sql`.
+    """
+    aliases = table_aliases(sql)
+    if dialect == 'sqlite':
+        return sqlite_plan(rows, aliases)
+    document = rows[0][0]
+    if not isinstance(document, (list, dict)):
+        document = json.loads(document)
+    if dialect == 'postgresql':
+        return postgresql_plan(document)
+    return mysql_plan(document, aliases)
+
+
+def _aliased_table(name, aliases):
+    """
+    Returns the table and the alias of the table that a plan names `name`,
+    which is its alias when the query gives it one.
+    """
+    return aliases.get(name.lower(), name), name
+
+
+def sqlite_plan(rows, aliases=None):
+    """
+    Returns the plan tree of the `(id, parent, notused, detail)` rows of
+    SQLite's `EXPLAIN QUERY PLAN`, under a `QUERY PLAN` node. SQLite (from
+    3.36) names tables by their alias, which `aliases` (see `table_aliases`)
+    map back to the tables. It estimates no costs. Scans of
+    constant rows and of the results of subqueries and CTEs (co-routines
+    and materialized views) read no table and are steps of their own.
+
+    >>> plan = sqlite_plan([(2, 0, 0, 'SCAN p'), (5, 0, 0, 'SEARCH t USING INTEGER PRIMARY KEY (rowid=?)'),
+    ...                     (6, 0, 0, 'SCAN TABLE person AS q')], {'p': 'person'})
+    >>> [(node['operation'], node['table'], node['alias'], node['index'], node['full_scan'], node['detail'])
+    ...  for node in plan['children']]
+    [('SCAN', 'person', 'p', None, True, None), ('SEARCH', 't', 't', 'INTEGER PRIMARY KEY', False, '(rowid=?)'), \
+('SCAN', 'person', 'q', None, True, None)]
+    >>> plan = sqlite_plan([(1, 0, 0, 'CO-ROUTINE s'), (2, 1, 0, 'SCAN CONSTANT ROW'), (3, 0, 0, 'SCAN s'),
+    ...                     (4, 0, 0, 'SCAN SUBQUERY 1')])
+    >>> print(format_plan(plan))
+    QUERY PLAN
+      CO-ROUTINE s
+        SCAN CONSTANT ROW
+      SCAN s
+      SCAN SUBQUERY 1
+    """
+    aliases = aliases or {}
+    root = plan_node('QUERY PLAN')
+    nodes = {0: root}
+    derived_tables = set()
+    for node_id, parent, _, detail in rows:
+        derived_table = _SQLITE_DERIVED_TABLE.match(detail)
+        if derived_table:
+            derived_tables.add(derived_table.group(1))
+        access = _SQLITE_ACCESS.match(detail)
+        if access and access.group(2) not in _SQLITE_NO_TABLE and access.group(2) not in derived_tables:
+            operation, name, alias, index, key, condition = access.groups()
+            table, alias = (name, alias) if alias else _aliased_table(name, aliases)
+            # SCAN visits every row, even through a (covering) index.
+            node = plan_node(operation, table=table, alias=alias, index=index or key, full_scan=operation == 'SCAN',
+                             detail=condition)
+        else:
+            node = plan_node(detail)
+        nodes.get(parent, root)['children'].append(node)
+        nodes[node_id] = node
+    return root
+
+
+def postgresql_plan(document):
+    """
+    Returns the plan tree of the output of PostgreSQL's
+    `EXPLAIN (FORMAT JSON)`. Index scans without an index condition (read
+    for their order) are full scans too.
+
+    >>> plan = postgresql_plan([{'Plan': {'Node Type': 'Sort', 'Total Cost': 12.5, 'Plan Rows': 10, 'Plans': [
+    ...     {'Node Type': 'Seq Scan', 'Relation Name': 'person', 'Total Cost': 8.0, 'Plan Rows': 10,
+    ...      'Filter': "(last_name = 'See'::text)"}]}}])
+    >>> plan['operation'], plan['cost'], [(node['table'], node['full_scan'], node['detail'])
+    ...                                   for node in plan['children']]
+    ('Sort', 12.5, [('person', True, "(last_name = 'See'::text)")])
+    """
+    return _postgresql_node(document[0]['Plan'])
+
+
+def _postgresql_node(node):
+    operation = node['Node Type']
+    condition = node.get('Index Cond') or node.get('Recheck Cond')
+    full_scan = operation == 'Seq Scan' or (operation in _POSTGRESQL_INDEX_SCANS and not condition)
+    return plan_node(operation, table=node.get('Relation Name'), alias=node.get('Alias'), index=node.get('Index Name'),
+                     full_scan=full_scan,
+                     cost=node.get('Total Cost'), rows=node.get('Plan Rows'),
+                     detail=condition or node.get('Filter') or node.get('Join Filter') or node.get('Hash Cond'),
+                     children=[_postgresql_node(child) for child in node.get('Plans', [])])
+
+
+def mysql_plan(document, aliases=None):
+    """
+    Returns the plan tree of the output of MySQL's `EXPLAIN FORMAT=JSON`,
+    with a node per object of the output and a node per table, whose
+    operation is its access type. Accesses of type `ALL` (a table scan)
+    and `index` (an index scan) are full scans. MySQL names tables by their
+    alias, which `aliases` (see `table_aliases`) map back to the tables.
+
+    >>> plan = mysql_plan({'query_block': {'cost_info': {'query_cost': '1.20'}, 'nested_loop': [
+    ...     {'table': {'table_name': 'p', 'access_type': 'ALL', 'rows_examined_per_scan': 2}},
+    ...     {'table': {'table_name': 't', 'access_type': 'eq_ref', 'key': 'PRIMARY',
+    ...                'cost_info': {'prefix_cost': '1.20'}}}]}}, {'p': 'person'})
+    >>> plan['operation'], plan['cost'], [(node['table'], node['alias'], node['index'], node['full_scan'])
+    ...                                   for node in plan['children'][0]['children']]
+    ('query_block', 1.2, [('person', 'p', None, True), ('t', 't', 'PRIMARY', False)])
+    """
+    return _mysql_node('query_block', document['query_block'], aliases or {})
+
+
+def _mysql_node(name, value, aliases):
+    children = []
+    for key, child in value.items():
+        if key == 'cost_info':
+            continue
+        if isinstance(child, dict):
+            children.append(_mysql_node(key, child, aliases))
+        elif isinstance(child, list) and any(isinstance(item, dict) for item in child):
+            # The items of lists, such as nested_loop, are objects holding one table each.
+            children.append(plan_node(key, children=[
+                node for item in child if isinstance(item, dict) for node in _mysql_children(item, aliases)]))
+    cost_info = value.get('cost_info', {})
+    if name != 'table':
+        return plan_node(name, cost=cost_info.get('query_cost'), children=children)
+    access_type = value.get('access_type')
+    table, alias = _aliased_table(value['table_name'], aliases) if value.get('table_name') else (None, None)
+    return plan_node(access_type, table=table, alias=alias, index=value.get('key'),
+                     full_scan=access_type in _MYSQL_FULL_SCANS, cost=cost_info.get('prefix_cost'),
+                     rows=value.get('rows_examined_per_scan'), detail=value.get('attached_condition'),
+                     children=children)
+
+
+def _mysql_children(value, aliases):
+    return [_mysql_node(key, child, aliases) for key, child in value.items() if isinstance(child, dict)]
+
+
+def plan_nodes(plan):
+    """
+    Yields the nodes of the plan tree `plan`, each before its children.
+    """
+    yield plan
+    for child in plan['children']:
+        for node in plan_nodes(child):
+            yield node
+
+
+def plan_cost(plan):
+    """
+    Returns the estimated cost of the whole plan: that of the topmost node
+    with a cost, or None when the database estimates no costs.
+    """
+    for node in plan_nodes(plan):
+        if node['cost'] is not None:
+            return node['cost']
+    return None
+
+
+def format_plan(plan, depth=0):
+    """
+    Returns the plan tree `plan` as indented text.
+
+    >>> print(format_plan(sqlite_plan([(2, 0, 0, 'SCAN p'), (3, 0, 0, 'SEARCH t USING INDEX t_x (x=?)'),
+    ...                                (4, 0, 0, 'USE TEMP B-TREE FOR ORDER BY')], {'p': 'person'})))
+    QUERY PLAN
+      SCAN on person as p (full scan)
+      SEARCH on t using t_x (x=?)
+      USE TEMP B-TREE FOR ORDER BY
+    """
+    line = ' '.join(part for part in (
+        plan['operation'],
+        'on {0}'.format(plan['table']) if plan['table'] else '',
+        'as {0}'.format(plan['alias']) if plan['alias'] and plan['alias'] != plan['table'] else '',
+        'using {0}'.format(plan['index']) if plan['index'] else '',
+        plan['detail']) if part)
+    notes = []
+    if plan['full_scan']:
+        notes.append('full scan')
+    if plan['cost'] is not None:
+        notes.append('cost={0:g}'.format(plan['cost']))
+    if plan['rows'] is not None:
+        notes.append('rows={0:g}'.format(plan['rows']))
+    if notes:
+        line += ' ({0})'.format(', '.join(notes))
+    return '\n'.join(['  ' * depth + line] + [format_plan(child, depth + 1) for child in plan['children']])
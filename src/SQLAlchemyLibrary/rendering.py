@@ -0,0 +1,99 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from robot.api import logger
+
+_LEVELS = {'TRACE': 1, 'DEBUG': 2, 'INFO': 3, 'WARN': 4, 'ERROR': 5}
+
+
+def is_logged(level):
+    """
+    Tells whether a message of `level` would be written to the log.
+
+    Answers True when the current log level cannot be determined
+    (outside a Robot run, or on Robot versions that do not expose it).
+    """
+    try:
+        from robot.running.context import EXECUTION_CONTEXTS
+        current = EXECUTION_CONTEXTS.current.output.log_level
+        current = getattr(current, 'level', current)
+        return _LEVELS[level] >= _LEVELS.get(str(current).upper(), 0)
+    except Exception:
+        return True
+
+
+def log_lazily(level, message):
+    """
+    Logs the text returned by the callable `message`, calling it only
+    when `level` is logged.
+    """
+    if is_logged(level):
+        logger.write(message(), level)
+
+
+class ResultRenderer(object):
+    """
+    Renders query results for log and failure messages, bounded to
+    `max_rows` rows, `max_columns` columns and `max_value_length`
+    characters per value, so that the cost and size of a message do not
+    grow with the result.
+
+    Results within the bounds are rendered exactly like `str(list(rows))`.
+
+    >>> renderer = ResultRenderer(max_rows=2, max_columns=2, max_value_length=8)
+    >>> renderer.render([(1, 'a'), (2, 'b')])
+    "[(1, 'a'), (2, 'b')]"
+    >>> renderer.render([(1, 'a', 'b'), (2, 'a long value', 'c'), (3, 'c', 'd')], total=512311)
+    "[(1, 'a', ...), (2, 'a lo..., ...)] (showing 2 of 512,311 rows)"
+    """
+
+    def __init__(self, max_rows=20, max_columns=20, max_value_length=100):
+        self.max_rows = int(max_rows)
+        self.max_columns = int(max_columns)
+        self.max_value_length = int(max_value_length)
+
+    def render(self, rows, total=None):
+        """
+        Renders the first `max_rows` of `rows`. When `rows` holds more than
+        that, the result says how many of the `total` (by default
+        `len(rows)`) rows it shows.
+        """
+        shown = rows[:self.max_rows]
+        text = '[{0}]'.format(', '.join(self.render_row(row) for row in shown))
+        if total is None:
+            total = len(rows)
+        if total > len(shown):
+            text += self.showing(len(shown), total)
+        return text
+
+    def render_row(self, row):
+        values = [self.render_value(value) for value in tuple(row)[:self.max_columns]]
+        if len(row) > self.max_columns:
+            values.append('...')
+        elif len(values) == 1:
+            return '({0},)'.format(values[0])
+        return '({0})'.format(', '.join(values))
+
+    def render_value(self, value):
+        """
+        >>> ResultRenderer(max_value_length=5).render_value(u'abcdefgh')
+        "'a..."
+        """
+        text = repr(value)
+        if len(text) > self.max_value_length:
+            text = text[:max(self.max_value_length - 3, 1)] + '...'
+        return text
+
+    def showing(self, shown, total):
+        return ' (showing {0:,} of {1:,} rows)'.format(shown, total)
@@ -0,0 +1,129 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from collections import OrderedDict
+import re
+import time
+
+_WORD = re.compile(r'[A-Za-z_][A-Za-z_0-9$]*')
+_READ_STATEMENT = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+_WRITE_WORDS = frozenset(['insert', 'update', 'delete', 'merge', 'replace', 'truncate'])
+_WRITE_TARGET = re.compile(
+    r'^\s*(?:INSERT\s+(?:OR\s+\w+\s+)?(?:IGNORE\s+)?INTO|REPLACE\s+INTO|MERGE\s+INTO'
+    r'|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?)'
+    r'\s+((?:ONLY\s+)?[\w."`\[\]$]+)', re.IGNORECASE)
+
+
+def statement_words(statement):
+    """
+    Returns the lower-cased words of `statement`, which include
+    the names of all the tables it reads.
+
+    >>> sorted(statement_words('SELECT p.id FROM "Person" p JOIN main.note n ON 1=1'))
+    ['from', 'id', 'join', 'main', 'n', 'note', 'on', 'p', 'person', 'select']
+    """
+    return frozenset(word.lower() for word in _WORD.findall(statement))
+
+
+def is_cacheable(statement):
+    """
+    Tells whether the result of `statement` may be cached: plain reads only.
+
+    >>> is_cacheable('select * from person'), is_cacheable('SELECT * FROM t FOR UPDATE')
+    (True, False)
+    >>> is_cacheable('INSERT INTO person VALUES (1)')
+    False
+    """
+    return bool(_READ_STATEMENT.match(statement)) and \
+        not (statement_words(statement) & _WRITE_WORDS)
+
+
+def written_table(statement):
+    """
+    Returns the lower-cased, unqualified name of the table `statement` writes to,
+    '' for reads, or None when it cannot tell (DDL and anything else).
+
+    >>> written_table('INSERT INTO main."Person" VALUES (1)')
+    'person'
+    >>> written_table('delete from person where id = 1'), written_table('SELECT 1')
+    ('person', '')
+    >>> written_table('DROP TABLE person') is None
+    True
+    """
+    if is_cacheable(statement):
+        return ''
+    match = _WRITE_TARGET.match(statement)
+    if match is None:
+        return None
+    name = re.sub(r'^ONLY\s+', '', match.group(1), flags=re.IGNORECASE)
+    return name.split('.')[-1].strip('"`[]').lower()
+
+
+class ResultCache(object):
+    """
+    A size- and time-bounded cache of query results.
+
+    Entries remember the words of their statement, so that writing to a
+    table drops every cached result whose statement mentions that table.
+    """
+
+    def __init__(self, max_size=256, ttl=None):
+        self.max_size = int(max_size)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def key(self, engine, statement, params):
+        # Engines rather than URLs, as every in-memory SQLite engine has a
+        # database of its own.
+        return (engine, statement, repr(sorted(params.items())))
+
+    def get(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None or (self.ttl is not None and time.time() - entry[0] > self.ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries[key] = entry
+        return entry[2]
+
+    def put(self, key, rows):
+        if self.max_size <= 0:
+            return
+        while len(self._entries) >= self.max_size:
+            self._entries.popitem(last=False)
+        self._entries[key] = (time.time(), statement_words(key[1]), rows)
+
+    def invalidate_for(self, statement):
+        """
+        Drops the results that `statement` (about to be run) may change.
+        """
+        table = written_table(statement)
+        if table is None:
+            self._entries.clear()
+        elif table:
+            self.invalidate_table(table)
+
+    def invalidate_table(self, table_name):
+        table_name = table_name.lower()
+        for key in [key for key, entry in self._entries.items() if table_name in entry[1]]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def statistics(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._entries), 'max_size': self.max_size}
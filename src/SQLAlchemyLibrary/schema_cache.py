@@ -0,0 +1,180 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import re
+
+from SQLAlchemyLibrary.lazy_import import LazyModule
+
+sqlalchemy = LazyModule('sqlalchemy')
+_DDL_STATEMENT = re.compile(r'^\s*(CREATE|DROP|ALTER|RENAME)\b', re.IGNORECASE)
+
+
+def is_ddl(statement):
+    """
+    Tells whether `statement` may change the database schema.
+
+    >>> is_ddl('  create table person (id integer)')
+    True
+    >>> is_ddl('SELECT * FROM created_tables')
+    False
+    """
+    return bool(_DDL_STATEMENT.match(statement))
+
+
+def find_name(name, names):
+    """
+    Returns the entry of `names` matching `name`, preferring an exact match
+    over a case-insensitive one, or None.
+
+    >>> find_name('Person', ['person', 'PERSON_NOTE'])
+    'person'
+    >>> find_name('person', ['person', 'PERSON']) , find_name('nobody', ['person'])
+    ('person', None)
+    """
+    if name in names:
+        return name
+    lowered = name.lower()
+    for candidate in names:
+        if candidate.lower() == lowered:
+            return candidate
+    return None
+
+
+def deletion_order(tables, references):
+    """
+    Orders `tables` so that each one comes before the tables it references,
+    the order in which their rows can be deleted. `references` maps a table
+    to the names of the tables it references. Tables in reference cycles
+    keep the order they are given in, after the others.
+
+    >>> deletion_order(['customer', 'orders', 'order_line'], {'orders': ['customer'], 'order_line': ['orders']})
+    ['order_line', 'orders', 'customer']
+    >>> deletion_order(['a', 'b', 'c'], {'a': ['b'], 'b': ['a', 'b']})
+    ['c', 'a', 'b']
+    """
+    remaining = list(tables)
+    referenced = dict((table, 0) for table in remaining)
+    for table in remaining:
+        for other in set(references.get(table, ())):
+            if other in referenced and other != table:
+                referenced[other] += 1
+    ordered = []
+    progress = True
+    while remaining and progress:
+        progress = False
+        for table in list(remaining):
+            if referenced[table] == 0:
+                ordered.append(table)
+                remaining.remove(table)
+                progress = True
+                for other in set(references.get(table, ())):
+                    if other in referenced and other != table:
+                        referenced[other] -= 1
+    return ordered + remaining
+
+
+class SchemaCache(object):
+    """
+    Caches reflected schema information (tables, columns, indexes) per engine.
+
+    Everything is read through one SQLAlchemy Inspector per engine, whose own
+    cache makes repeated lookups of the same table free. `invalidate()` drops
+    what is known about an engine (or all engines), for example after DDL.
+    Tables missing from the cache are looked up once more after dropping
+    what is known about their engine, as another session (such as the
+    system under test) may have created them since.
+    """
+
+    def __init__(self):
+        self._inspectors = {}
+        self._table_names = {}
+
+    def inspector(self, engine):
+        inspector = self._inspectors.get(engine)
+        if inspector is None:
+            inspector = sqlalchemy.inspect(engine)
+            self._inspectors[engine] = inspector
+        return inspector
+
+    def table_names(self, engine, schema=None):
+        """
+        Returns the names of the tables and views in `schema`.
+        """
+        key = (engine, schema)
+        names = self._table_names.get(key)
+        if names is None:
+            inspector = self.inspector(engine)
+            names = frozenset(inspector.get_table_names(schema=schema)) | \
+                frozenset(inspector.get_view_names(schema=schema))
+            self._table_names[key] = names
+        return names
+
+    def find_table(self, engine, table_name, schema=None):
+        table = find_name(table_name, self.table_names(engine, schema))
+        if table is None:
+            self.invalidate(engine)
+            table = find_name(table_name, self.table_names(engine, schema))
+        return table
+
+    def find_tables(self, engine, table_names, schema=None):
+        """
+        Returns the names of the tables (not views) `table_names` as the
+        database spells them, None for those that do not exist, or all the
+        tables of `schema` when no names are given (read again, to include
+        tables created since).
+        """
+        if not table_names:
+            self.invalidate(engine)
+            return self.inspector(engine).get_table_names(schema=schema)
+        tables = [find_name(name, self.inspector(engine).get_table_names(schema=schema)) for name in table_names]
+        if None in tables:
+            self.invalidate(engine)
+            existing = self.inspector(engine).get_table_names(schema=schema)
+            tables = [find_name(name, existing) for name in table_names]
+        return tables
+
+    def columns(self, engine, table_name, schema=None):
+        return self.inspector(engine).get_columns(table_name, schema=schema)
+
+    def indexes(self, engine, table_name, schema=None):
+        return self.inspector(engine).get_indexes(table_name, schema=schema)
+
+    def foreign_keys(self, engine, table_name, schema=None):
+        return self.inspector(engine).get_foreign_keys(table_name, schema=schema)
+
+    def primary_key(self, engine, table_name, schema=None):
+        """
+        Returns the names of the primary key columns of the table.
+        """
+        return self.inspector(engine).get_pk_constraint(table_name, schema=schema)['constrained_columns']
+
+    def reflect(self, engine, schema=None):
+        """
+        Reads the tables, columns and indexes of a whole schema at once
+        and returns the number of tables found.
+        """
+        table_names = self.table_names(engine, schema)
+        for table_name in table_names:
+            self.columns(engine, table_name, schema)
+            self.indexes(engine, table_name, schema)
+        return len(table_names)
+
+    def invalidate(self, engine=None):
+        if engine is None:
+            self._inspectors.clear()
+            self._table_names.clear()
+            return
+        self._inspectors.pop(engine, None)
+        for key in [key for key in self._table_names if key[0] is engine]:
+            del self._table_names[key]
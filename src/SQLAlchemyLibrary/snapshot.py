@@ -0,0 +1,261 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import copy
+import re
+import time
+
+from robot.api import logger
+
+from SQLAlchemyLibrary.lazy_import import LazyModule
+
+sqlalchemy = LazyModule('sqlalchemy')
+sqlite3 = LazyModule('sqlite3')
+
+_SNAPSHOT_NAME = re.compile(r'^\w+$')
+
+
+def _raw_connection(connection):
+    return connection.connection.connection
+
+
+def autocommit_engine(url, database):
+    """
+    Returns an engine for `database` on the server of `url`, running every
+    statement on its own, as CREATE and DROP DATABASE cannot run in a
+    transaction.
+    """
+    url = copy.copy(sqlalchemy.engine.url.make_url(url))
+    url.database = database
+    return sqlalchemy.create_engine(url, isolation_level='AUTOCOMMIT', poolclass=sqlalchemy.pool.NullPool)
+
+
+def run_autocommit(url, database, statements, *names):
+    """
+    Runs the `; `-separated `statements` with `autocommit_engine`, after
+    formatting the quoted `names` into them.
+    """
+    engine = autocommit_engine(url, database)
+    names = [engine.dialect.identifier_preparer.quote(name) for name in names]
+    try:
+        with engine.connect() as connection:
+            for statement in statements.split('; '):
+                connection.execute(statement.format(*names))
+    finally:
+        engine.dispose()
+
+
+class SqliteSnapshot(object):
+    """
+    A copy of an SQLite database held in an in-memory database, taken and
+    restored page by page with the online backup API.
+    """
+
+    dialect = 'sqlite'
+
+    def __init__(self, name, engine):
+        self.name = name
+        self._copy = sqlite3.connect(':memory:', check_same_thread=False)
+
+    def create(self, library, connection):
+        _raw_connection(connection).backup(self._copy)
+
+    def restore(self, library, connection):
+        self._copy.backup(_raw_connection(connection))
+
+    def drop(self, library):
+        self._copy.close()
+
+
+class TemplateSnapshot(object):
+    """
+    A copy of a PostgreSQL database kept in a database of its own, created
+    with `CREATE DATABASE ... TEMPLATE` and copied back the same way.
+
+    Both statements need that nobody else is connected to the database
+    that is copied, so the connections of the library to it are closed
+    meanwhile and opened again afterwards.
+    """
+
+    dialect = 'postgresql'
+
+    def __init__(self, name, engine):
+        self.name = name
+        self.database = '{0}_snapshot_{1}'.format(engine.url.database, name)
+        self._url = engine.url
+
+    def create(self, library, connection):
+        source = connection.engine.url.database
+        library._reconnecting(connection.engine, lambda: self._run(
+            'CREATE DATABASE {0} TEMPLATE {1}', self.database, source))
+
+    def restore(self, library, connection):
+        target = connection.engine.url.database
+        restored = '{0}_restoring'.format(target)
+        # Copied first, so that the database is left as it is when the copy
+        # cannot be made (for example while a session uses the snapshot).
+        self._run('DROP DATABASE IF EXISTS {0}; CREATE DATABASE {0} TEMPLATE {1}', restored, self.database)
+
+        def replace():
+            try:
+                self._run('DROP DATABASE {0}', target)
+            except Exception:
+                self._run('DROP DATABASE IF EXISTS {0}', restored)
+                raise
+            self._run('ALTER DATABASE {0} RENAME TO {1}', restored, target)
+        library._reconnecting(connection.engine, replace)
+
+    def drop(self, library):
+        self._run('DROP DATABASE IF EXISTS {0}', self.database)
+
+    def _run(self, statements, *names):
+        run_autocommit(self._url, 'postgres', statements, *names)
+
+
+_SNAPSHOTS = {'sqlite': SqliteSnapshot, 'postgresql': TemplateSnapshot}
+
+
+class Snapshot(object):
+    """
+    Snapshot keeps copies of whole databases, to restore them quickly
+    instead of creating and filling them again.
+    """
+
+    def __init__(self):
+        self._snapshots = {}
+
+    def create_database_snapshot(self, name, alias=None):
+        """
+        Takes a copy of the whole database, named `name`, that `Restore
+        Database Snapshot` can later restore. A snapshot of the same name
+        is replaced.
+
+        How the copy is taken depends on the database:
+        - SQLite: the database (file or in-memory) is copied into memory
+          with the online backup API.
+        - PostgreSQL: the database is copied into the database
+          `<database>_snapshot_<name>` with `CREATE DATABASE ... TEMPLATE`,
+          which needs the `CREATEDB` privilege and that no other session is
+          connected to the database. The copy is kept until `Drop Database
+          Snapshot`, so it can also be restored by later runs.
+        Other databases are not supported.
+
+        Snapshots are kept for the whole run, across suites and
+        connections, so one suite setup can create the snapshot of a fully
+        seeded database and every test restore it. A snapshot cannot be
+        created inside a transaction, so with `Enable Test Isolation` it is
+        created in a suite setup.
+
+        Example:
+        | Execute Sql Script | ${CURDIR}${/}schema_and_data.sql |
+        | Create Database Snapshot | seeded |
+        """
+        connection = self._get_connection(alias)
+        snapshot_class = _SNAPSHOTS.get(connection.dialect.name)
+        if snapshot_class is None:
+            raise ValueError("Database snapshots are not supported on {0}, only on: {1}".format(
+                connection.dialect.name, ", ".join(sorted(_SNAPSHOTS))))
+        if not _SNAPSHOT_NAME.match(name):
+            raise ValueError("Snapshot names may only contain letters, digits and underscores, got '{0}'".format(name))
+        if connection.in_transaction():
+            raise RuntimeError("Cannot create a database snapshot inside a transaction, "
+                               "such as the one of a test with test isolation")
+        started = time.time()
+        if name in self._snapshots:
+            self.drop_database_snapshot(name)
+        snapshot = snapshot_class(name, connection.engine)
+        snapshot.create(self, connection)
+        self._snapshots[name] = snapshot
+        logger.info("Created the database snapshot '{0}' in {1:.3f} seconds".format(name, time.time() - started))
+
+    def restore_database_snapshot(self, name, alias=None):
+        """
+        Replaces the whole content of the database with the snapshot `name`
+        taken by `Create Database Snapshot`.
+
+        The database may be another one than the snapshot was taken of, as
+        long as it is the same kind of database: restoring an SQLite
+        snapshot into a new `sqlite:///:memory:` connection clones it.
+        On PostgreSQL the snapshot is copied into the database
+        `<database>_restoring`, which then replaces the database, so no
+        other session may be connected to either of them. When the copy
+        cannot be made, the database is left as it is.
+
+        With `Enable Test Isolation`, the transaction of the test is rolled
+        back before restoring and begun again afterwards. Restoring inside
+        any other transaction fails.
+
+        Example:
+        | Restore Database Snapshot | seeded |
+        """
+        snapshot = self._get_snapshot(name)
+        connection = self._get_connection(alias)
+        if connection.dialect.name != snapshot.dialect:
+            raise ValueError("Cannot restore the {0} snapshot '{1}' into a {2} database".format(
+                snapshot.dialect, name, connection.dialect.name))
+        started = time.time()
+        isolated = self._suspend_test_isolation(connection)
+        try:
+            if connection.in_transaction():
+                raise RuntimeError("Cannot restore a database snapshot inside a transaction")
+            snapshot.restore(self, connection)
+        finally:
+            for alias in isolated:
+                self._isolation_transactions[alias] = self._connections[alias].begin()
+        if self._result_cache is not None:
+            self._result_cache.clear()
+        self._schema_cache.invalidate()
+        logger.info("Restored the database snapshot '{0}' in {1:.3f} seconds".format(name, time.time() - started))
+
+    def drop_database_snapshot(self, name):
+        """
+        Drops the snapshot `name` taken by `Create Database Snapshot`,
+        releasing its memory or dropping its database.
+        """
+        self._get_snapshot(name).drop(self)
+        del self._snapshots[name]
+
+    def _get_snapshot(self, name):
+        try:
+            return self._snapshots[name]
+        except KeyError:
+            raise ValueError("No database snapshot named '{0}'".format(name))
+
+    def _suspend_test_isolation(self, connection):
+        """
+        Rolls back the transactions of test isolation on the connections
+        to the database of `connection`, and returns their aliases.
+        """
+        aliases = [alias for alias, other in self._connections.items()
+                   if alias in self._isolation_transactions and other.engine is connection.engine]
+        for alias in aliases:
+            isolation = self._isolation_transactions.pop(alias)
+            if isolation.is_active:
+                isolation.rollback()
+        return aliases
+
+    def _reconnecting(self, engine, action):
+        """
+        Closes all the connections to `engine`, calls `action` and opens
+        the connections again under the same aliases.
+        """
+        aliases = [alias for alias, connection in self._connections.items() if connection.engine is engine]
+        for alias in aliases:
+            self._close_connection(alias)
+        engine.dispose()
+        try:
+            action()
+        finally:
+            for alias in aliases:
+                self._connections[alias] = engine.connect()
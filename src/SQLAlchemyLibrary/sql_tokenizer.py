@@ -0,0 +1,289 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+NORMAL, SINGLE_QUOTE, DOUBLE_QUOTE, BACKTICK, BLOCK_COMMENT, DOLLAR_QUOTE = range(6)
+
+_QUOTE_STATES = {"'": SINGLE_QUOTE, '"': DOUBLE_QUOTE, '`': BACKTICK}
+_QUOTE_BODIES = {
+    SINGLE_QUOTE: re.compile(r"[^']*(?:''[^']*)*"),
+    DOUBLE_QUOTE: re.compile(r'[^"]*(?:""[^"]*)*'),
+    BACKTICK: re.compile(r'[^`]*(?:``[^`]*)*'),
+}
+_BACKSLASH_QUOTE_BODY = re.compile(r"[^'\\]*(?:(?:\\[\s\S]|'')[^'\\]*)*")
+
+_DELIMITER_COMMAND = re.compile(r'^\s*DELIMITER\s+(\S+)\s*$', re.IGNORECASE)
+_HASH_COMMENT = re.compile(r'^\s*#')
+_COMPOUND_STATEMENT = re.compile(
+    r'^\s*CREATE\s+(?:OR\s+REPLACE\s+)?(?:DEFINER\s*=\s*\S+\s+)?(?:TEMP(?:ORARY)?\s+)?'
+    r'(?:TRIGGER|PROCEDURE|FUNCTION|EVENT)\b', re.IGNORECASE)
+_CREATE = re.compile(r'\s*CREATE\b', re.IGNORECASE)
+_KEPT_COMMENTS = ('/*!', '/*+')
+
+
+class SqlTokenizer(object):
+    """
+    Incrementally splits SQL scripts into statements.
+
+    Text is fed in arbitrary chunks with `feed()`, which returns the
+    statements completed by the lines fed so far; `close()` returns
+    whatever is left. Only the current statement and one line of input
+    are kept in memory.
+
+    The tokenizer understands:
+    - '...', "..." and `...` quoting (with doubled quotes and, with
+      `backslash_escapes` as in MySQL, backslash escapes in single-quoted
+      strings),
+    - -- line comments, /* block */ comments and lines starting with #,
+      which are all removed (except /*! ... */ and /*+ ... */ hints),
+    - $$ ... $$ and $tag$ ... $tag$ dollar quoting,
+    - BEGIN ... END bodies of CREATE TRIGGER/PROCEDURE/FUNCTION/EVENT,
+    - DELIMITER lines (as in the mysql client) changing the delimiter.
+
+    >>> SqlTokenizer().feed("insert into t values ('a;b'); select 1;\\n")
+    ["insert into t values ('a;b')", 'select 1']
+    >>> tokenizer = SqlTokenizer()
+    >>> tokenizer.feed("select 'it''s ")
+    []
+    >>> tokenizer.feed("here'\\n-- comment\\nfrom t")
+    []
+    >>> tokenizer.close()
+    ["select 'it''s here'\\n\\nfrom t"]
+    >>> SqlTokenizer().feed('''DELIMITER //
+    ... create procedure p() begin select 1; end//
+    ... DELIMITER ;
+    ... call p();
+    ... ''')
+    ['create procedure p() begin select 1; end', 'call p()']
+    >>> SqlTokenizer().feed('''create trigger t after insert on a begin
+    ...   update b set c = case when 1 then 2 end; end; select 1;
+    ... ''')
+    ['create trigger t after insert on a begin\\n  update b set c = case when 1 then 2 end; end', 'select 1']
+    >>> SqlTokenizer().feed('''create procedure p() begin case when 1 then select 1; end case; select 3; end;
+    ... select 4; select 5;
+    ... ''')
+    ['create procedure p() begin case when 1 then select 1; end case; select 3; end', 'select 4', 'select 5']
+    >>> for block in ('if 1 then select 1; end if', 'l: loop leave l; end loop',
+    ...               'while 0 do select 1; end while', 'repeat select 1; until 1 end repeat'):
+    ...     SqlTokenizer().feed('create procedure p() begin {0}; end; select 2;\\n'.format(block))
+    ['create procedure p() begin if 1 then select 1; end if; end', 'select 2']
+    ['create procedure p() begin l: loop leave l; end loop; end', 'select 2']
+    ['create procedure p() begin while 0 do select 1; end while; end', 'select 2']
+    ['create procedure p() begin repeat select 1; until 1 end repeat; end', 'select 2']
+    >>> SqlTokenizer().feed("create function f() returns int as $body$ begin return 1; end $body$ language plpgsql;\\n")
+    ['create function f() returns int as $body$ begin return 1; end $body$ language plpgsql']
+    """
+
+    def __init__(self, delimiter=';', backslash_escapes=False):
+        self.backslash_escapes = backslash_escapes
+        self._set_delimiter(delimiter)
+        self._pending = []
+        self._parts = []
+        self._statements = []
+        self._state = NORMAL
+        self._dollar_tag = None
+        self._keep_comment = False
+        self._depth = 0
+        self._compound = None
+
+    @property
+    def delimiter(self):
+        return self._delimiter
+
+    def _set_delimiter(self, delimiter):
+        if not delimiter:
+            raise ValueError("The SQL statement delimiter cannot be empty")
+        self._delimiter = delimiter
+        tokens = (r"(?P<quote>['\"`])"
+                  r"|(?P<line_comment>--)"
+                  r"|(?P<block_comment>/\*)"
+                  r"|(?P<dollar>(?<![\w$])\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$)"
+                  r"|(?P<delimiter>" + re.escape(delimiter) + r")")
+        self._normal_token = re.compile(tokens, re.IGNORECASE)
+        # BEGIN/CASE/END only matter in compound statements, and looking
+        # for them makes every search noticeably slower. END CASE, END IF
+        # and so on are read as one word, so CASE does not open a block.
+        self._compound_token = re.compile(
+            tokens + r"|(?P<word>\b(?:BEGIN|CASE|END(?:\s+(?:CASE|IF|LOOP|WHILE|REPEAT))?)\b)",
+            re.IGNORECASE)
+
+    def feed(self, text):
+        """
+        Adds `text` to the script and returns the list of statements it completed.
+        """
+        end = text.rfind('\n')
+        if end < 0:
+            # Joined only once a line is complete, as adding up the chunks
+            # of a long line one by one would take quadratic time.
+            self._pending.append(text)
+            return []
+        self._pending.append(text[:end + 1])
+        complete, self._pending = ''.join(self._pending), [text[end + 1:]]
+        for line in complete.splitlines(True):
+            self._process_line(line)
+        return self._take_statements()
+
+    def close(self):
+        """
+        Ends the script and returns the statements that were still open.
+        """
+        pending, self._pending = ''.join(self._pending), []
+        if pending:
+            self._process_line(pending)
+        if self._state not in (NORMAL, BLOCK_COMMENT):
+            raise ValueError("SQL script ended inside a quoted string: {0}".format(
+                ''.join(self._parts)[:200]))
+        self._end_statement()
+        self._state = NORMAL
+        return self._take_statements()
+
+    def _take_statements(self):
+        statements, self._statements = self._statements, []
+        return statements
+
+    def _end_statement(self):
+        statement = ''.join(self._parts).strip()
+        if statement:
+            self._statements.append(statement)
+        self._parts = []
+        self._depth = 0
+        self._compound = None
+
+    def _process_line(self, line):
+        if self._state == NORMAL:
+            match = _DELIMITER_COMMAND.match(line)
+            if match:
+                self._set_delimiter(match.group(1))
+                return
+            if _HASH_COMMENT.match(line):
+                return
+        pos = 0
+        parts = self._parts
+        while pos < len(line):
+            state = self._state
+            if state == NORMAL:
+                if self._compound is None:
+                    self._check_compound(line[pos:])
+                token_pattern = self._compound_token if self._compound else self._normal_token
+                match = token_pattern.search(line, pos)
+                if not match:
+                    parts.append(line[pos:])
+                    return
+                parts.append(line[pos:match.start()])
+                token, kind, pos = match.group(), match.lastgroup, match.end()
+                if kind == 'delimiter':
+                    if self._depth > 0:
+                        parts.append(token)
+                    else:
+                        self._end_statement()
+                        parts = self._parts
+                elif kind == 'quote':
+                    parts.append(token)
+                    self._state = _QUOTE_STATES[token]
+                elif kind == 'line_comment':
+                    if line.endswith('\n'):
+                        parts.append('\n')
+                    return
+                elif kind == 'block_comment':
+                    self._keep_comment = line.startswith(_KEPT_COMMENTS, match.start())
+                    parts.append(token if self._keep_comment else ' ')
+                    self._state = BLOCK_COMMENT
+                elif kind == 'dollar':
+                    parts.append(token)
+                    self._dollar_tag = token
+                    self._state = DOLLAR_QUOTE
+                else:
+                    parts.append(token)
+                    self._track_block(token)
+            elif state == BLOCK_COMMENT:
+                end = line.find('*/', pos)
+                if end < 0:
+                    if self._keep_comment:
+                        parts.append(line[pos:])
+                    return
+                if self._keep_comment:
+                    parts.append(line[pos:end + 2])
+                pos = end + 2
+                self._state = NORMAL
+            elif state == DOLLAR_QUOTE:
+                end = line.find(self._dollar_tag, pos)
+                if end < 0:
+                    parts.append(line[pos:])
+                    return
+                end += len(self._dollar_tag)
+                parts.append(line[pos:end])
+                pos = end
+                self._state = NORMAL
+            else:
+                if state == SINGLE_QUOTE and self.backslash_escapes:
+                    body = _BACKSLASH_QUOTE_BODY.match(line, pos)
+                else:
+                    body = _QUOTE_BODIES[state].match(line, pos)
+                end = body.end()
+                if end >= len(line):
+                    parts.append(line[pos:])
+                    return
+                # The body stops right before the closing quote.
+                parts.append(line[pos:end + 1])
+                pos = end + 1
+                self._state = NORMAL
+
+    def _check_compound(self, rest_of_line):
+        head = ''.join(self._parts) + rest_of_line
+        if not head.strip():
+            return
+        if not _CREATE.match(head):
+            self._compound = False
+        elif _COMPOUND_STATEMENT.match(head):
+            self._compound = True
+        elif len(head) > 200:
+            self._compound = False
+
+    def _track_block(self, word):
+        # Only BEGIN and CASE blocks are counted, so END IF, END LOOP and so
+        # on close nothing.
+        word = ' '.join(word.upper().split())
+        if word in ('BEGIN', 'CASE'):
+            self._depth += 1
+        elif word in ('END', 'END CASE'):
+            self._depth = max(self._depth - 1, 0)
+
+
+def split_sql_statements(chunks, delimiter=';', backslash_escapes=False):
+    """
+    Yields the statements of an SQL script given as an iterable of text chunks.
+
+    >>> list(split_sql_statements(['select 1; sel', 'ect 2']))
+    ['select 1', 'select 2']
+    >>> list(split_sql_statements(["insert into t values ('C:\\\\'); select 1;\\n"]))
+    ["insert into t values ('C:\\\\')", 'select 1']
+    >>> list(split_sql_statements(["insert into t values ('it\\\\'s; ok'); select 1;\\n"], backslash_escapes=True))
+    ["insert into t values ('it\\\\'s; ok')", 'select 1']
+    """
+    tokenizer = SqlTokenizer(delimiter, backslash_escapes)
+    for chunk in chunks:
+        for statement in tokenizer.feed(chunk):
+            yield statement
+    for statement in tokenizer.close():
+        yield statement
+
+
+def read_chunks(sql_file, chunk_size=CHUNK_SIZE):
+    """
+    Yields the content of an open file `chunk_size` characters at a time.
+    """
+    return iter(lambda: sql_file.read(chunk_size), '')
@@ -0,0 +1,102 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from collections import namedtuple, OrderedDict
+
+from SQLAlchemyLibrary.lazy_import import LazyModule
+
+sqlalchemy = LazyModule('sqlalchemy')
+
+CachedStatement = namedtuple('CachedStatement', ['statement', 'bind_names'])
+
+
+class StatementCache(object):
+    """
+    A bounded, least-recently-used cache of SQLAlchemy statements built from SQL text.
+
+    Each entry holds the statement (usually a `text()` construct) together with
+    the names of its bind parameters, so repeated SQL skips parsing altogether.
+    `compiled_cache` is meant to be passed as the `compiled_cache` execution
+    option, so SQLAlchemy also skips compiling the cached statements.
+
+    >>> cache = StatementCache(size=2)
+    >>> cache.text('SELECT :a, :b', 'sqlite').bind_names == frozenset(['a', 'b'])
+    True
+    >>> cache.text('SELECT :a, :b', 'sqlite') is cache.text('SELECT :a, :b', 'sqlite')
+    True
+    >>> cache.hits, cache.misses
+    (2, 1)
+    >>> _ = cache.text('SELECT 1', 'sqlite'), cache.text('SELECT 2', 'sqlite')
+    >>> len(cache)
+    2
+    """
+
+    def __init__(self, size=500):
+        self.size = int(size)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._compiled_cache = None
+
+    @property
+    def compiled_cache(self):
+        if self._compiled_cache is None:
+            self._compiled_cache = sqlalchemy.util.LRUCache(max(self.size, 1))
+        return self._compiled_cache
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, factory):
+        """
+        Returns the CachedStatement stored under `key`,
+        building it with `factory()` on a miss.
+        """
+        try:
+            entry = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            statement = factory()
+            entry = CachedStatement(statement, frozenset(_bind_names(statement)))
+            if self.size <= 0:
+                return entry
+            while len(self._entries) >= self.size:
+                self._entries.popitem(last=False)
+        else:
+            self.hits += 1
+        self._entries[key] = entry
+        return entry
+
+    def text(self, sql, dialect_name):
+        """
+        Returns the cached `text()` construct for `sql` on the given dialect.
+        """
+        return self.get(('text', sql, dialect_name), lambda: sqlalchemy.text(sql))
+
+    def clear(self):
+        self._entries.clear()
+        if self._compiled_cache is not None:
+            self._compiled_cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def statistics(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._entries), 'max_size': self.size}
+
+
+def _bind_names(statement):
+    if isinstance(statement, sqlalchemy.sql.elements.TextClause):
+        return statement._bindparams.keys()
+    return statement.compile().params.keys()
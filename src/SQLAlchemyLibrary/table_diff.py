@@ -0,0 +1,233 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from decimal import Decimal
+import zlib
+
+from SQLAlchemyLibrary.connection_manager import transaction
+from SQLAlchemyLibrary.dataset_compare import compare_sorted, normalize_value
+from SQLAlchemyLibrary.lazy_import import LazyModule
+
+postgresql = LazyModule('sqlalchemy.dialects.postgresql')
+sqlalchemy = LazyModule('sqlalchemy')
+
+_WEIGHT_MODULUS = 31
+_RELATIVE_TOLERANCE = 1e-9
+_SQLITE_HASH_FUNCTION = 'robot_crc32'
+
+
+def canonical_value(value):
+    """
+    Returns `value` in a form that compares equal across databases:
+    numbers by value, whatever their type, and everything else as text.
+
+    >>> canonical_value(Decimal('1.50')), canonical_value(1.5), canonical_value(2.0), canonical_value(True)
+    ('1.5', '1.5', '2', '1')
+    """
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (float, Decimal)):
+        if value == int(value):
+            return str(int(value))
+        return repr(float(value))
+    return normalize_value(value)
+
+
+def same_aggregates(first, second):
+    """
+    Compares two rows of aggregates, allowing for rounding in sums of
+    floating point numbers.
+
+    >>> same_aggregates((3, 1.0000000000001, None), (3, Decimal('1'), None))
+    True
+    >>> same_aggregates((3, 7), (3, 8))
+    False
+    """
+    for a, b in zip(first, second):
+        if a is None or b is None:
+            if a is not b:
+                return False
+        elif isinstance(a, (float, Decimal)) or isinstance(b, (float, Decimal)):
+            a, b = float(a), float(b)
+            if abs(a - b) > _RELATIVE_TOLERANCE * max(abs(a), abs(b), 1.0):
+                return False
+        elif a != b:
+            return False
+    return True
+
+
+def _crc32(text):
+    if text is None:
+        return None
+    return zlib.crc32(text.encode('utf-8')) & 0xffffffff
+
+
+def _register_sqlite_hash(connection):
+    dbapi_connection = connection.connection.connection
+    dbapi_connection.create_function(_SQLITE_HASH_FUNCTION, 1, _crc32)
+
+
+class TableSide(object):
+    """
+    One of the two tables being compared: a connection, a table built from
+    its reflected columns and the integer key column that ranges are taken on.
+    """
+
+    def __init__(self, connection, table_name, schema_name, columns, key_name, column_names):
+        self.connection = connection
+        self.dialect = connection.dialect.name
+        self.table = sqlalchemy.Table(
+            table_name, sqlalchemy.MetaData(),
+            *[sqlalchemy.Column(column['name'], column['type']) for column in columns],
+            schema=schema_name)
+        self.key = self.table.c[key_name]
+        self.columns = [self.table.c[name] for name in column_names]
+        self.queries = 0
+        self.fetched_rows = 0
+
+    def key_bounds(self):
+        statement = sqlalchemy.select([sqlalchemy.func.min(self.key), sqlalchemy.func.max(self.key)])
+        return self._fetch(statement, 'first')
+
+    def checksum_statement(self, strong):
+        """
+        Returns the statement computing the aggregate checksum of the rows
+        whose key is between the `lo` and `hi` bind parameters.
+
+        Every side computes counts, the sum of the key and, per column, the
+        number of non-NULL values and position-weighted sums of numbers or of
+        text lengths, which any database can compute the same way. When
+        `strong` (both sides are the same kind of database), a sum of CRC32
+        hashes of the whole rows is added.
+        """
+        weight = self.key % _WEIGHT_MODULUS + 1
+        aggregates = [sqlalchemy.func.count(), sqlalchemy.func.sum(self.key)]
+        for column in self.columns:
+            aggregates.append(sqlalchemy.func.count(column))
+            if isinstance(column.type, (sqlalchemy.Integer, sqlalchemy.Numeric)):
+                value = column
+            elif isinstance(column.type, sqlalchemy.String):
+                value = self._length(column)
+            else:
+                continue
+            aggregates.append(sqlalchemy.func.sum(value))
+            aggregates.append(sqlalchemy.func.sum(value * weight))
+        if strong:
+            aggregates.append(sqlalchemy.func.sum(self._row_hash()))
+        return sqlalchemy.select(aggregates).where(self._in_range())
+
+    def rows_statement(self):
+        return sqlalchemy.select([self.key] + self.columns).where(self._in_range()).order_by(self.key)
+
+    def checksum(self, statement, lo, hi):
+        return tuple(self._fetch(statement, 'first', lo=lo, hi=hi))
+
+    def rows(self, statement, lo, hi):
+        rows = self._fetch(statement, 'fetchall', lo=lo, hi=hi)
+        self.fetched_rows += len(rows)
+        return [tuple(canonical_value(value) for value in row) for row in rows]
+
+    def _in_range(self):
+        return self.key.between(sqlalchemy.bindparam('lo'), sqlalchemy.bindparam('hi'))
+
+    def _length(self, column):
+        if self.dialect == 'mysql':
+            return sqlalchemy.func.char_length(column)
+        return sqlalchemy.func.length(column)
+
+    def _row_hash(self):
+        text = None
+        for column in [self.key] + self.columns:
+            value = sqlalchemy.func.coalesce(sqlalchemy.cast(column, sqlalchemy.String), '\\N')
+            text = value if text is None else text.concat('|').concat(value)
+        if self.dialect == 'postgresql':
+            return sqlalchemy.cast(
+                sqlalchemy.cast(sqlalchemy.literal_column("'x'").concat(
+                    sqlalchemy.func.substr(sqlalchemy.func.md5(text), 1, 8)), postgresql.BIT(32)),
+                sqlalchemy.Integer)
+        if self.dialect == 'mysql':
+            return sqlalchemy.func.crc32(text)
+        _register_sqlite_hash(self.connection)
+        return getattr(sqlalchemy.func, _SQLITE_HASH_FUNCTION)(text)
+
+    def _fetch(self, statement, method, **params):
+        self.queries += 1
+        with transaction(self.connection):
+            return getattr(self.connection.execute(statement, **params), method)()
+
+
+def strong_hash_supported(first, second):
+    """
+    Tells whether both sides can compute the same row hash in the database.
+    """
+    return first.dialect == second.dialect and first.dialect in ('postgresql', 'mysql', 'sqlite')
+
+
+def diff_tables(first, second, diff, segments=16, leaf_rows=1000):
+    """
+    Compares the tables of two TableSide objects, adding the differing rows
+    to the DatasetDiff `diff` (`first` being the actual and `second` the
+    expected side).
+
+    The key range covered by both tables is cut into `segments` ranges.
+    Each range whose checksums differ is halved again and again, until it
+    holds at most `leaf_rows` rows (on the larger side), whose rows are
+    then fetched from both sides and compared. Returns the number of ranges
+    whose checksums were computed.
+    """
+    bounds = [bound for bound in tuple(first.key_bounds()) + tuple(second.key_bounds()) if bound is not None]
+    if not bounds:
+        diff.actual_rows = diff.expected_rows = 0
+        return 0
+    for bound in bounds:
+        if isinstance(bound, (bool, str, bytes)) or not _is_integral(bound):
+            raise ValueError("Tables can only be compared on an integer key, got {0!r}".format(bound))
+    lo, hi = int(min(bounds)), int(max(bounds))
+    strong = strong_hash_supported(first, second)
+    checksums = [first.checksum_statement(strong), second.checksum_statement(strong)]
+    rows = [first.rows_statement(), second.rows_statement()]
+    step = max(-(-(hi - lo + 1) // max(int(segments), 1)), 1)
+    actual_rows = expected_rows = 0
+    ranges = [(start, min(start + step - 1, hi), True) for start in range(lo, hi + 1, step)]
+    ranges.reverse()
+    compared = 0
+    while ranges:
+        lo, hi, top_level = ranges.pop()
+        compared += 1
+        first_checksum = first.checksum(checksums[0], lo, hi)
+        second_checksum = second.checksum(checksums[1], lo, hi)
+        if top_level:
+            actual_rows += first_checksum[0]
+            expected_rows += second_checksum[0]
+        if same_aggregates(first_checksum, second_checksum):
+            continue
+        if max(first_checksum[0], second_checksum[0]) <= leaf_rows or lo == hi:
+            compare_sorted(first.rows(rows[0], lo, hi), second.rows(rows[1], lo, hi), _key_of, diff)
+            continue
+        middle = (lo + hi) // 2
+        ranges.append((middle + 1, hi, False))
+        ranges.append((lo, middle, False))
+    diff.actual_rows, diff.expected_rows = actual_rows, expected_rows
+    return compared
+
+
+def _is_integral(value):
+    try:
+        return value == int(value)
+    except (TypeError, ValueError):
+        return False
+
+
+def _key_of(row):
+    return row[:1]
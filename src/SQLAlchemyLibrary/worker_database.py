@@ -0,0 +1,204 @@
+#  Copyright (c) 2010 Franz Allan Valencia See
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import copy
+import os
+import re
+
+from SQLAlchemyLibrary.lazy_import import LazyModule
+from SQLAlchemyLibrary.snapshot import autocommit_engine, run_autocommit
+
+robot_builtin = LazyModule('robot.libraries.BuiltIn')
+sqlalchemy = LazyModule('sqlalchemy')
+sqlite3 = LazyModule('sqlite3')
+
+POOL_ID = 'PABOTEXECUTIONPOOLID'
+WORKER_MODES = ('schema', 'database')
+_POOL_ID_VALUE = re.compile(r'^\d+$')
+
+
+def pabot_worker():
+    """
+    Returns the execution pool id that pabot gives the process running the
+    tests, from the `${PABOTEXECUTIONPOOLID}` variable or the environment
+    variable of the same name, or None when the tests are not run by pabot.
+    """
+    try:
+        value = robot_builtin.BuiltIn().get_variable_value('${' + POOL_ID + '}')
+    except robot_builtin.RobotNotRunningError:
+        value = None
+    if value is None:
+        value = os.environ.get(POOL_ID)
+    if value is None or value == '':
+        return None
+    if not _POOL_ID_VALUE.match(str(value)):
+        raise ValueError("{0} must be a number, got '{1}'".format(POOL_ID, value))
+    return str(value)
+
+
+def worker_name(template, worker):
+    """
+    >>> worker_name('app', '3')
+    'app_worker_3'
+    """
+    return '{0}_worker_{1}'.format(template, worker)
+
+
+def _with_database(url, database):
+    url = copy.copy(url)
+    url.database = database
+    return url
+
+
+def _copy_tables(url, source, target, statements):
+    """
+    Copies every table of the schema `source` into the schema `target`
+    with `statements`, formatted with the quoted schemas and table.
+    """
+    engine = autocommit_engine(url, url.database)
+    preparer = engine.dialect.identifier_preparer
+    try:
+        tables = sqlalchemy.inspect(engine).get_table_names(schema=source)
+        with engine.connect() as connection:
+            for table in tables:
+                for statement in statements.split('; '):
+                    connection.execute(statement.format(
+                        preparer.quote(source), preparer.quote(target), preparer.quote(table)))
+    finally:
+        engine.dispose()
+
+
+class SqliteWorkerDatabase(object):
+    """
+    A copy of an SQLite database file, `<name>_worker_<id>.db` next to it,
+    taken with the online backup API.
+    """
+
+    def __init__(self, url, template, worker):
+        self._template = template or url.database
+        root, extension = os.path.splitext(url.database)
+        self.name = '{0}_worker_{1}{2}'.format(root, worker, extension)
+        self.url = _with_database(url, self.name)
+        self.search_path = None
+
+    def create(self):
+        self.drop()
+        if not os.path.exists(self._template):
+            return
+        source = sqlite3.connect(self._template)
+        target = sqlite3.connect(self.name)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+    def drop(self):
+        if os.path.exists(self.name):
+            os.remove(self.name)
+
+
+class PostgresWorkerDatabase(object):
+    """
+    A copy of a PostgreSQL database made with `CREATE DATABASE ... TEMPLATE`.
+    """
+
+    def __init__(self, url, template, worker):
+        self._url = url
+        self._template = template or url.database
+        self.name = worker_name(self._template, worker)
+        self.url = _with_database(url, self.name)
+        self.search_path = None
+
+    def create(self):
+        run_autocommit(self._url, 'postgres',
+                       'DROP DATABASE IF EXISTS {0}; CREATE DATABASE {0} TEMPLATE {1}', self.name, self._template)
+
+    def drop(self):
+        run_autocommit(self._url, 'postgres', 'DROP DATABASE IF EXISTS {0}', self.name)
+
+
+class PostgresWorkerSchema(object):
+    """
+    A copy of the tables of a PostgreSQL schema in a schema of their own,
+    which unqualified names are looked up in first.
+    """
+
+    def __init__(self, url, template, worker):
+        self.url = url
+        self._template = template or 'public'
+        self.name = worker_name(self._template, worker)
+        # Objects that are not copied, such as views and functions, are
+        # still found in the template schema.
+        self.search_path = (self.name, self._template)
+
+    def create(self):
+        run_autocommit(self.url, self.url.database,
+                       'DROP SCHEMA IF EXISTS {0} CASCADE; CREATE SCHEMA {0}', self.name)
+        _copy_tables(self.url, self._template, self.name,
+                     'CREATE TABLE {1}.{2} (LIKE {0}.{2} INCLUDING ALL); INSERT INTO {1}.{2} SELECT * FROM {0}.{2}')
+
+    def drop(self):
+        run_autocommit(self.url, self.url.database, 'DROP SCHEMA IF EXISTS {0} CASCADE', self.name)
+
+
+class MysqlWorkerDatabase(object):
+    """
+    A copy of the tables of a MySQL database (which is what MySQL calls a
+    schema) in a database of their own.
+    """
+
+    def __init__(self, url, template, worker):
+        self._url = url
+        self._template = template or url.database
+        self.name = worker_name(self._template, worker)
+        self.url = _with_database(url, self.name)
+        self.search_path = None
+
+    def create(self):
+        run_autocommit(self._url, self._url.database,
+                       'DROP DATABASE IF EXISTS {0}; CREATE DATABASE {0}', self.name)
+        _copy_tables(self._url, self._template, self.name,
+                     'CREATE TABLE {1}.{2} LIKE {0}.{2}; INSERT INTO {1}.{2} SELECT * FROM {0}.{2}')
+
+    def drop(self):
+        run_autocommit(self._url, self._url.database, 'DROP DATABASE IF EXISTS {0}', self.name)
+
+
+_WORKER_DATABASES = {
+    ('sqlite', 'schema'): SqliteWorkerDatabase,
+    ('sqlite', 'database'): SqliteWorkerDatabase,
+    ('postgresql', 'schema'): PostgresWorkerSchema,
+    ('postgresql', 'database'): PostgresWorkerDatabase,
+    ('mysql', 'schema'): MysqlWorkerDatabase,
+    ('mysql', 'database'): MysqlWorkerDatabase,
+}
+
+
+def worker_database(url, mode, template, worker):
+    """
+    Returns the (not yet created) database or schema of the pabot `worker`
+    copied from `template` for connections to `url`, or None when `url`
+    needs none, as in-memory SQLite databases are private to each process.
+    """
+    url = sqlalchemy.engine.url.make_url(url)
+    dialect = url.get_backend_name()
+    if dialect == 'sqlite' and url.database in (None, '', ':memory:'):
+        return None
+    try:
+        database_class = _WORKER_DATABASES[(dialect, mode)]
+    except KeyError:
+        raise ValueError("Databases per pabot worker are not supported on {0}, only on: {1}".format(
+            dialect, ", ".join(sorted(set(name for name, _ in _WORKER_DATABASES)))))
+    return database_class(url, template, worker)
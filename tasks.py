@@ -29,3 +29,9 @@ def clean(ctx):
     ctx.run("rm -rf build dist")
 
 
+@task
+def bench(ctx, sizes="1000,10000,100000", output=None):
+    command = "python benchmarks/keywords.py --sizes {}".format(sizes)
+    if output:
+        command += " --output {}".format(output)
+    ctx.run(command)